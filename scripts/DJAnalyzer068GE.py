@@ -1,68 +1,31 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
+import sys
 import threading
 import queue
+from functools import partial
 # import time # Non sembra usato attivamente, commentato per ora
-import librosa
-import numpy as np
 import pandas as pd
-import traceback
-from dataclasses import dataclass, fields # Aggiunto fields per il salvataggio CSV
-from typing import List, Tuple, Dict, Optional
+from dataclasses import fields # Aggiunto fields per il salvataggio CSV
+from typing import List, Optional
+
+# Il nucleo di analisi condiviso vive in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from track_analysis import (AnalysisResult, CAMELOT_COLORS, ENERGY_COLORS, KEY_MODES, DEFAULT_KEY_MODE,
+                            analyze_track, analyzer_version)
+from features import ANALYSIS_PROFILES, DEFAULT_PROFILE
+from batch_engine import BatchEngine, default_workers
+from library_store import LibraryStore, DEFAULT_DB_NAME
+from scanner import scan, SCAN_WORKERS
+from vdj_import import import_vdj_database
+from spectral_quality import QUALITY_FAKE
 
 # =============================================
 # Configurazioni e strutture dati
 # =============================================
 
-@dataclass
-class AnalysisResult:
-    filename: str
-    bpm: int
-    key: str
-    camelot_code: str
-    compatible_keys: str
-    energy: int
-    # Questi campi sono per la visualizzazione, potrebbero essere rimossi dal salvataggio CSV
-    # se non si vogliono colonne extra lì. Li lascio per ora nella dataclass.
-    _camelot_color_tag: str # Rinominato per chiarezza che è un tag
-    _energy_color_tag: str  # Rinominato per chiarezza che è un tag
-
-# Mappature costanti
-CAMELOT_MAP = {
-    'C': '8B', 'C#': '3B', 'D': '10B', 'D#': '5B', 'E': '12B', 'F': '7B',
-    'F#': '2B', 'G': '9B', 'G#': '4B', 'A': '11B', 'A#': '6B', 'B': '1B',
-    'Cm': '5A', 'C#m': '12A', 'Dm': '7A', 'D#m': '2A', 'Em': '9A', 'Fm': '4A',
-    'F#m': '11A', 'Gm': '6A', 'G#m': '1A', 'Am': '8A', 'A#m': '3A', 'Bm': '10A'
-}
-
-CAMELOT_COLORS = { # Usato per i tag colore della Treeview
-    '1A': 'medium orchid', '1B': 'sky blue', '2A': 'magenta', '2B': 'deep sky blue',
-    '3A': 'dodger blue', '3B': 'green yellow', '4A': 'royal blue', '4B': 'chartreuse',
-    '5A': 'spring green', '5B': 'yellow green', '6A': 'lawn green', '6B': 'dark sea green',
-    '7A': 'gold', '7B': 'yellow', '8A': 'orange', '8B': 'light coral',
-    '9A': 'dark orange', '9B': 'indian red', '10A': 'tomato', '10B': 'medium violet red',
-    '11A': 'red', '11B': 'purple', '12A': 'dark violet', '12B': 'blue violet',
-    'N/A': 'white' # Sfondo di default per la treeview
-}
-
-ENERGY_COLORS = { # Usato per i tag colore della Treeview (per la colonna Energia)
-    1: "PaleTurquoise1", 2: "PaleTurquoise2", 3: "PaleGreen1", 4: "PaleGreen2",
-    5: "SpringGreen2", 6: "SpringGreen3", 7: "yellow1", 8: "gold1",
-    9: "dark orange", 10: "red1",
-    # Aggiungiamo un colore di fallback se il valore non è in mappa
-    "default": "grey"
-}
-
-# Profili tonali per l'algoritmo avanzato di stima della chiave
-MAJOR_PROFILE_ADV = np.array([5.0, 2.0, 3.5, 2.1, 4.5, 4.0, 2.3, 4.9, 2.4, 3.7, 2.2, 3.0])
-MINOR_PROFILE_ADV = np.array([5.0, 2.7, 3.5, 5.4, 2.5, 3.5, 2.5, 4.8, 4.0, 2.7, 3.3, 3.2])
-# Normalizzare i profili può migliorare la stabilità della correlazione
-# MAJOR_PROFILE_ADV = MAJOR_PROFILE_ADV / np.sum(MAJOR_PROFILE_ADV)
-# MINOR_PROFILE_ADV = MINOR_PROFILE_ADV / np.sum(MINOR_PROFILE_ADV)
-
-NOTES_MAJOR_STD = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-NOTES_MINOR_STD = ['Cm', 'C#m', 'Dm', 'D#m', 'Em', 'Fm', 'F#m', 'Gm', 'G#m', 'Am', 'A#m', 'Bm']
+# AnalysisResult, mappe Camelot/colori e algoritmi di analisi sono in src/track_analysis.py
 
 
 # =============================================
@@ -96,10 +59,14 @@ class DJAnalyzerApp:
         self.analysis_paused_event = threading.Event() # Usiamo un Event per la pausa
         self.analysis_paused_event.set() # Inizia non in pausa (evento settato)
         self.stop_requested = False
+        self.worker_count = tk.IntVar(value=default_workers()) # Processi paralleli di analisi
+        self.incremental = tk.BooleanVar(value=True) # Rianalizza solo file nuovi/modificati
+        self.recursive = tk.BooleanVar(value=False) # Include le sottocartelle
+        self.analysis_profile = tk.StringVar(value=DEFAULT_PROFILE) # fast / standard / precise
+        self.key_mode = tk.StringVar(value=DEFAULT_KEY_MODE) # fast / precise (HPSS)
 
-        # Profili tonali come attributi di istanza (se vuoi renderli modificabili o centralizzati)
-        # Altrimenti, possono essere costanti globali come definite sopra.
-        # Per ora uso le costanti globali MAJOR_PROFILE_ADV, MINOR_PROFILE_ADV.
+        # I profili tonali sono costanti globali in src/track_analysis.py
+        # (MAJOR_PROFILE_ADV, MINOR_PROFILE_ADV, definite in src/key_detection.py), condivise con i processi di analisi.
 
     def _setup_gui(self):
         """Configura tutti i componenti dell'interfaccia grafica"""
@@ -114,6 +81,10 @@ class DJAnalyzerApp:
         self.select_output_button = ttk.Button(folder_frame, text="Cartella Output", command=self._select_output_folder)
         self.select_output_button.grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
         ttk.Entry(folder_frame, textvariable=self.output_folder, width=70).grid(row=1, column=1, padx=5, pady=5, sticky=tk.EW)
+        self.import_vdj_button = ttk.Button(folder_frame, text="Importa VirtualDJ", command=self._import_vdj_database)
+        self.import_vdj_button.grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
+        ttk.Label(folder_frame, text="BPM e chiave già analizzati da VirtualDJ (database.xml) come stima iniziale"
+                  ).grid(row=2, column=1, padx=5, pady=5, sticky=tk.W)
         folder_frame.columnconfigure(1, weight=1) # Fa espandere l'entry
 
         # --- Frame per Controlli Analisi ---
@@ -128,14 +99,38 @@ class DJAnalyzerApp:
         self.pause_btn.pack(side=tk.LEFT, padx=5, pady=5)
         self.stop_btn.pack(side=tk.LEFT, padx=5, pady=5)
 
+        ttk.Label(control_frame, text="Processi:").pack(side=tk.LEFT, padx=(15, 2), pady=5)
+        self.workers_spin = ttk.Spinbox(control_frame, from_=1, to=max(64, default_workers()),
+                                        textvariable=self.worker_count, width=4)
+        self.workers_spin.pack(side=tk.LEFT, padx=2, pady=5)
+
+        self.incremental_check = ttk.Checkbutton(control_frame, text="Solo nuovi/modificati",
+                                                 variable=self.incremental)
+        self.incremental_check.pack(side=tk.LEFT, padx=(15, 2), pady=5)
+
+        self.recursive_check = ttk.Checkbutton(control_frame, text="Sottocartelle",
+                                               variable=self.recursive)
+        self.recursive_check.pack(side=tk.LEFT, padx=2, pady=5)
+
+        ttk.Label(control_frame, text="Profilo:").pack(side=tk.LEFT, padx=(15, 2), pady=5)
+        self.profile_combo = ttk.Combobox(control_frame, textvariable=self.analysis_profile,
+                                          values=list(ANALYSIS_PROFILES), state="readonly", width=9)
+        self.profile_combo.pack(side=tk.LEFT, padx=2, pady=5)
+
+        ttk.Label(control_frame, text="Chiave:").pack(side=tk.LEFT, padx=(15, 2), pady=5)
+        self.key_mode_combo = ttk.Combobox(control_frame, textvariable=self.key_mode,
+                                           values=list(KEY_MODES), state="readonly", width=8)
+        self.key_mode_combo.pack(side=tk.LEFT, padx=2, pady=5)
+
         # --- Tabella dei Risultati ---
         table_frame = ttk.Frame(self.master)
         table_frame.pack(padx=10, pady=10, fill="both", expand=True, side=tk.TOP)
 
-        columns = ("File", "BPM", "Key", "Camelot", "Compatibili", "Energia")
+        columns = ("File", "BPM", "Key", "Camelot", "Compatibili", "Energia", "Banda", "Qualità")
         self.results_tree = ttk.Treeview(table_frame, columns=columns, show="headings", selectmode="browse")
         
-        col_widths = {"File": 350, "BPM": 60, "Key": 70, "Camelot": 80, "Compatibili": 200, "Energia": 70}
+        col_widths = {"File": 350, "BPM": 60, "Key": 70, "Camelot": 80, "Compatibili": 200, "Energia": 70,
+                      "Banda": 70, "Qualità": 80}
         for col_name in columns:
             self.results_tree.heading(col_name, text=col_name)
             self.results_tree.column(col_name, width=col_widths[col_name], 
@@ -170,6 +165,8 @@ class DJAnalyzerApp:
                 self.results_tree.tag_configure(tag_name, background=color_name)
             except tk.TclError:
                  print(f"Attenzione: Colore Energia '{color_name}' non valido per tag Treeview.")
+        # Brani con una banda più stretta di quella dichiarata (testo rosso, come la saturazione)
+        self.results_tree.tag_configure(QUALITY_FAKE, foreground="red")
         # Tag per testo (se necessario, es. testo bianco su sfondi scuri)
         # self.results_tree.tag_configure("white_text", foreground="white")
 
@@ -183,249 +180,93 @@ class DJAnalyzerApp:
             return
 
         self._prepare_for_analysis_ui_state()
-        
-        # Ottieni la lista dei file PRIMA di avviare il thread
-        try:
-            audio_files = self._get_audio_files()
-            if not audio_files:
-                messagebox.showinfo("Info", "Nessun file audio supportato trovato nella cartella selezionata.")
-                self._cleanup_after_analysis_ui_state() # Ripristina UI se non ci sono file
-                return
-        except Exception as e:
-            messagebox.showerror("Errore Lettura Cartella", f"Errore durante la lettura dei file: {str(e)}")
-            self._cleanup_after_analysis_ui_state()
-            return
-            
-        self.analysis_thread = threading.Thread(target=self._analysis_worker, args=(audio_files,), daemon=True)
-        self.analysis_thread.start()
-        self.master.after(100, self._process_results_queue) # Rinominato per chiarezza
-
-    def _analysis_worker(self, files_to_analyze: List[str]):
-        """Thread worker per l'analisi dei file"""
-        self._update_status("Avvio analisi in background...")
-        total_files = len(files_to_analyze)
-        try:
-            for idx, file_path in enumerate(files_to_analyze, 1):
-                self.analysis_paused_event.wait() # Il thread si blocca qui se l'evento non è settato (pausa)
-                if self.stop_requested:
-                    self._update_status("Analisi interrotta dall'utente.")
-                    break
-                
-                self._process_single_file(file_path, idx, total_files)
-        except Exception as e:
-            # Log errore nel thread worker
-            print(f"Errore grave nel thread worker: {str(e)}")
-            traceback.print_exc()
-            self.results_queue.put(("error", f"Errore critico nel thread: {str(e)}"))
-        finally:
-            # Assicura che il completamento venga segnalato
-            self.results_queue.put(("analysis_complete", None))
-            print("DEBUG WORKER: Segnale 'analysis_complete' inviato alla coda.")
-
-
-    def _process_single_file(self, file_path: str, current_idx: int, total_files: int):
-        """Elabora un singolo file audio e mette il risultato in coda."""
-        filename = os.path.basename(file_path)
-        self.results_queue.put(("status_update", f"Analisi ({current_idx}/{total_files}): {filename}"))
-        
-        try:
-            # Caricamento audio (una sola volta per tutte le analisi su questo file)
-            # Aumentata durata per migliore analisi chiave, ma può rallentare. Tarare se necessario.
-            y, sr = librosa.load(file_path, sr=None, mono=True, duration=90) 
-            
-            bpm = self._calculate_bpm(y, sr)
-            key_traditional, camelot_code = self._detect_key(y, sr) # NUOVO METODO
-            compatible_keys_list = self._find_compatible_keys(camelot_code)
-            energy_scaled = self._calculate_energy(y, sr) # NUOVO METODO
-            
-            camelot_color_tag = CAMELOT_COLORS.get(camelot_code, CAMELOT_COLORS['N/A'])
-            # Per l'energia, costruiamo il nome del tag per coerenza con _configure_treeview_tags
-            energy_color_name = ENERGY_COLORS.get(energy_scaled, ENERGY_COLORS['default'])
-            energy_color_tag_name = f"energy_{energy_color_name}"
-
-            result = AnalysisResult(
-                filename=filename,
-                bpm=bpm,
-                key=key_traditional,
-                camelot_code=camelot_code,
-                compatible_keys=", ".join(compatible_keys_list),
-                energy=energy_scaled,
-                _camelot_color_tag=camelot_color_tag,
-                _energy_color_tag=energy_color_tag_name 
-            )
-            self.results_queue.put(("new_data", result))
-            
-        except Exception as e:
-            error_msg = f"Errore durante l'analisi di {filename}: {str(e)}"
-            print(f"ECCEZIONE in _process_single_file per {filename}:")
-            traceback.print_exc()
-            self.results_queue.put(("error", error_msg))
 
-    # =============================================
-    # Metodi di analisi audio (COMPLETATI)
-    # =============================================
+        # La cartella viene scandita nel thread worker, a flusso: l'analisi parte
+        # con i primi file trovati anche su librerie molto grandi.
+        input_dir = self.input_folder.get()
+        recursive = self.recursive.get()
 
-    def _calculate_bpm(self, y: np.ndarray, sr: int) -> int:
-        """Calcola il BPM di un segnale audio"""
+        # Letto qui: le variabili Tk non vanno toccate dal thread worker
         try:
-            # Usare aggregate=np.median è più robusto per BPM
-            tempo_values = librosa.beat.tempo(y=y, sr=sr, aggregate=None)
-            if tempo_values.size > 0:
-                return int(round(np.median(tempo_values)))
-            return 0 # Fallback se non trova tempi
-        except Exception as e:
-            print(f"Errore calcolo BPM: {str(e)}")
-            return 0
+            workers = max(1, int(self.worker_count.get()))
+        except (tk.TclError, ValueError):
+            workers = default_workers()
+            self.worker_count.set(workers)
+        db_path = os.path.join(self.output_folder.get(), DEFAULT_DB_NAME)
+        incremental = self.incremental.get()
+        profile = self.analysis_profile.get()
+        key_mode = self.key_mode.get()
+
+        self.analysis_thread = threading.Thread(target=self._analysis_worker,
+                                                args=(input_dir, recursive, workers, db_path, incremental,
+                                                      profile, key_mode),
+                                                daemon=True)
+        self.analysis_thread.start()
+        self.master.after(100, self._process_results_queue) # Rinominato per chiarezza
 
-    def _detect_bass_note_chroma_idx(self, y: np.ndarray, sr: int) -> Optional[int]:
-        """Helper per rilevare la nota di basso predominante (indice cromatico 0-11)."""
+    def _analysis_worker(self, input_dir: str, recursive: bool, workers: int, db_path: str, incremental: bool,
+                         profile: str, key_mode: str):
+        """Thread di coordinamento: l'analisi vera gira nei processi del BatchEngine."""
+        self.results_queue.put(("status_update", "Avvio analisi in background..."))
+        store = None
         try:
-            # CQT focalizzato sulle basse frequenze (es. 3 ottave da C1)
-            cqt = np.abs(librosa.cqt(y, sr=sr, fmin=librosa.note_to_hz('C1'), 
-                                   n_bins=36, bins_per_octave=12)) # 12 bin per ottava
-            bass_chroma_energy = np.zeros(12)
-            for i in range(12):
-                # Somma l'energia per ciascuna delle 12 classi cromatiche attraverso le ottave analizzate
-                bass_chroma_energy[i] = np.sum(cqt[i : cqt.shape[0] : 12, :])
-            
-            bass_note_idx = np.argmax(bass_chroma_energy)
-            # print(f"DEBUG BASS: Nota di basso rilevata (indice): {bass_note_idx} ({NOTES_MAJOR_STD[bass_note_idx]})")
-            return bass_note_idx
+            # L'archivio SQLite va aperto in questo thread (connessione per thread)
+            store = LibraryStore(db_path, version=analyzer_version(profile, key_mode))
         except Exception as e:
-            print(f"Errore nel rilevamento nota di basso: {str(e)}")
-            # traceback.print_exc() # Decommenta per debug più dettagliato
-            return None # Restituisce None se fallisce, così la logica chiamante può gestirlo
-
-    def _detect_key(self, y: np.ndarray, sr: int) -> Tuple[str, str]:
-        """Rileva la tonalità musicale usando un algoritmo avanzato."""
+            print(f"Archivio libreria non disponibile: {str(e)}")
+            store = None
+
+        # Stat letti dallo scanner, riusati dall'archivio al salvataggio del risultato
+        scanned_stats = {}
+        # Dati VirtualDJ importati: il loro BPM centra la ricerca del tempo
+        use_vdj = store is not None and store.has_vdj_scans()
+
+        def files_to_analyze():
+            """Scansione a flusso; con l'archivio salta i brani già analizzati."""
+            found = cached = 0
+            for entry in scan(input_dir, recursive=recursive, workers=SCAN_WORKERS):
+                if self.stop_requested:
+                    return
+                found += 1
+                if incremental and store is not None:
+                    result = store.lookup_entry(entry)
+                    if result is not None:
+                        cached += 1
+                        self.results_queue.put(("new_data", result))
+                        continue
+                scanned_stats[entry.path] = entry.stat
+                prior = store.vdj_scan(entry.path) if use_vdj else None
+                yield (entry.path, {"prior": prior}) if prior is not None else entry.path
+            if found == 0:
+                self.results_queue.put(("error", "Nessun file audio supportato trovato nella cartella selezionata."))
+            else:
+                self.results_queue.put(("status_update",
+                                        f"Scansione completata: {found} brani, in archivio: {cached}"))
+
+        engine = BatchEngine(workers=workers,
+                             task=partial(analyze_track, profile=profile, key_mode=key_mode))
+        # Pausa: il motore non avvia nuovi file finché l'evento non è di nuovo settato.
+        # Stop: i file in attesa vengono annullati e arriva comunque 'analysis_complete'.
+        engine.run(files_to_analyze(), self.results_queue,
+                   paused_event=self.analysis_paused_event,
+                   should_stop=lambda: self.stop_requested,
+                   on_result=(lambda result: self._store_result(
+                       store, result, scanned_stats.pop(result._file_path, None))) if store else None)
+        if store is not None:
+            store.close()
+        print("DEBUG WORKER: Segnale 'analysis_complete' inviato alla coda.")
+
+    def _store_result(self, store: LibraryStore, result: AnalysisResult, st=None):
+        """Salva nell'archivio un risultato appena calcolato (chiamato dal thread worker)."""
         try:
-            # 1. Separazione componente armonica
-            y_harmonic = librosa.effects.harmonic(y, margin=8)
-            
-            # 2. Chromagramma avanzato (CENS è robusto, ma CQT con tuning può essere preciso)
-            # Proviamo CENS come nelle bozze precedenti
-            chroma_features = librosa.feature.chroma_cens(y=y_harmonic, sr=sr, bins_per_octave=12, n_chroma=12)
-            chroma_avg_profile = np.mean(chroma_features, axis=1)
-
-            # Normalizza il profilo cromatico del brano (opzionale, ma può aiutare)
-            # if np.sum(chroma_avg_profile) > 0:
-            #    chroma_avg_profile = chroma_avg_profile / np.sum(chroma_avg_profile)
-            
-            # 3. Profili tonali (globali o self. se li hai messi in __init__)
-            # Assicurati che MAJOR_PROFILE_ADV e MINOR_PROFILE_ADV siano definiti
-            
-            # 4. Correlazione
-            scores = [] # Lista di dizionari per tracciare meglio
-            for i in range(12): # Per ogni possibile tonica (C=0, C#=1, ..., B=11)
-                # Per la tonalità maggiore con tonica 'i':
-                # Ruotiamo il profilo cromatico del brano per allineare la sua 'i'-esima nota con la 'C' del profilo di C Maggiore
-                # Oppure, equivalentemente, ruotiamo il profilo di C Maggiore per allinearlo con la tonica 'i'
-                shifted_major_template = np.roll(MAJOR_PROFILE_ADV, i)
-                major_corr = np.corrcoef(chroma_avg_profile, shifted_major_template)[0, 1]
-                
-                shifted_minor_template = np.roll(MINOR_PROFILE_ADV, i)
-                minor_corr = np.corrcoef(chroma_avg_profile, shifted_minor_template)[0, 1]
-                
-                scores.append({'tonic_pitch_class': i, 'type': 'major', 'score': major_corr if not np.isnan(major_corr) else -1})
-                scores.append({'tonic_pitch_class': i, 'type': 'minor', 'score': minor_corr if not np.isnan(minor_corr) else -1})
-            
-            # 5. Rilevamento nota di basso
-            bass_note_idx = self._detect_bass_note_chroma_idx(y, sr) # y originale per il basso
-            
-            # 6. Applica peso del basso ai punteggi
-            if bass_note_idx is not None:
-                bass_weight = 0.3 # Valore empirico, da tarare
-                for score_info in scores:
-                    # Se la tonica della tonalità candidata (maggiore o minore) corrisponde alla nota di basso
-                    if score_info['tonic_pitch_class'] == bass_note_idx:
-                        score_info['score'] += bass_weight
-            
-            # 7. Trova la migliore tonalità
-            if not scores: return "N/A", "N/A" # Se scores è vuoto per qualche motivo
-
-            best_score_info = max(scores, key=lambda x: x['score'])
-            
-            best_tonic_idx = best_score_info['tonic_pitch_class']
-            best_type = best_score_info['type']
-
-            traditional_key_name: str
-            if best_type == 'major':
-                traditional_key_name = NOTES_MAJOR_STD[best_tonic_idx]
-            else: # minor
-                traditional_key_name = NOTES_MINOR_STD[best_tonic_idx]
-                
-            camelot_code = CAMELOT_MAP.get(traditional_key_name, "N/A")
-            
-            # print(f"DEBUG KEY: File: {os.path.basename(y[:10]) if hasattr(y, 'name') else 'buffer'}, Trad: {traditional_key_name}, Camelot: {camelot_code}, Score: {best_score_info['score']:.3f}")
-            return traditional_key_name, camelot_code
-            
+            store.save(result, st=st)
         except Exception as e:
-            print(f"Errore dettagliato in _detect_key: {str(e)}")
-            traceback.print_exc()
-            return "N/A", "N/A"
-
-    def _find_compatible_keys(self, camelot_code: str) -> List[str]:
-        if not camelot_code or camelot_code == "N/A":
-            return []
-        try:
-            num = int(camelot_code[:-1])
-            mode = camelot_code[-1].upper()
-        except ValueError:
-            return [] # Formato Camelot non valido
-
-        compatible = [camelot_code]
-        compatible.append(f"{ (num - 2 + 12) % 12 + 1 }{mode}") # num-1 (corretto)
-        compatible.append(f"{ (num % 12) + 1 }{mode}")     # num+1 (corretto)
-        compatible.append(f"{num}{'B' if mode == 'A' else 'A'}")
-        
-        # Filtra per assicurarsi che siano codici Camelot validi (opzionale ma sicuro)
-        valid_camelot_codes = set(CAMELOT_MAP.values())
-        return sorted([c for c in list(set(compatible)) if c in valid_camelot_codes or c == camelot_code])
-
+            print(f"Errore salvataggio in archivio per {result.filename}: {str(e)}")
 
-    def _calculate_energy(self, y: np.ndarray, sr: int) -> int:
-        try:
-            rms_frames = librosa.feature.rms(y=y)[0]
-            if rms_frames.size == 0: return 1 # Evita errore su array vuoto
-
-            energy_mean = np.mean(rms_frames)
-            energy_std = np.std(rms_frames)
-            energy_score = energy_mean + 0.5 * energy_std
-            
-            scaled_value = 1 
-            if energy_score > 0: 
-                min_expected_score = 0.055 # Valori da tarare
-                max_expected_score = 0.130 # Valori da tarare
-                
-                if energy_score <= min_expected_score:
-                    scaled_value = 1
-                elif energy_score >= max_expected_score:
-                    scaled_value = 10
-                else:
-                    scaled_value = 1 + 9 * (energy_score - min_expected_score) / (max_expected_score - min_expected_score)
-            
-            return int(np.clip(round(scaled_value), 1, 10))
-        except Exception as e:
-            print(f"Errore nel calcolo energia: {str(e)}")
-            return 1
 
     # =============================================
     # Gestione file e utilità (come da DJAnalyzer069ds.py)
     # =============================================
-    def _get_audio_files(self) -> List[str]:
-        input_dir = self.input_folder.get()
-        if not input_dir or not os.path.isdir(input_dir):
-            return []
-            
-        supported_ext = ('.mp3', '.wav', '.aac', '.flac', '.ogg', '.m4a')
-        audio_files = []
-        for f in os.listdir(input_dir):
-            if f.lower().endswith(supported_ext):
-                full_path = os.path.join(input_dir, f)
-                if os.path.isfile(full_path): # Assicura sia un file
-                    audio_files.append(full_path)
-        return audio_files
-
     def _validate_paths(self) -> bool:
         errors = []
         if not self.input_folder.get() or not os.path.isdir(self.input_folder.get()):
@@ -455,6 +296,12 @@ class DJAnalyzerApp:
         self.stop_btn.config(state=tk.NORMAL)
         self.select_input_button.config(state=tk.DISABLED)
         self.select_output_button.config(state=tk.DISABLED)
+        self.import_vdj_button.config(state=tk.DISABLED)
+        self.workers_spin.config(state=tk.DISABLED)
+        self.incremental_check.config(state=tk.DISABLED)
+        self.recursive_check.config(state=tk.DISABLED)
+        self.profile_combo.config(state=tk.DISABLED)
+        self.key_mode_combo.config(state=tk.DISABLED)
         self._update_status("Preparazione analisi...")
 
 
@@ -469,6 +316,12 @@ class DJAnalyzerApp:
         self.stop_btn.config(state=tk.DISABLED)
         self.select_input_button.config(state=tk.NORMAL)
         self.select_output_button.config(state=tk.NORMAL)
+        self.import_vdj_button.config(state=tk.NORMAL)
+        self.workers_spin.config(state=tk.NORMAL)
+        self.incremental_check.config(state=tk.NORMAL)
+        self.recursive_check.config(state=tk.NORMAL)
+        self.profile_combo.config(state="readonly")
+        self.key_mode_combo.config(state="readonly")
         self.analysis_thread = None # Resetta il riferimento al thread
 
 
@@ -514,13 +367,15 @@ class DJAnalyzerApp:
     def _add_result_to_table(self, result: AnalysisResult):
         values = (
             result.filename, result.bpm, result.key,
-            result.camelot_code, result.compatible_keys, result.energy
+            result.camelot_code, result.compatible_keys, result.energy,
+            f"{result.cutoff_khz:.1f} kHz" if result.cutoff_khz else "", result.quality
         )
         # Applica il tag colore per Camelot. Il tag per l'energia è più complesso
         # da applicare a una singola cella in ttk.Treeview senza subclassing.
         # Per ora, coloriamo l'intera riga con il colore Camelot.
         # Il tag colore deve essere il nome del colore stesso, come configurato.
-        item_id = self.results_tree.insert("", tk.END, values=values, tags=(result._camelot_color_tag,))
+        tags = (result._camelot_color_tag,) + ((QUALITY_FAKE,) if result.quality == QUALITY_FAKE else ())
+        item_id = self.results_tree.insert("", tk.END, values=values, tags=tags)
         self.results_tree.see(item_id) # Scrolla per vedere l'ultimo elemento
         self.analysis_results_data.append(result) # Aggiungi ai dati per il CSV
 
@@ -553,6 +408,28 @@ class DJAnalyzerApp:
             self.output_folder.set(folder)
             self._update_status(f"Cartella Output: {folder}")
 
+    def _import_vdj_database(self):
+        """Importa nell'archivio della cartella di output i dati <Scan> di VirtualDJ."""
+        output_dir = self.output_folder.get()
+        if not output_dir or not os.path.isdir(output_dir):
+            messagebox.showerror("Errore Percorsi", "Seleziona prima la cartella di output (contiene l'archivio).")
+            return
+        db_file = filedialog.askopenfilename(title="Seleziona database.xml di VirtualDJ",
+                                             filetypes=(("VirtualDJ database", "database.xml"), ("XML", "*.xml")))
+        if not db_file:
+            return
+        self._update_status("Importazione dati VirtualDJ...")
+        self.master.config(cursor="watch")
+        self.master.update_idletasks()
+        try:
+            with LibraryStore(os.path.join(output_dir, DEFAULT_DB_NAME)) as store:
+                count = import_vdj_database(store, db_file)
+            self._update_status(f"Importati da VirtualDJ: {count} brani (usati come stima iniziale del BPM)")
+        except Exception as e:
+            self._show_error_message(f"Errore durante l'importazione da VirtualDJ: {str(e)}", is_fatal=False)
+        finally:
+            self.master.config(cursor="")
+
     def toggle_pause(self):
         if not self.analysis_active: return
 
@@ -1,6 +1,13 @@
 # All'inizio del tuo DJAnalyzerXXX.py
+import os
+import sys
+
 import numpy as np
 import librosa
+
+# Il confronto vettoriale con i 24 profili tonali vive in src/key_detection.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from key_detection import match_keys
 # from scipy.stats import mode # Rimosso se non usato
 
 class EfficientAdvancedKeyDetector: # Nome cambiato per distinguerla
@@ -39,35 +46,10 @@ class EfficientAdvancedKeyDetector: # Nome cambiato per distinguerla
             return 0 # Default a C se fallisce
 
     def _match_key(self, chroma_profile, bass_note_idx):
-        # Logica di matching "a peso" (preferibile alla forzatura)
-        scores = []
-        for i in range(12): # Per ogni possibile tonica (C, C#, ..., B)
-            shifted_major_profile = np.roll(self.major_profile, -i)
-            major_corr = np.corrcoef(chroma_profile, shifted_major_profile)[0, 1]
-            
-            shifted_minor_profile = np.roll(self.minor_profile, -i)
-            minor_corr = np.corrcoef(chroma_profile, shifted_minor_profile)[0, 1]
-            
-            scores.append({'tonic_idx': i, 'type': 'major', 'score': major_corr})
-            scores.append({'tonic_idx': i, 'type': 'minor', 'score': minor_corr})
-
-        bass_weight = 0.3 
-        for score_info in scores:
-            tonic_idx = score_info['tonic_idx']
-            key_type = score_info['type']
-            
-            # Se la tonica della chiave candidata (maggiore o minore) corrisponde alla nota di basso
-            if tonic_idx == bass_note_idx:
-                score_info['score'] += bass_weight
-
-        best_score_info = max(scores, key=lambda x: x['score'])
-        best_tonic_idx = best_score_info['tonic_idx']
-        best_type = best_score_info['type']
-
-        if best_type == 'major':
-            return self.notes_major[best_tonic_idx]
-        else:
-            return self.notes_minor[best_tonic_idx]
+        # Logica di matching "a peso" (preferibile alla forzatura): le 24 correlazioni
+        # si calcolano con una sola moltiplicazione matriciale. Il vecchio ciclo ruotava
+        # i profili con np.roll(profilo, -i), cioè verso la tonica sbagliata.
+        return match_keys(chroma_profile, bass_note_idx).key
 
     def analyze_audio_data(self, y, sr): # Ora prende y, sr come input
         try:
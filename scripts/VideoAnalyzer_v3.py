@@ -1,6 +1,7 @@
 # DJAnalyzer - Programma completo (Analisi BPM, Chiave, Energia, Spettro)
 
 import os
+import sys
 import threading
 import io
 import librosa
@@ -12,6 +13,10 @@ from tkinter import filedialog, messagebox, ttk
 from PIL import Image, ImageTk
 import matplotlib.pyplot as plt
 
+# Il contesto di feature condiviso vive in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from features import TrackFeatures
+
 # --- Modulo: Key Analyzer ---
 CAMELT_MAP = {
     "G#m": "1A", "D#m": "2A", "A#m": "3A", "Fm": "4A", "Cm": "5A", "Gm": "6A", "Dm": "7A", "Am": "8A",
@@ -21,11 +26,9 @@ CAMELT_MAP = {
 
 PITCH_MAP = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 
-def analyze_key(file_path):
+def analyze_key(feats: TrackFeatures):
     try:
-        y, sr = librosa.load(file_path, sr=None)
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-        chroma_mean = chroma.mean(axis=1)
+        chroma_mean = feats.chroma.mean(axis=1)
         pitch_class = chroma_mean.argmax()
         key_raw = PITCH_MAP[pitch_class]
         is_minor = chroma_mean[(pitch_class + 3) % 12] > chroma_mean[(pitch_class + 4) % 12]
@@ -37,10 +40,9 @@ def analyze_key(file_path):
         return 'C', '5B'
 
 # --- Modulo: BPM Analyzer ---
-def analyze_bpm(file_path):
+def analyze_bpm(feats: TrackFeatures):
     try:
-        y, sr = librosa.load(file_path, sr=None)
-        tempo = librosa.beat.tempo(y=y, sr=sr)
+        tempo = librosa.feature.tempo(onset_envelope=feats.onset_env, sr=feats.sr)
         bpm = int(round(tempo[0])) if tempo.size else 0
         return bpm
     except Exception as e:
@@ -48,10 +50,9 @@ def analyze_bpm(file_path):
         return 0
 
 # --- Modulo: Energy Analyzer ---
-def analyze_energy(file_path):
+def analyze_energy(feats: TrackFeatures):
     try:
-        y, sr = librosa.load(file_path, sr=None)
-        rms = librosa.feature.rms(y=y)
+        rms = feats.rms
         energy = float(np.mean(rms)) if rms.size else 0
         scaled = min(10, max(1, int(np.ceil(energy * 20))))
         color = energy_to_color(scaled)
@@ -147,37 +148,35 @@ class DJAnalyzerApp(tk.Tk):
                 self.current_label.set(f"Analizzando: {fname}")
                 self.update_idletasks()
                 path = os.path.join(self.input_folder.get(), fname)
+                # Una sola decodifica per brano, condivisa da tutti gli analizzatori
+                feats = TrackFeatures(path)
 
                 try:
-                    bpm = analyze_bpm(path)
+                    bpm = analyze_bpm(feats)
                 except Exception as e:
                     print(f"Errore BPM in {fname}: {e}")
                     bpm = 0
+                print(f"  BPM: {bpm}")  # DEBUG
 
                 try:
-                    key, camelot = analyze_key(path)
+                    key, camelot = analyze_key(feats)
                 except Exception as e:
                     print(f"Errore chiave in {fname}: {e}")
                     key, camelot = 'C', '5B'
+                print(f"  Key: {key} ({camelot})")  # DEBUG
 
                 try:
-                    energy, color = analyze_energy(path)
+                    energy, color = analyze_energy(feats)
                 except Exception as e:
                     print(f"Errore energia in {fname}: {e}")
                     energy, color = 1, "Gray"
+                print(f"  Energia: {energy} - Colore: {color}")  # DEBUG
 
                 try:
                     compatible = find_compatible_keys(camelot)
                 except Exception as e:
                     print(f"Errore compatibilità in {fname}: {e}")
                     compatible = []
-                bpm = analyze_bpm(path)
-                print(f"  BPM: {bpm}")  # DEBUG
-                key, camelot = analyze_key(path)
-                print(f"  Key: {key} ({camelot})")  # DEBUG
-                energy, color = analyze_energy(path)
-                print(f"  Energia: {energy} - Colore: {color}")  # DEBUG
-                compatible = find_compatible_keys(camelot)
                 row = {
                     'File': fname,
                     'BPM': bpm,
@@ -190,17 +189,17 @@ class DJAnalyzerApp(tk.Tk):
                 self.tree.yview_moveto(1.0)
                 results.append(row)
                 if not self.paused:
-                    self.show_spectrum(path)
+                    self.show_spectrum(feats)
             pd.DataFrame(results).to_csv(os.path.join(self.output_folder.get(), 'analisi.csv'), index=False)
             messagebox.showinfo("Completato", "Analisi completata e salvata!")
         except Exception as e:
             print(f"Errore generale: {e}")
             messagebox.showerror("Errore", str(e))
 
-    def show_spectrum(self, file_path):
+    def show_spectrum(self, feats):
         try:
-            y, sr = librosa.load(file_path, sr=None)
-            D = librosa.amplitude_to_db(np.abs(librosa.stft(y)), ref=np.max)
+            sr = feats.sr
+            D = librosa.amplitude_to_db(feats.magnitude, ref=np.max)
             fig, ax = plt.subplots(figsize=(10, 3))
             librosa.display.specshow(D, sr=sr, x_axis='time', y_axis='log', cmap='magma', ax=ax)
             ax.set(title='Spettro')
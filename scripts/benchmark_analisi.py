@@ -0,0 +1,157 @@
+# Benchmark dei profili di analisi: velocità e accuratezza per profilo
+# e per modo di stima della chiave (fast = croma CQT senza percussioni,
+# precise = HPSS + CENS)
+#
+# USO:
+#   python benchmark_analisi.py <cartella_brani> [--etichette etichette.csv]
+#                               [--profili fast standard] [--chiave fast precise]
+#
+# I profili si confrontano sull'analisi completa (analyze_track). I modi della
+# chiave invece si misurano da soli, sulla stessa decodifica di ogni brano: il
+# tempo è quello del croma del modo (tonal_chroma o harmonic_chroma) più
+# match_keys; CQT, inviluppo degli onset e nota di basso servono anche al BPM
+# e vengono calcolati prima, fuori dal tempo misurato.
+#
+# Il file di etichette (facoltativo) ha le colonne file,bpm,key come l'output
+# di src/bpm_key_analyzer.py. Senza etichette il riferimento è il profilo
+# "precise" (sample rate nativo) con la chiave in modo "precise".
+
+import argparse
+import csv
+import os
+import sys
+import time
+import warnings
+
+# Il nucleo di analisi condiviso vive in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from features import ANALYSIS_PROFILES, TrackFeatures
+from key_detection import match_keys
+from track_analysis import ANALYSIS_DURATION, KEY_MODES, analyze_track, detect_bass_note_chroma_idx
+
+AUDIO_EXT = ('.mp3', '.wav', '.flac', '.aiff', '.m4a', '.ogg')
+
+# Tolleranza BPM per considerare corretta una stima
+BPM_TOLERANCE = 1
+
+
+def load_labels(path):
+    """Legge le etichette file -> (bpm, key)."""
+    labels = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            labels[row['file']] = (float(row['bpm']), row['key'].strip())
+    return labels
+
+
+def run_profile(files, profile):
+    """Analizza tutti i file con un profilo; restituisce (risultati, secondi totali)."""
+    results = {}
+    start = time.perf_counter()
+    for path in files:
+        try:
+            results[os.path.basename(path)] = analyze_track(path, profile=profile)
+        except Exception as e:
+            print(f"  Errore su {os.path.basename(path)} ({profile}): {e}")
+    return results, time.perf_counter() - start
+
+
+def run_key_modes(files, profile, key_modes):
+    """Chiave di ogni file per ciascun modo, sulla stessa decodifica.
+
+    Restituisce {modo: ({file: chiave}, secondi totali del solo front end + match_keys)}.
+    """
+    runs = {mode: ({}, 0.0) for mode in key_modes}
+    for path in files:
+        name = os.path.basename(path)
+        try:
+            feats = TrackFeatures(path, duration=ANALYSIS_DURATION, profile=profile).load()
+            # CQT, STFT e onset servono anche al BPM: calcolati fuori dal tempo misurato
+            for shared in ("chroma", "onset_env"):
+                getattr(feats, shared)
+            bass = detect_bass_note_chroma_idx(feats)
+        except Exception as e:
+            print(f"  Errore su {name} ({profile}): {e}")
+            continue
+        for mode in key_modes:
+            keys, seconds = runs[mode]
+            start = time.perf_counter()
+            chroma = feats.tonal_chroma if mode == "fast" else feats.harmonic_chroma
+            keys[name] = match_keys(chroma.mean(axis=1), bass).key
+            runs[mode] = (keys, seconds + time.perf_counter() - start)
+    return runs
+
+
+def accuracy(results, reference):
+    """Percentuale di BPM e chiavi corrette rispetto al riferimento."""
+    common = [name for name in results if name in reference]
+    if not common:
+        return None, None
+    bpm_ok = sum(abs(results[n].bpm - reference[n][0]) <= BPM_TOLERANCE for n in common)
+    key_ok = sum(results[n].key == reference[n][1] for n in common)
+    return 100.0 * bpm_ok / len(common), 100.0 * key_ok / len(common)
+
+
+def key_accuracy(keys, reference):
+    """Percentuale di chiavi corrette rispetto al riferimento."""
+    common = [name for name in keys if name in reference]
+    if not common:
+        return None
+    return 100.0 * sum(keys[n] == reference[n][1] for n in common) / len(common)
+
+
+def _percent(value):
+    return f"{value:9.1f}" if value is not None else f"{'-':>9}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dei profili di analisi DJAnalyzer")
+    parser.add_argument("cartella", help="Cartella con i brani di test")
+    parser.add_argument("--etichette", help="CSV con colonne file,bpm,key")
+    parser.add_argument("--profili", nargs="+", default=list(ANALYSIS_PROFILES),
+                        choices=list(ANALYSIS_PROFILES))
+    parser.add_argument("--chiave", nargs="+", default=list(KEY_MODES), choices=list(KEY_MODES),
+                        help="Modi di stima della chiave da confrontare")
+    args = parser.parse_args()
+
+    files = sorted(os.path.join(args.cartella, f) for f in os.listdir(args.cartella)
+                   if f.lower().endswith(AUDIO_EXT))
+    if not files:
+        print("Nessun file audio trovato.")
+        return 1
+
+    warnings.filterwarnings("ignore")
+    runs, key_runs = {}, {}
+    for profile in args.profili:
+        print(f"Profilo {profile}...")
+        runs[profile] = run_profile(files, profile)
+        print(f"Profilo {profile}, chiave {', '.join(args.chiave)}...")
+        for key_mode, run in run_key_modes(files, profile, args.chiave).items():
+            key_runs[(profile, key_mode)] = run
+
+    if args.etichette:
+        reference = load_labels(args.etichette)
+        ref_name = "etichette"
+    else:
+        precise = runs.get("precise") or run_profile(files, "precise")
+        keys = (key_runs.get(("precise", "precise"))
+                or run_key_modes(files, "precise", ["precise"])["precise"])[0]
+        reference = {n: (r.bpm, keys.get(n)) for n, r in precise[0].items()}
+        ref_name = "profilo precise, chiave precise"
+
+    print(f"\n{len(files)} brani, riferimento: {ref_name}")
+    print(f"{'Profilo':<10} {'s/brano':>8} {'BPM ok %':>9} {'Key ok %':>9}")
+    for profile, (results, seconds) in runs.items():
+        bpm_acc, key_acc = accuracy(results, reference)
+        print(f"{profile:<10} {seconds / len(files):8.2f} {_percent(bpm_acc)} {_percent(key_acc)}")
+
+    print("\nChiave: solo croma del modo + match_keys, sulla decodifica condivisa")
+    print(f"{'Profilo':<10} {'Chiave':<8} {'ms/brano':>9} {'Key ok %':>9}")
+    for (profile, key_mode), (keys, seconds) in key_runs.items():
+        print(f"{profile:<10} {key_mode:<8} {1000 * seconds / len(files):9.1f} "
+              f"{_percent(key_accuracy(keys, reference))}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,13 +2,29 @@
 import os
 import librosa
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
+from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
 import datetime
 import numpy as np
-import soundfile as sf
 from threading import Thread
 import traceback
 
+from batch_engine import BatchEngine
+from beatgrid import fit_beatgrid
+from cue_export import MAX_HOT_CUES, TrackCues, export_cues
+from features import TrackFeatures
+from harmony_opt import (PLAYLIST_NAME, REPORT_NAME as PLAYLIST_REPORT_NAME, RESULTS_DIR,
+                         copia_in_ordine, ottimizza_chiave, write_playlist, write_playlist_report)
+from loudness import REFERENCE_DB, misura_loudness
+from mp3gain import REPORT_NAME as NORMALIZE_REPORT_NAME, normalizza_mp3
+from mp3gain import write_report as write_normalize_report
+from quantization import QUANTIZE_DIR, REPORT_NAME, quantizza_audio, write_report
+
+# Cue generati sui downbeat a inizio frase (8 misure = 32 battiti in 4/4)
+PHRASE_BARS = 8
+
+# Cartella con i brani replicati nell'ordine della playlist
+ORDERED_DIR = 'playlist_ordinata'
+
 # Controllo dipendenze
 def check_dependencies():
     required = ['librosa', 'pydub', 'simpleaudio']
@@ -81,7 +97,8 @@ class DJAnalyzerGUI:
             ('Analizza', self.analyze),
             ('Quantizza', self.quantize),
             ('Genera Cue', self.generate_cue),
-            ('Ottimizza Playlist', self.optimize_playlist)
+            ('Ottimizza Playlist', self.optimize_playlist),
+            ('Normalizza', self.normalize)
         ]:
             ttk.Button(btn_frame, text=txt, command=cmd).pack(side=tk.LEFT, padx=5)
 
@@ -89,6 +106,8 @@ class DJAnalyzerGUI:
         self.tree = ttk.Treeview(frame, columns=cols, show='headings')
         for c, t in zip(cols, ['File', 'BPM', 'Key']):
             self.tree.heading(c, text=t)
+        # Brani che al livello scelto andrebbero in saturazione
+        self.tree.tag_configure('saturazione', foreground='red')
         self.tree.pack(fill=tk.BOTH, expand=True, pady=10)
 
         log_frame = ttk.Frame(frame)
@@ -108,6 +127,8 @@ class DJAnalyzerGUI:
             messagebox.showerror('Errore', 'Nessuna cartella selezionata')
             return
         self.tree.delete(*self.tree.get_children())
+        self.tree.heading('bpm', text='BPM')
+        self.tree.heading('key', text='Key')
         self.log.insert(tk.END, 'Avvio analisi...\n')
 
         def worker():
@@ -136,19 +157,27 @@ class DJAnalyzerGUI:
         if not hasattr(self, 'input_folder'):
             messagebox.showerror('Errore', 'Nessuna cartella selezionata')
             return
-        qdir = os.path.join(self.input_folder, 'quantized')
+        qdir = os.path.join(self.input_folder, QUANTIZE_DIR)
         os.makedirs(qdir, exist_ok=True)
+        files = [os.path.join(self.input_folder, f) for f in sorted(os.listdir(self.input_folder))
+                 if f.lower().endswith(('.mp3', '.wav'))]
 
         def worker():
-            for f in os.listdir(self.input_folder):
-                if f.lower().endswith(('.mp3', '.wav')):
-                    p = os.path.join(self.input_folder, f)
-                    r = self.analyzer.analyze_audio(p)
-                    if not r['success']:
-                        continue
-                    yq = librosa.effects.time_stretch(y=r['waveform'], rate=1.0)
-                    sf.write(os.path.join(qdir, f), yq, r['sr'])
-                    self.log.insert(tk.END, f"Quantizzato {f}\n")
+            # Un processo per core: i brani a tempo costante vengono solo copiati
+            reports = []
+            engine = BatchEngine(task=quantizza_audio)
+            for kind, payload in engine.iter_results(((f, {'out_folder': qdir}) for f in files),
+                                                     total=len(files)):
+                if kind == 'new_data':
+                    reports.append(payload)
+                    self.log.insert(tk.END, f"{os.path.basename(payload.file_path)}: {payload.status} "
+                                            f"({payload.percent:.1f}% dei battiti)\n")
+                elif kind == 'error':
+                    self.log.insert(tk.END, f"⚠️ {payload}\n")
+                self.log.see(tk.END)
+            results_dir = os.path.join(self.input_folder, RESULTS_DIR)
+            os.makedirs(results_dir, exist_ok=True)
+            write_report(reports, os.path.join(results_dir, REPORT_NAME))
             messagebox.showinfo('Fine', 'Quantizzazione completata')
         Thread(target=worker, daemon=True).start()
 
@@ -159,7 +188,7 @@ class DJAnalyzerGUI:
         cue_dir = os.path.join(self.input_folder, 'cue')
         os.makedirs(cue_dir, exist_ok=True)
 
-        def worker_cue():
+        def tracks():
             for fname in os.listdir(self.input_folder):
                 if not fname.lower().endswith(('.mp3', '.wav')):
                     continue
@@ -170,27 +199,94 @@ class DJAnalyzerGUI:
                 if not res['success']:
                     self.log.insert(tk.END, f"⚠️ Skipped cue {fname}\n")
                     continue
-                base, _ = os.path.splitext(fname)
-                xml_path = os.path.join(cue_dir, base + '.vdjcue.xml')
-                try:
-                    with open(xml_path, 'w', encoding='utf-8') as f:
-                        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-                        f.write('<vdj xmlns="http://www.virtualdj.com/">\n')
-                        f.write(f'  <song name="{base}">\n')
-                        for i, t in enumerate(res['beat_times'][:8], start=1):
-                            f.write(f'    <poi pos="{t:.3f}" type="cue" name="Cue{i}" color="0"/>\n')
-                        f.write('  </song>\n')
-                        f.write('</vdj>\n')
-                    self.log.insert(tk.END, f"✓ Cue VDJ creati per {fname}\n")
-                except Exception as e:
-                    self.log.insert(tk.END, f"⚠️ Errore cue {fname}: {e}\n")
-                self.log.see(tk.END)
+                grid = fit_beatgrid(TrackFeatures(y=res['waveform'], sr=res['sr']), start_bpm=res['bpm'])
+                if grid is None:
+                    self.log.insert(tk.END, f"⚠️ Skipped cue {fname}: griglia non stimabile\n")
+                    continue
+                downbeats = grid.downbeat_times()[::PHRASE_BARS][:MAX_HOT_CUES]
+                cues = [{'time': t, 'label': f"Battuta {i * PHRASE_BARS + 1}"} for i, t in enumerate(downbeats)]
+                yield TrackCues(path, cues=cues, bpm=grid.bpm, beatgrid=grid.downbeat)
+                self.log.insert(tk.END, f"✓ Cue VDJ creati per {fname}\n")
+
+        def worker_cue():
+            # Un solo documento .vdjcue.xml per tutta la cartella, scritto a flusso
+            xml_path = os.path.join(cue_dir, 'cues.vdjcue.xml')
+            try:
+                count = export_cues(tracks(), 'vdjcue', xml_path)
+                self.log.insert(tk.END, f"Cue di {count} brani salvati in {xml_path}\n")
+            except Exception as e:
+                self.log.insert(tk.END, f"⚠️ Errore cue: {e}\n")
+            self.log.see(tk.END)
             messagebox.showinfo('Cue', 'Generazione VDJ Cue completata')
 
         Thread(target=worker_cue, daemon=True).start()
 
     def optimize_playlist(self):
-        messagebox.showinfo('Opt', 'Non implementato')
+        if not hasattr(self, 'input_folder'):
+            messagebox.showerror('Errore', 'Nessuna cartella selezionata')
+            return
+        self.log.insert(tk.END, 'Ottimizzazione armonica della playlist...\n')
+
+        def worker():
+            tracks = ottimizza_chiave(self.input_folder)
+            if not tracks:
+                self.log.insert(tk.END, '⚠️ Nessun brano da ordinare\n')
+                return
+            results_dir = os.path.join(self.input_folder, RESULTS_DIR)
+            write_playlist(tracks, os.path.join(results_dir, PLAYLIST_NAME))
+            write_playlist_report(tracks, os.path.join(results_dir, PLAYLIST_REPORT_NAME))
+            for pos, t in enumerate(tracks, start=1):
+                self.log.insert(tk.END, f"{pos:3d}. {t.filename}  {t.bpm} BPM  {t.camelot_code}  E{t.energy}\n")
+            self.log.insert(tk.END, f"Playlist e report salvati in {results_dir}\n")
+            self.log.see(tk.END)
+            # Come da readme: replicare i brani nell'ordine oppure solo il report
+            if messagebox.askyesno('Ottimizza Playlist', 'Copiare le canzoni nell\'ordine della playlist?'):
+                out_dir = os.path.join(self.input_folder, ORDERED_DIR)
+                copia_in_ordine(tracks, out_dir)
+                self.log.insert(tk.END, f"Brani copiati in ordine in {out_dir}\n")
+                self.log.see(tk.END)
+        Thread(target=worker, daemon=True).start()
+
+    def normalize(self):
+        if not hasattr(self, 'input_folder'):
+            messagebox.showerror('Errore', 'Nessuna cartella selezionata')
+            return
+        target = simpledialog.askfloat('Normalizza', 'Livello desiderato (dB):',
+                                       initialvalue=REFERENCE_DB, minvalue=70.0, maxvalue=105.0)
+        if target is None:
+            return
+        files = [os.path.join(self.input_folder, f) for f in sorted(os.listdir(self.input_folder))
+                 if f.lower().endswith('.mp3')]
+        self.tree.delete(*self.tree.get_children())
+        self.tree.heading('bpm', text='Loudness')
+        self.tree.heading('key', text='Guadagno')
+        self.log.insert(tk.END, f"Normalizzazione a {target:g} dB...\n")
+
+        def worker():
+            # Misura EBU R128 su tutti i core, poi guadagno senza ricodifica (passi da 1.5 dB)
+            measures = [payload for kind, payload in
+                        BatchEngine(task=misura_loudness).iter_results(files, total=len(files))
+                        if kind == 'new_data']
+            reports = []
+            items = ((m.file_path, {'loudness': m, 'target_db': target}) for m in measures)
+            for kind, payload in BatchEngine(task=normalizza_mp3).iter_results(items, total=len(measures)):
+                if kind == 'new_data':
+                    reports.append(payload)
+                    tags = ('saturazione',) if payload.clipping else ()
+                    self.tree.insert('', tk.END, tags=tags,
+                                     values=(os.path.basename(payload.file_path),
+                                             f"{payload.loudness_lufs:.1f} LUFS", f"{payload.gain_db:+.1f} dB"))
+                elif kind == 'error':
+                    self.log.insert(tk.END, f"⚠️ {payload}\n")
+                self.log.see(tk.END)
+            results_dir = os.path.join(self.input_folder, RESULTS_DIR)
+            os.makedirs(results_dir, exist_ok=True)
+            write_normalize_report(reports, os.path.join(results_dir, NORMALIZE_REPORT_NAME))
+            clipped = sum(r.clipping for r in reports)
+            if clipped:
+                self.log.insert(tk.END, f"⚠️ {clipped} brani fermati sotto il livello per non saturare (in rosso)\n")
+            messagebox.showinfo('Fine', 'Normalizzazione completata')
+        Thread(target=worker, daemon=True).start()
 
 if __name__ == '__main__':
     root = tk.Tk()
@@ -10,6 +10,7 @@ from logger           import logger
 from harmonic         import rileva_chiave
 from energy           import calcola_energia
 from cue              import rileva_cue
+from cue_export       import TrackCues, export_cues
 from quantization     import quantizza_audio
 from harmony_opt      import ottimizza_chiave
 from output_helper    import init_output, append_output, clear_output
@@ -112,22 +113,19 @@ class DJProToolApp(tk.Tk):
         os.makedirs(xml_dir, exist_ok=True)
         timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
         xml_path = os.path.join(xml_dir, f'cues_{timestamp}.xml')
-        with open(xml_path, 'w', encoding='utf-8') as xf:
-            xf.write('<?xml version="1.0" encoding="UTF-8"?>\n<Tracks>\n')
-            file_list = [self.path] if os.path.isfile(self.path) else [os.path.join(self.path, f)
-                          for f in os.listdir(self.path) if f.lower().endswith(('.mp3', '.wav'))]
+        file_list = [self.path] if os.path.isfile(self.path) else [os.path.join(self.path, f)
+                     for f in os.listdir(self.path) if f.lower().endswith(('.mp3', '.wav'))]
+
+        def tracks():
             for fpath in file_list:
-                name = os.path.basename(fpath)
                 try:
                     cues = rileva_cue(fpath)
                 except Exception as e:
-                    logger.error(f"Cue error {name}: {e}")
+                    logger.error(f"Cue error {os.path.basename(fpath)}: {e}")
                     cues = []
-                xf.write(f'  <Track file="{name}">\n')
-                for idx, cue in enumerate(cues, 1):
-                    xf.write(f'    <Cue id="{idx}" time="{cue}"/>\n')
-                xf.write('  </Track>\n')
-            xf.write('</Tracks>')
+                yield TrackCues(fpath, cues=cues)
+
+        export_cues(tracks(), 'tracks', xml_path)
         append_output(self.txt, f"Cues salvati in: {xml_path}")
 
 if __name__ == '__main__':
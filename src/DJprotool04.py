@@ -2,14 +2,21 @@
 import os
 import tkinter as tk
 from tkinter import filedialog, scrolledtext
-from xml.etree import ElementTree as ET
 from cue import rileva_cue  # modulo esterno per rilevamento cue
+from scanner import scan_paths
+from safe_io import ConcurrentModificationError
+from cue_export import TrackCues, export_cues
+from beatgrid import fit_beatgrid
+from features import TrackFeatures
 #from voice import rileva_inizio_voce  # modulo per inizio voce (attualmente disabilitato)
 
 def append_output(widget, text):
     widget.insert(tk.END, text + "\n")
     widget.see(tk.END)
 
+# Percorso di database.xml di VirtualDJ
+VDJ_DB_PATH = "D:\\progetti\\DJAnalyzer\\src\\VirtualDJ_test\\database.xml"
+
 class DJAnalyzerGUI:
     def __init__(self, root):
         self.root = root
@@ -18,12 +25,17 @@ class DJAnalyzerGUI:
         self.out_dir = os.path.join(os.getcwd(), "output")
         os.makedirs(self.out_dir, exist_ok=True)
 
-        self.label = tk.Label(root, text="Seleziona un file audio:")
+        self.audio_files = []
+
+        self.label = tk.Label(root, text="Seleziona i file audio o una cartella:")
         self.label.pack()
 
         self.select_button = tk.Button(root, text="Scegli File", command=self.select_file)
         self.select_button.pack()
 
+        self.folder_button = tk.Button(root, text="Scegli Cartella", command=self.select_folder)
+        self.folder_button.pack()
+
         self.cue_button = tk.Button(root, text="Cue", command=self.run_cues)
         self.cue_button.pack()
 
@@ -31,75 +43,56 @@ class DJAnalyzerGUI:
         self.txt.pack()
 
     def select_file(self):
-        filetypes = (('Audio Files', '*.mp3 *.wav'), ('All files', '*.*'))
-        filepath = filedialog.askopenfilename(filetypes=filetypes)
-        if filepath:
-            self.audio_file = filepath
-            append_output(self.txt, f"File selezionato: {filepath}")
+        filetypes = (('Audio Files', '*.mp3 *.wav *.flac *.aiff *.m4a *.ogg'), ('All files', '*.*'))
+        filepaths = filedialog.askopenfilenames(filetypes=filetypes)
+        if filepaths:
+            self.audio_files = list(filepaths)
+            for filepath in filepaths:
+                append_output(self.txt, f"File selezionato: {filepath}")
+
+    def select_folder(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.audio_files = list(scan_paths(folder, recursive=True))
+            append_output(self.txt, f"Cartella selezionata: {folder} ({len(self.audio_files)} file audio)")
 
     def run_cues(self):
-        if not hasattr(self, 'audio_file'):
+        if not self.audio_files:
             append_output(self.txt, "Nessun file selezionato.")
             return
 
         append_output(self.txt, "Analisi files:")
         append_output(self.txt, "Avvio analisi...")
 
-        cues = rileva_cue(self.audio_file)
-        
-        # Modifica del percorso di database.xml
-        vdj_db_path = "D:\\progetti\\DJAnalyzer\\src\\VirtualDJ_test\\database.xml"
-        
+        # Prima si rilevano i cue di tutti i brani, poi il database viene letto,
+        # aggiornato in memoria e riscritto una volta sola per l'intero lotto
+        updates = []
+        for audio_file in self.audio_files:
+            try:
+                # Griglia a tempo costante: l'ancora  il primo battito di misura.
+                # Feature e griglia servono anche ai cue e vengono calcolate una volta sola
+                feats = TrackFeatures(audio_file).load()
+                grid = fit_beatgrid(feats)
+                cues = rileva_cue(audio_file, feats, grid)
+                updates.append(TrackCues(audio_file, cues=cues,
+                                         bpm=grid.bpm if grid else None,
+                                         beatgrid=grid.downbeat if grid else None))
+            except Exception as e:
+                append_output(self.txt, f"Errore rilevamento cue {os.path.basename(audio_file)}: {str(e)}")
+
         try:
-            tree = ET.parse(vdj_db_path)
-            root = tree.getroot()
-            updated = False
-
-            # Controlliamo se il file audio  gi presente nel database
-            song_found = False
-            for song in root.findall(".//Song"):
-                if song.get("FilePath") == self.audio_file:
-                    song_found = True
-                    # Rimuoviamo i cue esistenti
-                    for poi in song.findall("Poi"):
-                        song.remove(poi)
-                    # Aggiungiamo i nuovi cue
-                    for cue in cues:
-                        ET.SubElement(song, "Poi", {
-                            "Name": cue['label'],
-                            "Num": "0",
-                            "Type": "cue",
-                            "Start": str(cue['time']),
-                            "Length": "0"
-                        })
-                    updated = True
-                    break
-            
-            # Se il file audio non  presente, lo aggiungiamo come nuova traccia
-            if not song_found:
-                song_elem = ET.SubElement(root, "Song", {
-                    "FilePath": self.audio_file,
-                    "FileSize": "123456",  # Placeholder, puoi calcolare la dimensione se vuoi
-                    "FileDate": str(int(os.path.getmtime(self.audio_file)))  # Placeholder per la data
-                })
-                for cue in cues:
-                    ET.SubElement(song_elem, "Poi", {
-                        "Name": cue['label'],
-                        "Num": "0",
-                        "Type": "cue",
-                        "Start": str(cue['time']),
-                        "Length": "0"
-                    })
-                updated = True
-
-            if updated:
-                tree.write(vdj_db_path, encoding="UTF-8", xml_declaration=True)
-                append_output(self.txt, f"Cue aggiornati in: {vdj_db_path}")
+            # I brani non presenti vengono aggiunti come nuove tracce
+            count = export_cues(updates, 'vdjdb', VDJ_DB_PATH)
+            if count:
+                append_output(self.txt, f"Cue aggiornati in: {VDJ_DB_PATH} ({count} brani)")
             else:
-                append_output(self.txt, "File non trovato nel database di VirtualDJ.")
+                append_output(self.txt, "Nessun brano da aggiornare nel database di VirtualDJ.")
 
         except FileNotFoundError:
             append_output(self.txt, "database.xml non trovato. Verifica che VirtualDJ sia installato e chiuso.")
+        except ConcurrentModificationError:
+            append_output(self.txt, "database.xml modificato durante l'aggiornamento (VirtualDJ aperto?). "
+                                    "Nessuna modifica scritta: chiudi VirtualDJ e riprova.")
         except Exception as e:
             append_output(self.txt, f"Errore durante l'aggiornamento del database: {str(e)}")
 
@@ -2,15 +2,28 @@ import os
 import numpy as np
 import librosa
 
+from features import DEFAULT_PROFILE, load_audio
+from streaming import StreamSummary, is_long_track, stream_summary
+
 class AudioAnalyzer:
     """Logica per caricamento audio e calcolo BPM usando librosa."""
 
-    def carica_audio(self, path: str) -> tuple[np.ndarray, int]:
-        # librosa.load returns samples and sample rate
-        samples, sr = librosa.load(path, sr=None, mono=True)
+    def __init__(self, profile: str = DEFAULT_PROFILE):
+        # Profilo di analisi ("fast", "standard", "precise"): vedi features.ANALYSIS_PROFILES
+        self.profile = profile
+
+    def carica_audio(self, path: str) -> tuple[np.ndarray, int] | StreamSummary:
+        # I brani lunghi (mix, DJ set) vengono letti a blocchi: invece dell'intero
+        # segnale si ottiene un riassunto con memoria costante, accettato da calcola_bpm.
+        if is_long_track(path):
+            return stream_summary(path)
+        # Decodifica ricampionata una sola volta al sample rate del profilo
+        samples, sr = load_audio(path, self.profile)
         return samples, sr
 
-    def calcola_bpm(self, audio_data: tuple[np.ndarray, int]) -> float:
+    def calcola_bpm(self, audio_data: tuple[np.ndarray, int] | StreamSummary) -> float:
+        if isinstance(audio_data, StreamSummary):
+            return audio_data.tempo()
         samples, sr = audio_data
         # Use librosa.beat.beat_track
         tempo, _ = librosa.beat.beat_track(y=samples, sr=sr)
@@ -0,0 +1,118 @@
+"""
+Motore di analisi batch su più processi.
+
+Distribuisce l'analisi dei file su un ProcessPoolExecutor (librosa/numba sono
+legati al GIL, quindi i thread non bastano) tenendo un numero limitato di
+task in volo per contenere la memoria. I risultati escono con lo stesso
+protocollo della results_queue della GUI:
+("status_update", testo), ("new_data", AnalysisResult), ("error", testo)
+e infine ("analysis_complete", None).
+
+Ogni elemento dell'elenco è un percorso oppure una coppia (percorso, dict)
+con argomenti extra per il task di quel file (es. i dati importati da VirtualDJ).
+"""
+import os
+import queue
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Iterable, Iterator, Optional
+
+from track_analysis import analyze_track
+
+# Intervallo (secondi) con cui si ricontrollano pausa e stop mentre si attende
+POLL_INTERVAL = 0.2
+
+
+def default_workers() -> int:
+    """Numero di processi di default: tutti i core disponibili."""
+    return os.cpu_count() or 1
+
+
+class BatchEngine:
+    """Analizza un elenco di file in parallelo, con pausa e stop cooperativi."""
+
+    def __init__(self, workers: Optional[int] = None, max_in_flight: Optional[int] = None,
+                 task: Callable = analyze_track):
+        self.workers = max(1, workers or default_workers())
+        # Due task per processo bastano a tenere i core occupati senza caricare
+        # in memoria tutta la cartella.
+        self.max_in_flight = max(1, max_in_flight or 2 * self.workers)
+        self.task = task
+
+    def iter_results(self, files: Iterable, total: Optional[int] = None,
+                     paused_event: Optional[threading.Event] = None,
+                     should_stop: Callable[[], bool] = lambda: False) -> Iterator[tuple]:
+        """Genera i messaggi del protocollo results_queue man mano che i file terminano.
+
+        Con paused_event non settato non vengono avviati nuovi file (quelli in corso
+        terminano); should_stop() vero annulla i file in attesa e chiude il generatore.
+        """
+        files_iter = iter(files)
+        exhausted = False
+        pending = {}
+        done_count = 0
+
+        pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            while True:
+                if should_stop():
+                    break
+
+                # Riempie la pipeline fino al limite, solo se non in pausa
+                while (not exhausted and len(pending) < self.max_in_flight
+                       and (paused_event is None or paused_event.is_set())):
+                    try:
+                        item = next(files_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    file_path, extra = (item, {}) if isinstance(item, str) else item
+                    pending[pool.submit(self.task, file_path, **extra)] = file_path
+
+                if not pending:
+                    if exhausted:
+                        break
+                    # In pausa e senza lavoro in corso: attende la ripresa
+                    paused_event.wait(POLL_INTERVAL)
+                    continue
+
+                done, _ = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path = pending.pop(future)
+                    filename = os.path.basename(file_path)
+                    done_count += 1
+                    progress = f"{done_count}/{total}" if total else str(done_count)
+                    yield ("status_update", f"Analisi ({progress}): {filename}")
+                    try:
+                        yield ("new_data", future.result())
+                    except Exception as e:
+                        yield ("error", f"Errore durante l'analisi di {filename}: {str(e)}")
+        finally:
+            # Allo stop i file non ancora avviati vengono annullati; quelli in corso
+            # terminano nei processi figli ma il loro risultato viene scartato.
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, files: Iterable, results_queue: queue.Queue, total: Optional[int] = None,
+            paused_event: Optional[threading.Event] = None,
+            should_stop: Callable[[], bool] = lambda: False,
+            on_result: Optional[Callable] = None) -> None:
+        """Esegue l'analisi scrivendo i messaggi su results_queue (da usare in un thread).
+
+        on_result, se indicato, riceve ogni nuovo risultato nel thread chiamante
+        (es. per salvarlo nell'archivio della libreria) prima che vada in coda.
+        """
+        try:
+            for message in self.iter_results(files, total, paused_event, should_stop):
+                if on_result is not None and message[0] == "new_data":
+                    on_result(message[1])
+                results_queue.put(message)
+            if should_stop():
+                results_queue.put(("status_update", "Analisi interrotta dall'utente."))
+        except Exception as e:
+            print(f"Errore grave nel motore di analisi: {str(e)}")
+            traceback.print_exc()
+            results_queue.put(("error", f"Errore critico nel thread: {str(e)}"))
+        finally:
+            # Assicura che il completamento venga segnalato
+            results_queue.put(("analysis_complete", None))
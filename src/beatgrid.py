@@ -0,0 +1,263 @@
+"""
+Griglia ritmica a tempo costante, allineata alle battute.
+
+I battiti trovati dal beat tracker vengono riportati al picco dell'inviluppo
+degli onset (con precisione sotto il frame) e su di essi si stima con i minimi
+quadrati pesati una griglia t = offset + periodo * n, scartando gli errori
+del tracker (battiti fuori linea con i battiti vicini). La fase di battuta (quale battito è il primo della misura) viene
+dalla potenza di cassa/basso e dal cambio armonico sui battiti; lo scostamento
+medio dei battiti reali dalla griglia, misura per misura, dice dove il brano
+"deriva" (batteria suonata, tempo non costante) e va quantizzato.
+
+Tutto il calcolo è vettoriale in numpy sull'inviluppo degli onset già
+calcolato da TrackFeatures, senza cicli per battito.
+"""
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+import numpy as np
+import librosa
+
+from scipy.ndimage import median_filter
+
+from features import BASS_OCTAVES, CQT_OCTAVES, HOP_LENGTH, TrackFeatures
+
+# Battiti per misura (4/4)
+BEATS_PER_BAR = 4
+
+# Tightness del beat tracker (default di librosa): la griglia costante la impongono i minimi quadrati
+BEAT_TIGHTNESS = 100
+
+# Frame attorno al battito in cui cercare il picco dell'inviluppo degli onset
+PEAK_SEARCH_FRAMES = 2
+
+# Il flusso spettrale di un attacco culmina un frame dopo (differenza tra frame
+# consecutivi): la griglia viene anticipata di conseguenza
+ONSET_LAG_FRAMES = 1
+
+# Battiti più lontani di così (in frazioni di periodo) dalla posizione attesa tra i due
+# battiti forti vicini sono errori del tracker. Il confronto è locale: in un brano che
+# accelera i battiti si allontanano dalla retta globale ma restano in linea con i vicini
+OUTLIER_BEATS = 0.25
+
+# Battiti deboli: inviluppo degli onset sotto questa frazione del livello tipico
+# (75° percentile) dei battiti. Nei breakdown senza batteria il tracker continua
+# a battere a un tempo suo: quei battiti non vengono contati né usati per la griglia
+WEAK_BEAT_RATIO = 0.2
+
+# Intervalli vicini (per lato) da cui si stima il periodo locale
+LOCAL_PERIOD_BEATS = 8
+
+# Cambio armonico (distanza L1 tra croma per battito) che pesa quanto una deviazione
+# standard dell'accento di cassa. Non è normalizzato: senza cambi di accordo le
+# piccole variazioni dovute alla batteria restano piccole
+CHORD_CHANGE_SCALE = 0.5
+
+# Servono almeno due misure di battiti per stimare tempo e fase
+MIN_BEATS = 2 * BEATS_PER_BAR
+
+
+@dataclass
+class BeatGrid:
+    """Griglia a tempo costante di un brano."""
+    bpm: float
+    first_beat: float     # Primo battito della griglia (s, >= 0)
+    downbeat: float       # Primo battito di misura (s): l'ancora della griglia di VirtualDJ
+    duration: float       # Durata analizzata (s)
+    beats_per_bar: int = BEATS_PER_BAR
+    bar_drift: np.ndarray = field(default_factory=lambda: np.zeros(0))  # ms per misura (NaN = nessun battito)
+    rms_error_ms: float = 0.0   # Scarto quadratico medio dei battiti dalla griglia
+    beats: np.ndarray = field(default_factory=lambda: np.zeros(0))  # Battiti rilevati (s)
+    beat_numbers: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=int))  # Battito di griglia di ciascuno (da first_beat)
+    reliable: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=bool))  # Battiti veri, contati con certezza
+
+    @property
+    def period(self) -> float:
+        return 60.0 / self.bpm
+
+    @property
+    def bar_length(self) -> float:
+        return self.period * self.beats_per_bar
+
+    def beat_times(self) -> np.ndarray:
+        return np.arange(self.first_beat, self.duration, self.period)
+
+    def downbeat_times(self) -> np.ndarray:
+        return np.arange(self.downbeat, self.duration, self.bar_length)
+
+    def grid_times(self, beat_numbers: np.ndarray) -> np.ndarray:
+        """Posizione sulla griglia dei battiti con i numeri indicati."""
+        return self.first_beat + self.period * beat_numbers
+
+    def deviations(self) -> np.ndarray:
+        """Scostamento (s) di ogni battito rilevato dal suo battito di griglia."""
+        return self.beats - self.grid_times(self.beat_numbers)
+
+    @property
+    def max_drift_ms(self) -> float:
+        drift = np.abs(self.bar_drift[~np.isnan(self.bar_drift)])
+        return float(drift.max()) if drift.size else 0.0
+
+    def drifting_bars(self, tolerance_ms: float) -> np.ndarray:
+        """Indici delle misure (da downbeat) che si scostano dalla griglia oltre la tolleranza."""
+        return np.flatnonzero(np.abs(np.nan_to_num(self.bar_drift)) > tolerance_ms)
+
+
+def _refine_peaks(onset: np.ndarray, frames: np.ndarray) -> np.ndarray:
+    """Porta ogni battito sul massimo locale dell'inviluppo e lo interpola con una parabola."""
+    offsets = np.arange(-PEAK_SEARCH_FRAMES, PEAK_SEARCH_FRAMES + 1)
+    window = np.clip(frames[:, None] + offsets, 0, onset.size - 1)
+    peaks = window[np.arange(frames.size), onset[window].argmax(axis=1)]
+
+    left = onset[np.clip(peaks - 1, 0, onset.size - 1)]
+    center = onset[peaks]
+    right = onset[np.clip(peaks + 1, 0, onset.size - 1)]
+    denom = left - 2 * center + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.where(denom < 0, 0.5 * (left - right) / denom, 0.0)
+    return peaks + np.clip(delta, -0.5, 0.5)
+
+
+def _fit_line(index: np.ndarray, times: np.ndarray, weights: np.ndarray) -> Tuple[float, float]:
+    """Minimi quadrati pesati di times = offset + period * index: (period, offset)."""
+    period, offset = np.polyfit(index, times, 1, w=np.sqrt(weights))
+    return float(period), float(offset)
+
+
+def _zscore(x: np.ndarray) -> np.ndarray:
+    std = x.std()
+    return (x - x.mean()) / std if std > 0 else np.zeros_like(x)
+
+
+def count_beats(times: np.ndarray, strong: np.ndarray) -> np.ndarray:
+    """Numero di battito (da 0) di ogni battito rilevato.
+
+    I battiti forti si contano dagli intervalli tra uno e il successivo, divisi
+    per il periodo locale (mediana degli intervalli vicini): un battito saltato
+    lascia un buco, un tratto senza battiti forti vale gli intervalli che
+    contiene anche se il tracker lì è andato a un tempo sbagliato, e in una
+    rampa di tempo l'errore sul periodo non si accumula. I battiti deboli
+    prendono il numero interpolato da quelli forti vicini.
+    """
+    t = times[strong]
+    if t.size < 2:
+        return np.arange(times.size)
+    gaps = np.diff(t)
+    unit = gaps / np.round(gaps / np.median(gaps)).clip(min=1)
+    local = median_filter(unit, size=min(2 * LOCAL_PERIOD_BEATS + 1, unit.size), mode='nearest')
+    counted = np.concatenate(([0.0], np.cumsum(np.round(gaps / local).clip(min=1))))
+
+    index = np.interp(times, t, counted)
+    before, after = times < t[0], times > t[-1]
+    index[before] = (times[before] - t[0]) / local[0]
+    index[after] = counted[-1] + (times[after] - t[-1]) / local[-1]
+    index = np.round(index).astype(int)
+    return index - index.min()
+
+
+def consistent_beats(times: np.ndarray, index: np.ndarray, strong: np.ndarray) -> np.ndarray:
+    """Battiti forti in linea con i due battiti forti vicini (al tempo locale) e con un
+    numero di battito tutto loro: gli altri sono errori del tracker."""
+    pos = np.flatnonzero(strong)
+    ok = np.zeros(times.size, dtype=bool)
+    ok[pos] = True
+    if pos.size >= 3:
+        t, n = times[pos], index[pos]
+        span = (n[2:] - n[:-2]).clip(min=1)
+        local_period = (t[2:] - t[:-2]) / span
+        expected = t[:-2] + local_period * (n[1:-1] - n[:-2])
+        ok[pos[1:-1]] = np.abs(t[1:-1] - expected) <= OUTLIER_BEATS * local_period
+    # Due battiti con lo stesso numero: resta il primo
+    ok[pos[1:][np.diff(index[pos]) <= 0]] = False
+    return ok
+
+
+def _bar_phase(feats: TrackFeatures, grid_frames: np.ndarray, beats_per_bar: int) -> int:
+    """Fase di battuta (0..beats_per_bar-1, relativa al primo battito della griglia).
+
+    Il primo battito della misura è quello con più accento di cassa/basso e con
+    il cambio armonico più netto (gli accordi cambiano in battere).
+    """
+    # Accento: picco della potenza di cassa e basso attorno al battito. Una nota di basso
+    # in battere si somma alla cassa; il flusso in dB no, perché ogni colpo di cassa
+    # porta già le bande basse dal fondo al massimo
+    n_frames = feats.bass_power.size
+    window = np.clip(grid_frames[:, None] + np.arange(-1, 3), 0, n_frames - 1)
+    accent = feats.bass_power[window].max(axis=1)
+
+    # Croma per battito dalla CQT sopra le ottave del basso (la cassa non c'entra),
+    # sommato sul battito e normalizzato: la distanza dal battito precedente è
+    # grande solo dove cambia l'accordo
+    upper = feats.cqt[12 * BASS_OCTAVES:, :n_frames] ** 2
+    chroma = upper.reshape(CQT_OCTAVES - BASS_OCTAVES, 12, -1).sum(axis=0)
+    starts = np.clip(grid_frames, 0, chroma.shape[1] - 1)
+    sums = np.add.reduceat(chroma, starts, axis=1)
+    beat_chroma = sums / (sums.sum(axis=0, keepdims=True) + 1e-12)
+    change = np.concatenate(([0.0], np.abs(np.diff(beat_chroma, axis=1)).sum(axis=0)))
+
+    score = _zscore(accent) + (change - change.mean()) / CHORD_CHANGE_SCALE
+    phase = np.arange(grid_frames.size) % beats_per_bar
+    totals = np.bincount(phase, weights=score, minlength=beats_per_bar)
+    return int(np.argmax(totals / np.bincount(phase, minlength=beats_per_bar).clip(min=1)))
+
+
+def fit_beatgrid(feats: TrackFeatures, start_bpm: Optional[float] = None,
+                 beats_per_bar: int = BEATS_PER_BAR) -> Optional[BeatGrid]:
+    """Stima la griglia a tempo costante di un brano; None se i battiti sono troppo pochi.
+
+    start_bpm (es. il BPM già stimato o quello di VirtualDJ) centra il beat tracker.
+    """
+    onset = feats.onset_env
+    fps = feats.sr / HOP_LENGTH
+    if start_bpm is None:
+        start_bpm = float(np.median(feats.tempo_curve))
+    _, beats = librosa.beat.beat_track(onset_envelope=onset, sr=feats.sr, hop_length=HOP_LENGTH,
+                                       start_bpm=start_bpm, tightness=BEAT_TIGHTNESS, trim=False)
+    if beats.size < MIN_BEATS:
+        return None
+
+    peaks = _refine_peaks(onset, beats)
+    times = (peaks - ONSET_LAG_FRAMES) / fps
+    weights = onset[np.round(peaks).astype(int).clip(0, onset.size - 1)] + 1e-6
+
+    # Solo i battiti con un attacco vero contano e pesano nella griglia
+    strong = weights >= WEAK_BEAT_RATIO * np.percentile(weights, 75)
+    if strong.sum() < MIN_BEATS:
+        strong[:] = True
+    index = count_beats(times, strong)
+    keep = consistent_beats(times, index, strong)
+    if keep.sum() < MIN_BEATS:
+        keep = strong
+    period, offset = _fit_line(index[keep], times[keep], weights[keep])
+    residual = times - (offset + period * index)
+
+    duration = onset.size / fps
+    n_first = int(np.ceil(-offset / period))
+    n_last = int(np.floor((duration - offset) / period))
+    grid_index = np.arange(n_first, n_last + 1)
+    grid_frames = np.round((offset + period * grid_index) * fps).astype(int)
+    phase = _bar_phase(feats, grid_frames, beats_per_bar)
+    n_downbeat = n_first + phase
+
+    # Scostamento medio dalla griglia, misura per misura (i battiti in levare prima
+    # del primo downbeat non appartengono a nessuna misura)
+    in_bar = keep & (index >= n_downbeat)
+    bar = (index[in_bar] - n_downbeat) // beats_per_bar
+    n_bars = int(np.ceil((n_last + 1 - n_downbeat) / beats_per_bar))
+    counts = np.bincount(bar, minlength=n_bars)[:n_bars]
+    sums = np.bincount(bar, weights=residual[in_bar], minlength=n_bars)[:n_bars]
+    with np.errstate(invalid='ignore'):
+        bar_drift = np.where(counts > 0, 1000.0 * sums / counts.clip(min=1), np.nan)
+
+    return BeatGrid(
+        bpm=60.0 / period,
+        first_beat=offset + period * n_first,
+        downbeat=offset + period * n_downbeat,
+        duration=duration,
+        beats_per_bar=beats_per_bar,
+        bar_drift=bar_drift,
+        rms_error_ms=float(1000.0 * np.sqrt(np.mean(residual[keep] ** 2))),
+        beats=times,
+        beat_numbers=index - n_first,
+        reliable=keep,
+    )
@@ -1,8 +1,13 @@
 import os
 import librosa
+import numpy as np
 import csv
 import json
 
+from scanner import scan_paths
+from streaming import is_long_track, stream_summary
+from track_analysis import match_key_profile
+
 def analyze_audio(file_path):
     """
     Analizza un file audio per determinare il BPM e la tonalità.
@@ -11,16 +16,24 @@ def analyze_audio(file_path):
     :return: Un dizionario contenente BPM e tonalità.
     """
     try:
-        # Carica il file audio con librosa
-        y, sr = librosa.load(file_path)
+        if is_long_track(file_path):
+            # Brani lunghi: lettura a blocchi con memoria costante
+            summary = stream_summary(file_path)
+            tempo = summary.tempo()
+            chroma_profile = summary.chroma_mean
+        else:
+            # Carica il file audio con librosa
+            y, sr = librosa.load(file_path)
+
+            # Calcola il BPM
+            onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+            tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr)
+            tempo = float(np.atleast_1d(tempo)[0])
 
-        # Calcola il BPM
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr)
+            chroma_profile = np.mean(librosa.feature.chroma_cens(y=y, sr=sr), axis=1)
 
-        # Calcola la tonalità (key) usando librosa
-        chroma = librosa.feature.chroma_cens(y=y, sr=sr)
-        key = librosa.key.key(chroma)
+        # Calcola la tonalità (key) confrontando il profilo cromatico con i profili tonali
+        key = match_key_profile(chroma_profile)
 
         return {"file": os.path.basename(file_path), "bpm": tempo, "key": key}
 
@@ -28,20 +41,19 @@ def analyze_audio(file_path):
         print(f"Errore nell'analisi del file {file_path}: {e}")
         return None
 
-def analyze_directory(directory_path):
+def analyze_directory(directory_path, recursive=False):
     """
     Analizza tutti i file audio in una cartella specificata.
 
     :param directory_path: Percorso della cartella contenente i file audio.
+    :param recursive: Se True analizza anche le sottocartelle.
     :return: Una lista di dizionari contenenti i dettagli di BPM e tonalità per ogni brano.
     """
     results = []
-    for filename in os.listdir(directory_path):
-        if filename.endswith(('.mp3', '.wav')):
-            file_path = os.path.join(directory_path, filename)
-            result = analyze_audio(file_path)
-            if result:
-                results.append(result)
+    for file_path in scan_paths(directory_path, recursive=recursive):
+        result = analyze_audio(file_path)
+        if result:
+            results.append(result)
     return results
 
 def save_results_to_csv(results, output_file):
@@ -77,12 +89,17 @@ def save_results_to_json(results, output_file):
         print(f"Errore durante il salvataggio dei risultati: {e}")
 
 if __name__ == "__main__":
-    # Modifica il percorso della cartella contenente i file audio
-    audio_directory = "D:/musica"  # Modifica con il percorso corretto
-    output_csv = "output.csv"      # Modifica con il nome del file di output CSV
-    output_json = "output.json"    # Modifica con il nome del file di output JSON
+    # Cartella e file di output da riga di comando (per l'analisi batch completa
+    # senza interfaccia grafica vedi anche: python -m djanalyzer analyze <cartella>)
+    import argparse
+    parser = argparse.ArgumentParser(description="Analisi BPM e tonalità di una cartella")
+    parser.add_argument("audio_directory", help="Cartella contenente i file audio")
+    parser.add_argument("--csv", default="output.csv", help="File di output CSV")
+    parser.add_argument("--json", default="output.json", help="File di output JSON")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Include le sottocartelle")
+    args = parser.parse_args()
 
     # Analizza la cartella e salva i risultati in CSV e JSON
-    results = analyze_directory(audio_directory)
-    save_results_to_csv(results, output_csv)
-    save_results_to_json(results, output_json)
+    results = analyze_directory(args.audio_directory, args.recursive)
+    save_results_to_csv(results, args.csv)
+    save_results_to_json(results, args.json)
@@ -0,0 +1,159 @@
+"""
+Brani "ponte" per le transizioni che rompono le regole armoniche.
+
+Dal readme: quando tra due canzoni consecutive il salto di BPM supera la
+tolleranza (o le chiavi non sono compatibili), il programma inserisce il
+brano più vicino che riaggancia il mixaggio armonico. Qui la libreria viene
+indicizzata una volta sola per (codice Camelot, fascia di BPM larga
+BPM_TOLERANCE): una ricerca legge solo le poche celle compatibili con i due
+brani (al massimo 4 codici x 3 fasce) invece di scorrere l'intera libreria,
+e i candidati vengono valutati in blocco con gli stessi costi di harmony_opt.
+
+Si prova prima un ponte di un solo brano (A -> X -> B), poi di due
+(A -> X -> Y -> B).
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from harmony_opt import (BPM_TOLERANCE, UNKNOWN_KEY, camelot_cost_table, camelot_indices,
+                         is_good_transition, pair_costs)
+from track_analysis import AnalysisResult
+from vdj_database import path_key
+
+# Candidati tenuti per lato nella ricerca a due brani (la matrice X x Y resta piccola)
+TWO_HOP_CANDIDATES = 32
+
+
+class BridgeIndex:
+    """Libreria indicizzata per (codice Camelot, fascia di BPM)."""
+
+    def __init__(self, library: Iterable[AnalysisResult], bucket_bpm: float = BPM_TOLERANCE):
+        tracks = [t for t in library if t.bpm and camelot_indices([t.camelot_code])[0] != UNKNOWN_KEY]
+        self.tracks = tracks
+        self.bucket_bpm = bucket_bpm
+        self.bpm = np.array([t.bpm for t in tracks], dtype=np.float32)
+        self.keys = camelot_indices([t.camelot_code for t in tracks])
+        self.energy = np.array([t.energy for t in tracks], dtype=np.float32)
+        # Stesso brano = stesso percorso o stesso nome di file (copie in cartelle diverse)
+        self._by_name: Dict[str, List[int]] = {}
+        for i, t in enumerate(tracks):
+            for name in {path_key(t._file_path), t.filename.lower()}:
+                self._by_name.setdefault(name, []).append(i)
+
+        # Celle contigue (stile CSR): brani ordinati per cella e offset di inizio
+        self.n_buckets = int(self.bpm.max() // bucket_bpm) + 2 if tracks else 1
+        cells = self.keys * self.n_buckets + (self.bpm // bucket_bpm).astype(np.intp)
+        self._order = np.argsort(cells, kind="stable")
+        self._starts = np.searchsorted(cells[self._order], np.arange(UNKNOWN_KEY * self.n_buckets + 1))
+
+        # Codici compatibili (costo chiave <= 1) per ogni codice
+        table = camelot_cost_table()[:UNKNOWN_KEY, :UNKNOWN_KEY]
+        self._compatible = [np.flatnonzero(row <= 1.0) for row in table]
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def same_tracks(self, track: AnalysisResult) -> List[int]:
+        """Indici dei brani della libreria che corrispondono a track."""
+        return (self._by_name.get(path_key(track._file_path), [])
+                + self._by_name.get(track.filename.lower(), []))
+
+    def _codes_for(self, track: AnalysisResult) -> np.ndarray:
+        key = camelot_indices([track.camelot_code])[0]
+        return np.arange(UNKNOWN_KEY) if key == UNKNOWN_KEY else self._compatible[key]
+
+    def candidates(self, codes: np.ndarray, bpm_low: float, bpm_high: float,
+                   used: Optional[np.ndarray] = None) -> np.ndarray:
+        """Indici dei brani con codice in codes e BPM in [bpm_low, bpm_high]."""
+        if not self.tracks or bpm_low > bpm_high:
+            return np.zeros(0, dtype=np.intp)
+        first = max(0, int(bpm_low // self.bucket_bpm))
+        last = min(self.n_buckets - 1, int(bpm_high // self.bucket_bpm))
+        if first > last:
+            return np.zeros(0, dtype=np.intp)
+        cells = (codes[:, None] * self.n_buckets + np.arange(first, last + 1)[None, :]).ravel()
+        slices = [self._order[self._starts[c]:self._starts[c + 1]] for c in cells]
+        idx = np.concatenate(slices) if slices else np.zeros(0, dtype=np.intp)
+        keep = (self.bpm[idx] >= bpm_low) & (self.bpm[idx] <= bpm_high)
+        if used is not None:
+            keep &= ~used[idx]
+        return idx[keep]
+
+    def _costs_from(self, a: AnalysisResult, idx: np.ndarray) -> np.ndarray:
+        ka = camelot_indices([a.camelot_code])[0]
+        return pair_costs(np.float32(a.bpm or 0), ka, np.float32(a.energy),
+                          self.bpm[idx], self.keys[idx], self.energy[idx])
+
+    def _costs_to(self, idx: np.ndarray, b: AnalysisResult) -> np.ndarray:
+        kb = camelot_indices([b.camelot_code])[0]
+        return pair_costs(self.bpm[idx], self.keys[idx], self.energy[idx],
+                          np.float32(b.bpm or 0), kb, np.float32(b.energy))
+
+    def find_bridge(self, a: AnalysisResult, b: AnalysisResult,
+                    used: Optional[np.ndarray] = None) -> Optional[Tuple[AnalysisResult, ...]]:
+        """Miglior ponte di uno o due brani tra a e b; None se la libreria non ne ha.
+
+        used (maschera booleana sulla libreria) esclude i brani già in playlist.
+        """
+        tol = BPM_TOLERANCE
+        a_bpm, b_bpm = a.bpm or 0, b.bpm or 0
+        codes_a, codes_b = self._codes_for(a), self._codes_for(b)
+
+        # Un brano: compatibile con entrambi e a distanza di BPM accettabile da entrambi
+        codes = np.intersect1d(codes_a, codes_b)
+        low = max(a_bpm, b_bpm) - tol if a_bpm and b_bpm else (a_bpm or b_bpm) - tol
+        high = min(a_bpm, b_bpm) + tol if a_bpm and b_bpm else (a_bpm or b_bpm) + tol
+        x = self.candidates(codes, low, high, used)
+        if x.size:
+            best = x[np.argmin(self._costs_from(a, x) + self._costs_to(x, b))]
+            return (self.tracks[best],)
+
+        # Due brani: X vicino ad a, Y vicino a b, X -> Y a sua volta armonico
+        x = self.candidates(codes_a, a_bpm - tol, a_bpm + tol, used)
+        y = self.candidates(codes_b, b_bpm - tol, b_bpm + tol, used)
+        if not x.size or not y.size:
+            return None
+        cost_x = self._costs_from(a, x)
+        cost_y = self._costs_to(y, b)
+        if x.size > TWO_HOP_CANDIDATES:
+            keep = np.argpartition(cost_x, TWO_HOP_CANDIDATES)[:TWO_HOP_CANDIDATES]
+            x, cost_x = x[keep], cost_x[keep]
+        if y.size > TWO_HOP_CANDIDATES:
+            keep = np.argpartition(cost_y, TWO_HOP_CANDIDATES)[:TWO_HOP_CANDIDATES]
+            y, cost_y = y[keep], cost_y[keep]
+        cost_xy = pair_costs(self.bpm[x][:, None], self.keys[x][:, None], self.energy[x][:, None],
+                             self.bpm[y][None, :], self.keys[y][None, :], self.energy[y][None, :])
+        valid = ((camelot_cost_table()[self.keys[x][:, None], self.keys[y][None, :]] <= 1.0)
+                 & (np.abs(self.bpm[x][:, None] - self.bpm[y][None, :]) <= tol)
+                 & (x[:, None] != y[None, :]))
+        total = np.where(valid, cost_x[:, None] + cost_xy + cost_y[None, :], np.inf)
+        i, j = np.unravel_index(np.argmin(total), total.shape)
+        if not np.isfinite(total[i, j]):
+            return None
+        return self.tracks[x[i]], self.tracks[y[j]]
+
+
+def insert_bridges(playlist: Sequence[AnalysisResult],
+                   index: BridgeIndex) -> Tuple[List[AnalysisResult], int]:
+    """Inserisce un ponte in ogni transizione non armonica che la libreria sa riparare.
+
+    Ogni brano della libreria viene usato al più una volta (e mai se è già in
+    playlist). Restituisce (nuova playlist, brani inseriti).
+    """
+    used = np.zeros(len(index), dtype=bool)
+    for track in playlist:
+        used[index.same_tracks(track)] = True
+
+    result: List[AnalysisResult] = []
+    inserted = 0
+    for pos, track in enumerate(playlist):
+        if pos > 0 and not is_good_transition(playlist[pos - 1], track):
+            bridge = index.find_bridge(playlist[pos - 1], track, used)
+            if bridge:
+                for b in bridge:
+                    used[index.same_tracks(b)] = True
+                result.extend(bridge)
+                inserted += len(bridge)
+        result.append(track)
+    return result, inserted
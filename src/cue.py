@@ -1,5 +1,81 @@
-from typing import List
+"""
+Hot cue automatici dalla struttura del brano (come da readme).
 
-def rileva_cue(path: str) -> List[float]:
-    """Ritorna lista di timestamp in secondi placeholder."""
-    return []
+Il primo cue è la prima battuta, da cui parte VirtualDJ; seguono il drop, gli
+ingressi della voce e le sezioni di sola ritmica o sola armonia (i punti più
+comodi per mixare), poi gli altri cambi di sezione, fino a MAX_HOT_CUES.
+"""
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from beatgrid import BeatGrid
+from cue_export import MAX_HOT_CUES
+from features import TrackFeatures
+from structure import LABEL_DROP, VOCAL_PRESENCE, TrackStructure, analizza_struttura
+
+# Distanza minima tra due cue (s): un cue vicino a uno più importante viene scartato
+MIN_CUE_GAP = 4.0
+
+# Etichette dei cue
+CUE_START = "Inizio"
+CUE_DROP = "Drop"
+CUE_VOICE = "Voce"
+CUE_DRUMS = "Solo ritmica"
+CUE_HARMONY = "Solo armonia"
+
+Cue = Dict[str, Union[float, str]]
+
+
+def _voice_entries(structure: TrackStructure) -> List[float]:
+    """Ingresso della voce in ogni sezione cantata (primo segmento che inizia nella sezione),
+    portato sul battito più vicino."""
+    starts = np.array([start for start, _ in structure.voice.segments])
+    entries = []
+    for s in structure.sections:
+        inside = starts[(starts >= s.start) & (starts < s.end)]
+        if s.vocal >= VOCAL_PRESENCE and inside.size:
+            entries.append(float(inside[0]))
+    if not entries or structure.beat_times.size == 0:
+        return entries
+    nearest = np.abs(structure.beat_times[None, :] - np.array(entries)[:, None]).argmin(axis=1)
+    return structure.beat_times[nearest].tolist()
+
+
+def cue_points(structure: TrackStructure, max_cues: int = MAX_HOT_CUES) -> List[Cue]:
+    """Cue {'time', 'label'} in ordine di importanza, poi ordinati nel tempo (il primo resta primo)."""
+    cues: List[Cue] = []
+
+    def add(time: Optional[float], label: str) -> None:
+        if time is None or len(cues) >= max_cues:
+            return
+        if all(abs(time - c['time']) >= MIN_CUE_GAP for c in cues):
+            cues.append({'time': round(float(time), 3), 'label': label})
+
+    sections = structure.sections
+    first = structure.downbeat if structure.downbeat is not None else (sections[0].start if sections else None)
+    add(first, CUE_START)
+    add(structure.drop, CUE_DROP)
+    for time in _voice_entries(structure):
+        add(time, CUE_VOICE)
+    for s in sections:
+        if s.drums and not s.tonal:
+            add(s.start, CUE_DRUMS)
+    for s in sections:
+        if s.tonal and not s.drums:
+            add(s.start, CUE_HARMONY)
+    for s in sections:
+        add(s.start, CUE_DROP if s.label == LABEL_DROP else s.label.capitalize())
+
+    return cues[:1] + sorted(cues[1:], key=lambda c: c['time'])
+
+
+def rileva_cue(path: str, feats: Optional[TrackFeatures] = None,
+               grid: Optional[BeatGrid] = None) -> List[Cue]:
+    """Fino a MAX_HOT_CUES cue {'time': secondi, 'label': nome} per il brano.
+
+    feats e grid permettono di riusare la STFT e la griglia già calcolate per le
+    altre analisi.
+    """
+    feats = feats or TrackFeatures(path).load()
+    return cue_points(analizza_struttura(feats, grid))
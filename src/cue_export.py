@@ -0,0 +1,271 @@
+"""
+Esportazione di cue e griglie ritmiche in più formati.
+
+Ogni formato è un writer registrato in WRITERS: riceve i brani uno alla volta
+(TrackCues) e scrive a flusso un unico documento per l'intero lotto, invece
+di un file per brano. L'XML è generato con escaping corretto (saxutils) e
+l'output passa da safe_io.atomic_write, quindi un'esportazione interrotta
+non lascia file a metà.
+
+Formati:
+    vdjcue    -> documento <vdj> con un <song> per brano (cue VirtualDJ)
+    vdjdb     -> aggiorna direttamente database.xml di VirtualDJ (vdj_database)
+    rekordbox -> collection XML importabile in rekordbox (POSITION_MARK / TEMPO)
+    serato    -> CSV stile Serato, una riga per cue
+    tracks    -> il formato <Tracks> storico di DJProTool
+"""
+import csv
+import io
+import os
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Mapping, Optional, Type, Union
+from urllib.parse import quote
+from xml.sax.saxutils import quoteattr
+
+from safe_io import atomic_write
+from vdj_database import VdjDatabase
+
+# Numero massimo di hot cue (VirtualDJ, rekordbox e Serato ne mostrano 8)
+MAX_HOT_CUES = 8
+
+# Byte riservati al numero di brani nell'header rekordbox, scritto a fine esportazione
+_ENTRIES_WIDTH = 10
+
+
+@dataclass
+class CuePoint:
+    time: float        # Secondi dall'inizio del brano
+    label: str = ""
+    num: int = 0       # Numero di hot cue (1..8); 0 = assegnato in ordine
+
+
+@dataclass
+class TrackCues:
+    """Cue e griglia di un brano da esportare."""
+    file_path: str
+    cues: List[CuePoint] = field(default_factory=list)
+    bpm: Optional[float] = None
+    beatgrid: Optional[float] = None   # Posizione (s) del primo battito
+    key: Optional[str] = None
+    duration: Optional[float] = None
+
+
+def to_cue_points(cues: Iterable[Union[float, Mapping, CuePoint]]) -> List[CuePoint]:
+    """Normalizza cue come tempi, dict {'time', 'label'} (es. da rileva_cue) o CuePoint,
+    numerandoli da 1 e tenendone al massimo MAX_HOT_CUES."""
+    points = []
+    for num, cue in enumerate(cues, start=1):
+        if num > MAX_HOT_CUES:
+            break
+        if isinstance(cue, CuePoint):
+            points.append(CuePoint(cue.time, cue.label or f"Cue {num}", cue.num or num))
+        elif isinstance(cue, Mapping):
+            points.append(CuePoint(float(cue['time']), cue.get('label') or f"Cue {num}", num))
+        else:
+            points.append(CuePoint(float(cue), f"Cue {num}", num))
+    return points
+
+
+def _attrs(**attrs) -> str:
+    """Attributi XML con escaping; i valori None vengono omessi."""
+    return " ".join(f"{name}={quoteattr(str(value))}" for name, value in attrs.items()
+                    if value is not None)
+
+
+# =============================================
+# Writer
+# =============================================
+
+WRITERS: Dict[str, Type["CueWriter"]] = {}
+
+
+def register_writer(cls: Type["CueWriter"]) -> Type["CueWriter"]:
+    """Decoratore: rende disponibile un writer con il suo nome di formato."""
+    WRITERS[cls.name] = cls
+    return cls
+
+
+class CueWriter:
+    """Writer a flusso: begin(), write_track() per ogni brano, end().
+
+    Si usa come context manager; il documento sostituisce atomicamente il file
+    di destinazione solo se l'esportazione termina senza errori.
+    """
+    name = ""
+    extension = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._stack: Optional[ExitStack] = None
+        self._out = None
+
+    def __enter__(self) -> "CueWriter":
+        self._stack = ExitStack()
+        raw = self._stack.enter_context(atomic_write(self.path, backups=0))
+        self._out = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        self._stack.callback(self._out.detach)  # Il file binario lo chiude atomic_write
+        self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            try:
+                self.end()
+                self._out.flush()
+            except BaseException as e:
+                self._stack.__exit__(type(e), e, e.__traceback__)
+                raise
+        return self._stack.__exit__(exc_type, exc, tb)
+
+    def write(self, track: TrackCues) -> None:
+        self.write_track(track)
+        self.count += 1
+
+    def begin(self) -> None:
+        pass
+
+    def write_track(self, track: TrackCues) -> None:
+        raise NotImplementedError
+
+    def end(self) -> None:
+        pass
+
+
+@register_writer
+class VdjCueWriter(CueWriter):
+    """Cue VirtualDJ: un solo documento <vdj> con un <song> per brano."""
+    name = "vdjcue"
+    extension = ".vdjcue.xml"
+
+    def begin(self):
+        self._out.write('<?xml version="1.0" encoding="UTF-8"?>\n<vdj xmlns="http://www.virtualdj.com/">\n')
+
+    def write_track(self, track):
+        name = os.path.splitext(os.path.basename(track.file_path))[0]
+        bpm = f"{track.bpm:.2f}" if track.bpm else None
+        self._out.write(f"  <song {_attrs(name=name, path=track.file_path, bpm=bpm)}>\n")
+        if track.beatgrid is not None:
+            self._out.write(f'    <poi {_attrs(pos=f"{track.beatgrid:.6f}", type="beatgrid")}/>\n')
+        for cue in to_cue_points(track.cues):
+            self._out.write(f'    <poi {_attrs(pos=f"{cue.time:.3f}", type="cue", name=cue.label, num=cue.num, color=0)}/>\n')
+        self._out.write("  </song>\n")
+
+    def end(self):
+        self._out.write("</vdj>\n")
+
+
+@register_writer
+class RekordboxXmlWriter(CueWriter):
+    """Collection XML di rekordbox (File > Importa collection in formato xml)."""
+    name = "rekordbox"
+    extension = ".xml"
+
+    def begin(self):
+        self._out.write('<?xml version="1.0" encoding="UTF-8"?>\n<DJ_PLAYLISTS Version="1.0.0">\n')
+        self._out.write('  <PRODUCT Name="DJAnalyzer" Version="1.0" Company=""/>\n')
+        self._out.write('  <COLLECTION Entries="')
+        # Il numero di brani si conosce solo alla fine: si riserva lo spazio e lo si
+        # riscrive poi (cifre con zeri iniziali, sempre un intero valido)
+        self._out.flush()
+        self._entries_offset = self._out.buffer.tell()
+        self._out.write("0" * _ENTRIES_WIDTH + '">\n')
+
+    def write_track(self, track):
+        name, _ = os.path.splitext(os.path.basename(track.file_path))
+        location = "file://localhost/" + quote(track.file_path.replace("\\", "/").lstrip("/"), safe="/:")
+        bpm = f"{track.bpm:.2f}" if track.bpm else None
+        total = str(int(round(track.duration))) if track.duration else None
+        self._out.write(f"    <TRACK {_attrs(TrackID=self.count + 1, Name=name, Location=location, AverageBpm=bpm, Tonality=track.key, TotalTime=total)}>\n")
+        if track.bpm and track.beatgrid is not None:
+            self._out.write(f'      <TEMPO {_attrs(Inizio=f"{track.beatgrid:.3f}", Bpm=bpm, Metro="4/4", Battito=1)}/>\n')
+        for cue in to_cue_points(track.cues):
+            # Num 0-7 = hot cue A-H
+            self._out.write(f'      <POSITION_MARK {_attrs(Name=cue.label, Type=0, Start=f"{cue.time:.3f}", Num=cue.num - 1)}/>\n')
+        self._out.write("    </TRACK>\n")
+
+    def end(self):
+        self._out.write("  </COLLECTION>\n</DJ_PLAYLISTS>\n")
+        self._out.flush()
+        raw = self._out.buffer
+        end = raw.tell()
+        raw.seek(self._entries_offset)
+        raw.write(str(self.count).zfill(_ENTRIES_WIDTH).encode("ascii"))
+        raw.seek(end)
+
+
+@register_writer
+class SeratoCsvWriter(CueWriter):
+    """CSV stile Serato: una riga per cue (file, indice, posizione in ms, nome, BPM)."""
+    name = "serato"
+    extension = ".csv"
+
+    def begin(self):
+        self._csv = csv.writer(self._out)
+        self._csv.writerow(["file", "cue_index", "position_ms", "label", "bpm", "beatgrid_ms"])
+
+    def write_track(self, track):
+        bpm = f"{track.bpm:.2f}" if track.bpm else ""
+        grid = str(int(round(track.beatgrid * 1000))) if track.beatgrid is not None else ""
+        for cue in to_cue_points(track.cues):
+            self._csv.writerow([track.file_path, cue.num, int(round(cue.time * 1000)), cue.label, bpm, grid])
+
+
+@register_writer
+class TracksXmlWriter(CueWriter):
+    """Formato <Tracks> usato finora da DJProTool (cue_db/cues_*.xml)."""
+    name = "tracks"
+    extension = ".xml"
+
+    def begin(self):
+        self._out.write('<?xml version="1.0" encoding="UTF-8"?>\n<Tracks>\n')
+
+    def write_track(self, track):
+        self._out.write(f"  <Track {_attrs(file=os.path.basename(track.file_path))}>\n")
+        for cue in to_cue_points(track.cues):
+            self._out.write(f'    <Cue {_attrs(id=cue.num, time=cue.time, label=cue.label)}/>\n')
+        self._out.write("  </Track>\n")
+
+    def end(self):
+        self._out.write("</Tracks>\n")
+
+
+@register_writer
+class VdjDatabaseWriter(CueWriter):
+    """Scrive cue e griglia in database.xml di VirtualDJ: una lettura, aggiornamenti
+    in memoria e una sola scrittura atomica alla fine (con backup a rotazione)."""
+    name = "vdjdb"
+    extension = ".xml"
+
+    def __enter__(self):
+        self.db = VdjDatabase.load(self.path)
+        self.skipped: List[str] = []  # Brani né nel database né su disco
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self.db.modified:
+            self.db.save()
+        return False
+
+    def write(self, track):
+        if track.file_path not in self.db and not os.path.isfile(track.file_path):
+            self.skipped.append(track.file_path)
+            return
+        super().write(track)
+
+    def write_track(self, track):
+        cues = [{'time': c.time, 'label': c.label} for c in to_cue_points(track.cues)]
+        self.db.set_cues(track.file_path, cues)
+        if track.beatgrid is not None:
+            self.db.set_beatgrid(track.file_path, track.beatgrid, track.bpm)
+
+
+def export_cues(tracks: Iterable[TrackCues], fmt: str, path: str) -> int:
+    """Esporta tutti i brani nel formato indicato; restituisce il numero di brani scritti."""
+    if fmt not in WRITERS:
+        raise ValueError(f"Formato di esportazione cue sconosciuto: {fmt}")
+    with WRITERS[fmt](path) as writer:
+        for track in tracks:
+            writer.write(track)
+    return writer.count
@@ -0,0 +1,468 @@
+"""
+Analizzatore batch da riga di comando (senza Tkinter).
+
+Usa lo stesso nucleo della GUI (track_analysis + BatchEngine + LibraryStore),
+quindi i risultati coincidono con quelli di DJAnalyzer068GE. Pensato per
+girare di notte su una macchina senza display.
+
+USO (dalla cartella src, oppure con src nel PYTHONPATH):
+    python -m djanalyzer analyze <cartella> [-o cartella_output] [--workers N]
+                                 [--recursive] [--ext flac aiff ...] [--glob "*remix*" ...]
+                                 [--format csv json parquet]
+                                 [--profile standard] [--key-mode fast]
+                                 [--incremental] [--vdj prior|skip]
+    python -m djanalyzer import-vdj <database.xml> [-o cartella_output]
+    python -m djanalyzer playlist <cartella> [-o cartella_output] [--workers N]
+                                  [--recursive] [--library archivio.sqlite]
+    python -m djanalyzer loudness <cartella> [-o cartella_output] [--workers N]
+                                  [--recursive] [--target 89]
+    python -m djanalyzer normalize <cartella> [-o cartella_output] [--workers N]
+                                   [--recursive] [--target 89] [--dry-run] [--undo]
+
+Codici di uscita: 0 tutto analizzato, 1 almeno un file in errore,
+2 argomenti non validi o nessun file trovato, 130 interrotto con Ctrl+C.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from dataclasses import fields
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from features import ANALYSIS_PROFILES, DEFAULT_PROFILE
+from track_analysis import (AnalysisResult, KEY_MODES, DEFAULT_KEY_MODE,
+                            analyze_track, analyzer_version)
+from batch_engine import BatchEngine, default_workers
+from library_store import LibraryStore, DEFAULT_DB_NAME
+from scanner import AUDIO_EXTENSIONS, SCAN_WORKERS, scan
+from vdj_import import VDJ_MODES, import_vdj_database
+from harmony_opt import (PLAYLIST_NAME, REPORT_NAME as PLAYLIST_REPORT_NAME, RESULTS_DIR,
+                         is_good_transition, ottimizza_chiave, write_playlist, write_playlist_report)
+from bridges import BridgeIndex, insert_bridges
+from loudness import REFERENCE_DB, REPORT_NAME as LOUDNESS_REPORT_NAME, misura_loudness
+from loudness import write_report as write_loudness_report
+from mp3gain import REPORT_NAME as NORMALIZE_REPORT_NAME, is_mp3, normalizza_mp3, undo_gain
+from mp3gain import write_report as write_normalize_report
+
+OUTPUT_FORMATS = ("csv", "json", "parquet")
+RESULTS_BASENAME = "DJAnalyzer_Results"
+
+# Larghezza della barra di avanzamento (caratteri)
+BAR_WIDTH = 30
+
+
+# =============================================
+# Raccolta file e output
+# =============================================
+
+def result_rows(results: List[AnalysisResult]) -> List[Dict]:
+    """Righe di output: i campi pubblici di AnalysisResult più il percorso completo."""
+    columns = [f.name for f in fields(AnalysisResult) if not f.name.startswith('_')]
+    return [dict({c: getattr(r, c) for c in columns}, path=r._file_path) for r in results]
+
+
+def write_results(rows: List[Dict], output_dir: str, fmt: str) -> str:
+    """Scrive i risultati nel formato richiesto e restituisce il percorso del file."""
+    path = os.path.join(output_dir, f"{RESULTS_BASENAME}.{fmt}")
+    if fmt == "csv":
+        columns = list(rows[0]) if rows else [f.name for f in fields(AnalysisResult)
+                                              if not f.name.startswith('_')] + ["path"]
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    elif fmt == "json":
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=4)
+    elif fmt == "parquet":
+        # Dipendenza opzionale: pandas + pyarrow (o fastparquet)
+        import pandas as pd
+        pd.DataFrame(rows).to_parquet(path, index=False)
+    else:
+        raise ValueError(f"Formato di output sconosciuto: {fmt}")
+    return path
+
+
+# =============================================
+# Avanzamento
+# =============================================
+
+class ProgressBar:
+    """Barra di avanzamento testuale su stderr (una riga per file se stderr non è un terminale).
+
+    Con total None (scansione ancora in corso) mostra solo il conteggio.
+    """
+
+    def __init__(self, total: Optional[int] = None, stream=sys.stderr):
+        self.total = total
+        self.done = 0
+        self.errors = 0
+        self.stream = stream
+        self.interactive = stream.isatty()
+        self.start = time.monotonic()
+
+    def update(self, filename: str, failed: bool = False) -> None:
+        self.done += 1
+        self.errors += failed
+        progress = f"{self.done}/{self.total}" if self.total else str(self.done)
+        if self.interactive:
+            elapsed = time.monotonic() - self.start
+            if self.total:
+                filled = int(BAR_WIDTH * self.done / self.total)
+                eta = elapsed / self.done * (self.total - self.done)
+                head = f"[{'#' * filled}{'.' * (BAR_WIDTH - filled)}] {progress} ETA {eta:5.0f}s"
+            else:
+                head = f"{progress} brani in {elapsed:5.0f}s"
+            self.stream.write(f"\r{head} errori: {self.errors} {filename[:40]:<40}")
+        else:
+            state = "ERRORE" if failed else "ok"
+            self.stream.write(f"{progress} {state} {filename}\n")
+        self.stream.flush()
+
+    def close(self) -> None:
+        if self.interactive:
+            self.stream.write("\n")
+        self.stream.flush()
+
+
+def log(message: str) -> None:
+    print(message, file=sys.stderr)
+
+
+# =============================================
+# Comando analyze
+# =============================================
+
+def iter_analysis(files: Iterable, workers: int, profile: str, key_mode: str,
+                  vdj_mode: str = "prior") -> Iterator[tuple]:
+    """Messaggi del BatchEngine, stesso protocollo della results_queue della GUI."""
+    engine = BatchEngine(workers=workers,
+                         task=partial(analyze_track, profile=profile, key_mode=key_mode,
+                                      vdj_mode=vdj_mode))
+    return engine.iter_results(files)
+
+
+def cmd_analyze(args: argparse.Namespace) -> int:
+    if not os.path.isdir(args.directory):
+        log(f"Cartella non valida: {args.directory}")
+        return 2
+    output_dir = args.output or os.getcwd()
+    os.makedirs(output_dir, exist_ok=True)
+
+    results: List[AnalysisResult] = []
+    failures: List[str] = []
+    store: Optional[LibraryStore] = None
+    if args.incremental or args.vdj:
+        store = LibraryStore(os.path.join(output_dir, DEFAULT_DB_NAME),
+                             version=analyzer_version(args.profile, args.key_mode, args.vdj))
+        if args.vdj and not store.has_vdj_scans():
+            log("Nessun dato VirtualDJ in archivio: eseguire prima 'import-vdj'.")
+
+    # La scansione procede a flusso: l'analisi parte con i primi file trovati
+    scanned_stats = {}
+    counts = {"found": 0, "cached": 0}
+
+    def files_to_analyze() -> Iterator:
+        for entry in scan(args.directory, extensions=args.ext, recursive=args.recursive,
+                          workers=SCAN_WORKERS, patterns=args.glob):
+            counts["found"] += 1
+            if args.incremental:
+                result = store.lookup_entry(entry)
+                if result is not None:
+                    counts["cached"] += 1
+                    results.append(result)
+                    continue
+            scanned_stats[entry.path] = entry.stat
+            prior = store.vdj_scan(entry.path) if args.vdj else None
+            yield (entry.path, {"prior": prior}) if prior is not None else entry.path
+
+    progress = ProgressBar()
+    interrupted = False
+    try:
+        # Ogni risultato o errore è preceduto da uno status_update con il nome del file
+        current = ""
+        for kind, data in iter_analysis(files_to_analyze(), args.workers, args.profile,
+                                        args.key_mode, args.vdj or "prior"):
+            if kind == "status_update":
+                current = data
+            elif kind == "new_data":
+                results.append(data)
+                st = scanned_stats.pop(data._file_path, None)
+                if args.incremental:
+                    store.save(data, st=st)
+                progress.update(data.filename)
+            else:
+                failures.append(data)
+                progress.update(current, failed=True)
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        progress.close()
+        if store is not None:
+            store.close()
+
+    if counts["found"] == 0:
+        log("Nessun file audio trovato.")
+        return 2
+    if args.incremental:
+        log(f"Brani trovati: {counts['found']}, già in archivio: {counts['cached']}")
+    rows = result_rows(sorted(results, key=lambda r: r._file_path))
+    for fmt in args.format:
+        try:
+            log(f"Risultati salvati in: {write_results(rows, output_dir, fmt)}")
+        except Exception as e:
+            failures.append(f"Errore durante il salvataggio ({fmt}): {e}")
+
+    for message in failures:
+        log(message)
+    log(f"Analizzati: {len(results)}, errori: {len(failures)}")
+    if interrupted:
+        log("Analisi interrotta dall'utente.")
+        return 130
+    return 1 if failures else 0
+
+
+# =============================================
+# Comando import-vdj
+# =============================================
+
+def cmd_import_vdj(args: argparse.Namespace) -> int:
+    if not os.path.isfile(args.database):
+        log(f"database.xml non trovato: {args.database}")
+        return 2
+    output_dir = args.output or os.getcwd()
+    os.makedirs(output_dir, exist_ok=True)
+    with LibraryStore(os.path.join(output_dir, DEFAULT_DB_NAME)) as store:
+        count = import_vdj_database(store, args.database)
+    log(f"Importati da VirtualDJ: {count} brani")
+    return 0
+
+
+# =============================================
+# Comando playlist
+# =============================================
+
+def cmd_playlist(args: argparse.Namespace) -> int:
+    if not os.path.isdir(args.directory):
+        log(f"Cartella non valida: {args.directory}")
+        return 2
+    if args.library and not os.path.isfile(args.library):
+        log(f"Archivio non trovato: {args.library}")
+        return 2
+    output_dir = args.output or os.path.join(args.directory, RESULTS_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+
+    tracks = ottimizza_chiave(args.directory, recursive=args.recursive, workers=args.workers,
+                              db_path=os.path.join(output_dir, DEFAULT_DB_NAME))
+    if not tracks:
+        log("Nessun file audio trovato.")
+        return 2
+    bad = sum(not is_good_transition(a, b) for a, b in zip(tracks, tracks[1:]))
+    log(f"Brani: {len(tracks)}, transizioni non armoniche: {bad}")
+
+    if args.library and bad:
+        with LibraryStore(args.library) as store:
+            index = BridgeIndex(store.iter_results())
+        tracks, inserted = insert_bridges(tracks, index)
+        left = sum(not is_good_transition(a, b) for a, b in zip(tracks, tracks[1:]))
+        log(f"Brani ponte inseriti dalla libreria ({len(index)} brani): {inserted}, "
+            f"transizioni non armoniche rimaste: {left}")
+
+    playlist_path = os.path.join(output_dir, PLAYLIST_NAME)
+    write_playlist(tracks, playlist_path)
+    write_playlist_report(tracks, os.path.join(output_dir, PLAYLIST_REPORT_NAME))
+    log(f"Playlist salvata in: {playlist_path}")
+    return 0
+
+
+# =============================================
+# Comando loudness
+# =============================================
+
+def measure_folder(directory: str, db_path: str, workers: int, recursive: bool = False) -> List:
+    """Loudness dei brani della cartella: dall'archivio se già misurati, altrimenti in parallelo."""
+    entries = list(scan(directory, recursive=recursive))
+    results, missing = [], []
+    with LibraryStore(db_path) as store:
+        for entry in entries:
+            cached = store.lookup_loudness(entry.path, entry.stat)
+            if cached is None:
+                missing.append(entry)
+            else:
+                results.append(cached)
+        if missing:
+            log(f"Brani da misurare: {len(missing)} (già in archivio: {len(results)})")
+        stats = {e.path: e.stat for e in missing}
+        progress = ProgressBar(len(missing))
+        current = ""
+        engine = BatchEngine(workers=workers, task=misura_loudness)
+        try:
+            for kind, data in engine.iter_results([e.path for e in missing], total=len(missing)):
+                if kind == "status_update":
+                    current = data
+                elif kind == "new_data":
+                    store.save_loudness(data, st=stats.get(data.file_path))
+                    results.append(data)
+                    progress.update(os.path.basename(data.file_path))
+                else:
+                    log(data)
+                    progress.update(current, failed=True)
+        finally:
+            progress.close()
+    return sorted(results, key=lambda r: r.file_path)
+
+
+def cmd_loudness(args: argparse.Namespace) -> int:
+    if not os.path.isdir(args.directory):
+        log(f"Cartella non valida: {args.directory}")
+        return 2
+    output_dir = args.output or os.path.join(args.directory, RESULTS_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        results = measure_folder(args.directory, os.path.join(output_dir, DEFAULT_DB_NAME),
+                                 args.workers, args.recursive)
+    except KeyboardInterrupt:
+        log("Misura interrotta dall'utente.")
+        return 130
+    if not results:
+        log("Nessun file audio trovato.")
+        return 2
+    report_path = os.path.join(output_dir, LOUDNESS_REPORT_NAME)
+    write_loudness_report(results, report_path, args.target)
+    log(f"Report della loudness salvato in: {report_path}")
+    return 0
+
+
+# =============================================
+# Comando normalize
+# =============================================
+
+def cmd_normalize(args: argparse.Namespace) -> int:
+    if not os.path.isdir(args.directory):
+        log(f"Cartella non valida: {args.directory}")
+        return 2
+    engine = BatchEngine(workers=args.workers, task=undo_gain if args.undo else normalizza_mp3)
+
+    if args.undo:
+        files = [e.path for e in scan(args.directory, recursive=args.recursive) if is_mp3(e.path)]
+        restored = 0
+        for kind, data in engine.iter_results(files, total=len(files)):
+            if kind == "new_data":
+                restored += data != 0
+            elif kind == "error":
+                log(data)
+        log(f"Guadagno annullato in {restored} brani su {len(files)}")
+        return 0
+
+    output_dir = args.output or os.path.join(args.directory, RESULTS_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    measures = measure_folder(args.directory, os.path.join(output_dir, DEFAULT_DB_NAME),
+                              args.workers, args.recursive)
+    if not measures:
+        log("Nessun file audio trovato.")
+        return 2
+
+    reports, failures = [], 0
+    items = ((m.file_path, {"loudness": m, "target_db": args.target, "dry_run": args.dry_run})
+             for m in measures)
+    for kind, data in engine.iter_results(items, total=len(measures)):
+        if kind == "new_data":
+            reports.append(data)
+            if data.clipping:
+                log(f"SATURAZIONE: {os.path.basename(data.file_path)} fermato a "
+                    f"{data.gain_db:+.1f} dB invece di {data.wanted_db:+.1f} dB")
+        elif kind == "error":
+            failures += 1
+            log(data)
+    reports.sort(key=lambda r: r.file_path)
+    report_path = os.path.join(output_dir, NORMALIZE_REPORT_NAME)
+    write_normalize_report(reports, report_path)
+    log(f"Report della normalizzazione salvato in: {report_path}")
+    return 1 if failures else 0
+
+
+# =============================================
+# Entry point
+# =============================================
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="djanalyzer", description="DJAnalyzer da riga di comando")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    analyze = sub.add_parser("analyze", help="Analizza BPM, chiave ed energia di una cartella")
+    analyze.add_argument("directory", help="Cartella con i brani")
+    analyze.add_argument("-o", "--output", help="Cartella di output (default: cartella corrente)")
+    analyze.add_argument("-w", "--workers", type=int, default=default_workers(),
+                         help="Processi di analisi paralleli (default: tutti i core)")
+    analyze.add_argument("-r", "--recursive", action="store_true", help="Include le sottocartelle")
+    analyze.add_argument("-e", "--ext", nargs="+", default=sorted(AUDIO_EXTENSIONS), metavar="EXT",
+                         help="Estensioni accettate (default: formati audio comuni)")
+    analyze.add_argument("-g", "--glob", action="append", metavar="PATTERN",
+                         help="Pattern dei nomi di file (ripetibile)")
+    analyze.add_argument("-f", "--format", nargs="+", default=["csv"], choices=OUTPUT_FORMATS,
+                         help="Formati di output")
+    analyze.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(ANALYSIS_PROFILES))
+    analyze.add_argument("--key-mode", default=DEFAULT_KEY_MODE, choices=list(KEY_MODES))
+    analyze.add_argument("--incremental", action="store_true",
+                         help="Rianalizza solo file nuovi/modificati (archivio SQLite nella cartella di output)")
+    analyze.add_argument("--vdj", choices=VDJ_MODES,
+                         help="Usa i dati VirtualDJ importati: 'prior' come stima iniziale del tempo, "
+                              "'skip' al posto di BPM e chiave")
+    analyze.set_defaults(func=cmd_analyze)
+
+    import_vdj = sub.add_parser("import-vdj", help="Importa BPM, chiave e griglia dal database.xml di VirtualDJ")
+    import_vdj.add_argument("database", help="Percorso di database.xml")
+    import_vdj.add_argument("-o", "--output", help="Cartella dell'archivio (default: cartella corrente)")
+    import_vdj.set_defaults(func=cmd_import_vdj)
+
+    playlist = sub.add_parser("playlist", help="Ordina i brani di una cartella per mixaggio armonico")
+    playlist.add_argument("directory", help="Cartella con i brani")
+    playlist.add_argument("-o", "--output",
+                          help=f"Cartella di output (default: <cartella>/{RESULTS_DIR})")
+    playlist.add_argument("-w", "--workers", type=int, default=default_workers(),
+                          help="Processi di analisi paralleli (default: tutti i core)")
+    playlist.add_argument("-r", "--recursive", action="store_true", help="Include le sottocartelle")
+    playlist.add_argument("--library", metavar="ARCHIVIO",
+                          help="Archivio SQLite della libreria da cui pescare i brani ponte "
+                               "per le transizioni non armoniche")
+    playlist.set_defaults(func=cmd_playlist)
+
+    loudness = sub.add_parser("loudness", help="Misura loudness EBU R128, range e true peak di una cartella")
+    loudness.add_argument("directory", help="Cartella con i brani")
+    loudness.add_argument("-o", "--output",
+                          help=f"Cartella di output (default: <cartella>/{RESULTS_DIR})")
+    loudness.add_argument("-w", "--workers", type=int, default=default_workers(),
+                          help="Processi paralleli (default: tutti i core)")
+    loudness.add_argument("-r", "--recursive", action="store_true", help="Include le sottocartelle")
+    loudness.add_argument("--target", type=float, default=REFERENCE_DB,
+                          help="Livello desiderato in dB per la colonna del guadagno (default: 89)")
+    loudness.set_defaults(func=cmd_loudness)
+
+    normalize = sub.add_parser("normalize",
+                               help="Normalizza gli MP3 senza ricodifica (passi da 1.5 dB, come mp3gain)")
+    normalize.add_argument("directory", help="Cartella con i brani")
+    normalize.add_argument("-o", "--output",
+                           help=f"Cartella di output del report (default: <cartella>/{RESULTS_DIR})")
+    normalize.add_argument("-w", "--workers", type=int, default=default_workers(),
+                           help="Processi paralleli (default: tutti i core)")
+    normalize.add_argument("-r", "--recursive", action="store_true", help="Include le sottocartelle")
+    normalize.add_argument("--target", type=float, default=REFERENCE_DB,
+                           help="Livello desiderato in dB (default: 89, come ReplayGain)")
+    normalize.add_argument("--dry-run", action="store_true",
+                           help="Calcola il guadagno e scrive il report senza modificare i file")
+    normalize.add_argument("--undo", action="store_true",
+                           help="Annulla il guadagno applicato (anche da mp3gain)")
+    normalize.set_defaults(func=cmd_normalize)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
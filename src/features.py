@@ -0,0 +1,202 @@
+"""
+Contesto di feature per singolo brano.
+
+Il file viene decodificato una sola volta; STFT, inviluppo degli onset, CQT,
+cromagrammi e RMS vengono calcolati solo quando qualcuno li chiede e poi
+riutilizzati da tutti gli analizzatori (BPM, chiave, energia).
+"""
+from functools import cached_property
+from typing import Optional
+
+import numpy as np
+import librosa
+from scipy.ndimage import median_filter
+
+# Parametri di analisi comuni (gli stessi default di librosa)
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# Profili di analisi: sample rate a cui viene ricampionato il segnale in decodifica
+# (None = sample rate nativo). BPM, croma ed energia non guadagnano nulla oltre i 22 kHz.
+ANALYSIS_PROFILES = {
+    "fast": 11025,
+    "standard": 22050,
+    "precise": None,
+}
+DEFAULT_PROFILE = "standard"
+
+# Ricampionatore polifase (scipy.signal.resample_poly): veloce e senza artefatti
+# per i rapporti tipici 44.1k -> 22.05k / 11.025k
+RESAMPLE_TYPE = "polyphase"
+
+# CQT condivisa: 7 ottave da C1 (come chroma_cqt); le prime 3 sono il registro del basso
+CQT_OCTAVES = 7
+BASS_OCTAVES = 3
+
+# Croma per la chiave senza HPSS: mediana temporale sulle 12 classi cromatiche
+# (stesso kernel di 31 frame della HPSS di librosa, ma su 12 righe invece di 1025)
+# e scarto dei frame percussivi, quelli con l'inviluppo degli onset più alto.
+KEY_SMOOTHING_FRAMES = 31
+PERCUSSIVE_QUANTILE = 0.8
+
+# Finestra del tempogramma (la stessa ac_size di default di librosa.beat.tempo)
+TEMPOGRAM_SECONDS = 8.0
+
+# Banda della cassa e del basso per l'accento di battuta (downbeat)
+BASS_ONSET_FMAX = 150.0
+
+
+def load_audio(path: str, profile: str = DEFAULT_PROFILE, duration: Optional[float] = None,
+               offset: float = 0.0) -> tuple[np.ndarray, int]:
+    """Decodifica in mono e ricampiona una sola volta al sample rate del profilo."""
+    if profile not in ANALYSIS_PROFILES:
+        raise ValueError(f"Profilo di analisi sconosciuto: {profile}")
+    return librosa.load(path, sr=ANALYSIS_PROFILES[profile], mono=True, offset=offset,
+                        duration=duration, res_type=RESAMPLE_TYPE)
+
+
+class TrackFeatures:
+    """Feature di un brano calcolate pigramente e memorizzate."""
+
+    def __init__(self, path: Optional[str] = None, y: Optional[np.ndarray] = None,
+                 sr: Optional[int] = None, duration: Optional[float] = None,
+                 profile: str = DEFAULT_PROFILE):
+        if path is None and y is None:
+            raise ValueError("Serve il percorso del file oppure il segnale audio")
+        if y is not None and sr is None:
+            raise ValueError("Con il segnale audio serve anche il sample rate")
+        self.path = path
+        self.duration = duration
+        self.profile = profile
+        self._y = y
+        self._sr = sr
+
+    # --- Decodifica (una sola volta) ---
+
+    @cached_property
+    def _audio(self) -> tuple[np.ndarray, int]:
+        if self._y is not None:
+            return self._y, self._sr
+        return load_audio(self.path, self.profile, duration=self.duration)
+
+    def load(self) -> "TrackFeatures":
+        """Forza subito la decodifica, così un file illeggibile solleva l'errore qui."""
+        self._audio
+        return self
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._audio[0]
+
+    @property
+    def sr(self) -> int:
+        return self._audio[1]
+
+    # --- Trasformate ---
+
+    @cached_property
+    def stft(self) -> np.ndarray:
+        return librosa.stft(self.y, n_fft=N_FFT, hop_length=HOP_LENGTH)
+
+    @cached_property
+    def magnitude(self) -> np.ndarray:
+        return np.abs(self.stft)
+
+    @cached_property
+    def power(self) -> np.ndarray:
+        return self.magnitude ** 2
+
+    @cached_property
+    def cqt(self) -> np.ndarray:
+        """Modulo di un'unica CQT multi-ottava (da C1, 12 bin per ottava).
+
+        Da qui escono sia il croma completo sia il croma del basso (le ottave più
+        basse): una sola trasformata per brano invece di due.
+        """
+        tuning = librosa.estimate_tuning(S=self.magnitude, sr=self.sr, n_fft=N_FFT)
+        return np.abs(librosa.cqt(self.y, sr=self.sr, hop_length=HOP_LENGTH,
+                                  fmin=librosa.note_to_hz('C1'), n_bins=12 * CQT_OCTAVES,
+                                  bins_per_octave=12, tuning=tuning))
+
+    @cached_property
+    def bass_chroma(self) -> np.ndarray:
+        """Energia per classe cromatica nelle ottave basse (12 x frame, non normalizzata)."""
+        return self.cqt[:12 * BASS_OCTAVES].reshape(BASS_OCTAVES, 12, -1).sum(axis=0)
+
+    @cached_property
+    def mel_db(self) -> np.ndarray:
+        """Spettrogramma mel (dB) della STFT condivisa: onset e MFCC."""
+        mel = librosa.feature.melspectrogram(S=self.power, sr=self.sr)
+        return librosa.power_to_db(mel)
+
+    @cached_property
+    def onset_env(self) -> np.ndarray:
+        """Inviluppo degli onset calcolato dallo spettrogramma mel della STFT condivisa."""
+        return librosa.onset.onset_strength(S=self.mel_db, sr=self.sr, hop_length=HOP_LENGTH)
+
+    @cached_property
+    def bass_power(self) -> np.ndarray:
+        """Potenza per frame sotto BASS_ONSET_FMAX (cassa e basso), dalla STFT condivisa."""
+        freqs = librosa.fft_frequencies(sr=self.sr, n_fft=N_FFT)
+        return self.power[freqs <= BASS_ONSET_FMAX].sum(axis=0)
+
+    @cached_property
+    def tempogram(self) -> np.ndarray:
+        """Tempogramma di autocorrelazione a finestra scorrevole (lag in frame x frame)."""
+        win_length = int(librosa.time_to_frames(TEMPOGRAM_SECONDS, sr=self.sr, hop_length=HOP_LENGTH))
+        return librosa.feature.tempogram(onset_envelope=self.onset_env, sr=self.sr,
+                                         hop_length=HOP_LENGTH, win_length=win_length)
+
+    @cached_property
+    def tempo_curve(self) -> np.ndarray:
+        """Stima del tempo frame per frame (aggregate=None) dal tempogramma condiviso."""
+        return librosa.feature.tempo(tg=self.tempogram, sr=self.sr,
+                                     hop_length=HOP_LENGTH, aggregate=None)
+
+    def tempo_curve_around(self, start_bpm: float, tolerance_bpm: float) -> np.ndarray:
+        """Come tempo_curve, ma con la ricerca del tempo centrata su un valore già noto.
+
+        librosa misura la deviazione del prior in ottave (log2 del tempo), non in
+        BPM: una tolleranza di ±tolerance_bpm attorno a start_bpm va convertita.
+        """
+        std_octaves = np.log2((start_bpm + tolerance_bpm) / start_bpm)
+        return librosa.feature.tempo(tg=self.tempogram, sr=self.sr,
+                                     hop_length=HOP_LENGTH, start_bpm=start_bpm,
+                                     std_bpm=std_octaves, aggregate=None)
+
+    @cached_property
+    def y_harmonic(self) -> np.ndarray:
+        """Componente armonica (HPSS) ricostruita dalla STFT condivisa."""
+        harmonic_stft, _ = librosa.decompose.hpss(self.stft, margin=8)
+        return librosa.istft(harmonic_stft, hop_length=HOP_LENGTH, length=len(self.y))
+
+    @cached_property
+    def chroma(self) -> np.ndarray:
+        """Cromagramma CQT del segnale completo (normalizzato per frame come chroma_cqt)."""
+        chroma = self.cqt.reshape(CQT_OCTAVES, 12, -1).sum(axis=0)
+        return librosa.util.normalize(chroma, norm=np.inf, axis=0)
+
+    @cached_property
+    def harmonic_chroma(self) -> np.ndarray:
+        """Cromagramma CENS della sola componente armonica."""
+        return librosa.feature.chroma_cens(y=self.y_harmonic, sr=self.sr,
+                                           hop_length=HOP_LENGTH,
+                                           bins_per_octave=12, n_chroma=12)
+
+    @cached_property
+    def tonal_chroma(self) -> np.ndarray:
+        """Cromagramma CQT filtrato passa-basso nel tempo, senza i frame percussivi.
+
+        Alternativa economica a harmonic_chroma: niente HPSS né ISTFT, riusa il
+        croma CQT e l'inviluppo degli onset già calcolati per il BPM.
+        """
+        n = min(self.chroma.shape[1], self.onset_env.size)
+        chroma = median_filter(self.chroma[:, :n], size=(1, KEY_SMOOTHING_FRAMES), mode='nearest')
+        onset = self.onset_env[:n]
+        tonal = onset <= np.quantile(onset, PERCUSSIVE_QUANTILE)
+        return chroma[:, tonal] if tonal.any() else chroma
+
+    @cached_property
+    def rms(self) -> np.ndarray:
+        """RMS per frame (nel dominio del tempo, come librosa.feature.rms(y=...))."""
+        return librosa.feature.rms(y=self.y, frame_length=N_FFT, hop_length=HOP_LENGTH)[0]
@@ -1,3 +1,266 @@
-def ottimizza_chiave(folder: str) -> None:
-    """Esegue ottimizzazione chiave armonica placeholder."""
-    pass
+"""
+Ottimizzazione armonica della playlist (punto 3 del readme).
+
+Le canzoni vengono riordinate per un mixaggio armonico: BPM dal più basso al
+più alto con salti entro ±BPM_TOLERANCE, chiave compatibile con la precedente
+sulla ruota di Camelot (le stesse regole di find_compatible_keys) ed energia
+che sale senza cadute brusche.
+
+Il costo di ogni possibile transizione A -> B viene calcolato una volta sola
+in una matrice N x N, interamente con il broadcasting di numpy; l'ordine si
+cerca poi con una beam search (le BEAM_WIDTH sequenze parziali più economiche
+avanzano insieme, guardando avanti più di una scelta golosa) e lo si rifinisce
+con il 2-opt, che inverte tratti della sequenza finché il costo totale scende.
+Con 2000 brani tutto richiede pochi secondi.
+"""
+import csv
+import os
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from batch_engine import BatchEngine
+from library_store import DEFAULT_DB_NAME, LibraryStore
+from safe_io import clone_file
+from scanner import scan
+from track_analysis import CAMELOT_MAP, AnalysisResult, find_compatible_keys
+
+# Cartella dei risultati accanto ai brani (come da readme)
+RESULTS_DIR = "risultati"
+PLAYLIST_NAME = "playlist_armonica.m3u8"
+REPORT_NAME = "playlist_armonica.csv"
+
+# Differenza di BPM accettata tra due brani consecutivi
+BPM_TOLERANCE = 4.0
+
+# Costo chiave: stessa chiave 0, compatibile (find_compatible_keys) 1, altrimenti
+# KEY_CLASH_COST più la distanza sulla ruota; chiave sconosciuta: UNKNOWN_KEY_COST
+KEY_CLASH_COST = 3.0
+UNKNOWN_KEY_COST = 2.0
+
+# Costo BPM: entro la tolleranza cresce da 0 a 1; oltre parte da BPM_CLASH_COST.
+# Scendere di BPM costa un po' di più che salire (ordine dal più lento al più veloce)
+BPM_CLASH_COST = 4.0
+BPM_DESCENT_COST = 0.5
+
+# Costo energia per punto di scala (1-10): le cadute pesano il doppio delle salite
+ENERGY_STEP_COST = 0.2
+
+# Pesi delle tre componenti
+KEY_WEIGHT = 1.0
+BPM_WEIGHT = 1.0
+ENERGY_WEIGHT = 1.0
+
+# Sequenze parziali tenute dalla beam search e passate massime del 2-opt
+BEAM_WIDTH = 8
+TWO_OPT_PASSES = 4
+
+# Codici Camelot in ordine (1A, 1B, 2A, ...); l'indice in più è "chiave sconosciuta"
+CAMELOT_CODES = sorted(set(CAMELOT_MAP.values()), key=lambda c: (int(c[:-1]), c[-1]))
+_CODE_INDEX = {code: i for i, code in enumerate(CAMELOT_CODES)}
+UNKNOWN_KEY = len(CAMELOT_CODES)
+
+
+@lru_cache(maxsize=1)
+def camelot_cost_table() -> np.ndarray:
+    """Costo chiave per ogni coppia di codici Camelot (25 x 25, ultima riga/colonna = sconosciuta)."""
+    n = len(CAMELOT_CODES)
+    num = np.array([int(c[:-1]) for c in CAMELOT_CODES])
+    mode = np.array([c[-1] for c in CAMELOT_CODES])
+    ring = np.abs(num[:, None] - num[None, :])
+    ring = np.minimum(ring, 12 - ring)
+    table = np.full((n + 1, n + 1), UNKNOWN_KEY_COST)
+    table[:n, :n] = KEY_CLASH_COST + ring + (mode[:, None] != mode[None, :])
+    for i, code in enumerate(CAMELOT_CODES):
+        for compatible in find_compatible_keys(code):
+            table[i, _CODE_INDEX[compatible]] = 0.0 if compatible == code else 1.0
+    return table
+
+
+def camelot_indices(codes: Sequence[str]) -> np.ndarray:
+    return np.array([_CODE_INDEX.get(c, UNKNOWN_KEY) for c in codes], dtype=np.intp)
+
+
+def pair_costs(bpm_a: np.ndarray, key_a: np.ndarray, energy_a: np.ndarray,
+               bpm_b: np.ndarray, key_b: np.ndarray, energy_b: np.ndarray) -> np.ndarray:
+    """Costo delle transizioni a -> b; gli argomenti (array di BPM, indici Camelot,
+    energia) vengono combinati con il broadcasting di numpy."""
+    key_cost = camelot_cost_table().astype(np.float32)[key_a, key_b]
+
+    delta = bpm_b - bpm_a
+    gap = np.abs(delta) / BPM_TOLERANCE
+    bpm_cost = np.where(gap <= 1.0, gap, BPM_CLASH_COST + gap - 1.0)
+    bpm_cost = bpm_cost + BPM_DESCENT_COST * np.maximum(0.0, -delta) / BPM_TOLERANCE
+    bpm_cost = np.where((bpm_a > 0) & (bpm_b > 0), bpm_cost, 1.0)  # BPM sconosciuto: neutro
+
+    step = energy_b - energy_a
+    energy_cost = ENERGY_STEP_COST * (np.abs(step) + np.maximum(0.0, -step))
+
+    return KEY_WEIGHT * key_cost + BPM_WEIGHT * bpm_cost + ENERGY_WEIGHT * energy_cost
+
+
+def transition_costs(bpm: np.ndarray, codes: Sequence[str], energy: np.ndarray) -> np.ndarray:
+    """Matrice N x N del costo di passare dal brano i (riga) al brano j (colonna)."""
+    bpm = np.asarray(bpm, dtype=np.float32)
+    energy = np.asarray(energy, dtype=np.float32)
+    keys = camelot_indices(codes)
+    costs = pair_costs(bpm[:, None], keys[:, None], energy[:, None],
+                       bpm[None, :], keys[None, :], energy[None, :]).astype(np.float32)
+    np.fill_diagonal(costs, np.inf)
+    return costs
+
+
+def is_good_transition(a: AnalysisResult, b: AnalysisResult) -> bool:
+    """Transizione armonica: chiavi compatibili (o sconosciute) e BPM entro la tolleranza."""
+    ka, kb = camelot_indices([a.camelot_code, b.camelot_code])
+    key_ok = ka == UNKNOWN_KEY or kb == UNKNOWN_KEY or camelot_cost_table()[ka, kb] <= 1.0
+    bpm_ok = not (a.bpm and b.bpm) or abs(a.bpm - b.bpm) <= BPM_TOLERANCE
+    return bool(key_ok and bpm_ok)
+
+
+def path_cost(costs: np.ndarray, order: np.ndarray) -> float:
+    return float(costs[order[:-1], order[1:]].sum()) if len(order) > 1 else 0.0
+
+
+def beam_search(costs: np.ndarray, start: int, beam_width: int = BEAM_WIDTH) -> np.ndarray:
+    """Ordine di tutti i brani a partire da start, con una beam search sulla matrice dei costi."""
+    n = costs.shape[0]
+    visited = np.zeros((1, n), dtype=bool)
+    visited[0, start] = True
+    last = np.array([start])
+    total = np.zeros(1, dtype=np.float64)
+    parents, choices = [], []
+
+    for _ in range(n - 1):
+        candidates = total[:, None] + costs[last]
+        candidates[visited] = np.inf
+        flat = candidates.ravel()
+        k = min(beam_width, int(np.isfinite(flat).sum()))
+        best = np.argpartition(flat, k - 1)[:k] if k < flat.size else np.arange(flat.size)
+        beam, track = np.divmod(best, n)
+        visited = visited[beam]
+        visited[np.arange(k), track] = True
+        last, total = track, flat[best]
+        parents.append(beam)
+        choices.append(track)
+
+    # Ricostruzione all'indietro della sequenza migliore
+    order = np.empty(n, dtype=np.intp)
+    order[0] = start
+    b = int(np.argmin(total)) if n > 1 else 0
+    for step in range(n - 2, -1, -1):
+        order[step + 1] = choices[step][b]
+        b = parents[step][b]
+    return order
+
+
+def two_opt(costs: np.ndarray, order: np.ndarray, max_passes: int = TWO_OPT_PASSES) -> np.ndarray:
+    """Migliora l'ordine invertendo tratti della sequenza (il primo brano resta fisso).
+
+    La matrice non è simmetrica (salire di BPM costa meno che scendere): il costo
+    interno del tratto invertito si ottiene dalle somme cumulative dei costi
+    all'indietro, così ogni mossa si valuta per tutti i j in un colpo solo.
+    """
+    order = np.array(order, dtype=np.intp)
+    n = order.size
+    if n < 4:
+        return order
+    for _ in range(max_passes):
+        improved = False
+        for i in range(n - 2):
+            fw = np.concatenate(([0.0], np.cumsum(costs[order[:-1], order[1:]], dtype=np.float64)))
+            bw = np.concatenate(([0.0], np.cumsum(costs[order[1:], order[:-1]], dtype=np.float64)))
+            j = np.arange(i + 2, n)
+            a, b = order[i], order[i + 1]
+            nxt = np.append(order[j[:-1] + 1], -1)
+            has_next = nxt >= 0
+            removed = costs[a, b] + np.where(has_next, costs[order[j], nxt], 0.0)
+            added = costs[a, order[j]] + np.where(has_next, costs[b, nxt], 0.0)
+            delta = added - removed + (bw[j] - bw[i + 1]) - (fw[j] - fw[i + 1])
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-6:
+                jj = j[best]
+                order[i + 1:jj + 1] = order[i + 1:jj + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def order_playlist(tracks: Sequence[AnalysisResult], beam_width: int = BEAM_WIDTH) -> List[AnalysisResult]:
+    """Riordina i brani per il mixaggio armonico, partendo dal BPM più basso."""
+    if len(tracks) < 2:
+        return list(tracks)
+    bpm = np.array([t.bpm or 0 for t in tracks], dtype=np.float32)
+    energy = np.array([t.energy for t in tracks], dtype=np.float32)
+    costs = transition_costs(bpm, [t.camelot_code for t in tracks], energy)
+    # Primo brano: il più lento (a parità, il meno energico); BPM sconosciuti in fondo
+    start = int(np.lexsort((energy, np.where(bpm > 0, bpm, np.inf)))[0])
+    # La beam search non garantisce di battere la scelta golosa (larghezza 1): si
+    # parte dalla migliore delle due
+    order = min((beam_search(costs, start, width) for width in {1, beam_width}),
+                key=lambda o: path_cost(costs, o))
+    order = two_opt(costs, order)
+    return [tracks[i] for i in order]
+
+
+def transition_cost(a: AnalysisResult, b: AnalysisResult) -> float:
+    """Costo della singola transizione a -> b (stessa scala della matrice)."""
+    costs = transition_costs(np.array([a.bpm or 0, b.bpm or 0]), [a.camelot_code, b.camelot_code],
+                             np.array([a.energy, b.energy]))
+    return float(costs[0, 1])
+
+
+# =============================================
+# Cartella -> playlist ordinata
+# =============================================
+
+def ottimizza_chiave(folder: str, recursive: bool = False, workers: Optional[int] = None,
+                     db_path: Optional[str] = None) -> List[AnalysisResult]:
+    """Analizza (o recupera dall'archivio) i brani della cartella e li restituisce in ordine armonico."""
+    if db_path is None:
+        os.makedirs(os.path.join(folder, RESULTS_DIR), exist_ok=True)
+        db_path = os.path.join(folder, RESULTS_DIR, DEFAULT_DB_NAME)
+    entries = list(scan(folder, recursive=recursive))
+    stats = {e.path: e.stat for e in entries}
+    with LibraryStore(db_path) as store:
+        results, missing = store.partition(entries)
+        for kind, payload in BatchEngine(workers).iter_results(missing, total=len(missing)):
+            if kind == "new_data":
+                store.save(payload, st=stats.get(payload._file_path))
+                results.append(payload)
+            elif kind == "error":
+                print(payload)
+    return order_playlist(results)
+
+
+def write_playlist(tracks: Sequence[AnalysisResult], path: str) -> None:
+    """Playlist M3U estesa (UTF-8), con percorsi completi."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("#EXTM3U\n")
+        for t in tracks:
+            f.write(f"#EXTINF:-1,{os.path.splitext(t.filename)[0]} [{t.bpm} {t.camelot_code}]\n")
+            f.write(f"{t._file_path}\n")
+
+
+def write_playlist_report(tracks: Sequence[AnalysisResult], path: str) -> None:
+    """Report CSV dell'ordine con il costo di ogni transizione (0 = perfetta)."""
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['posizione', 'file', 'bpm', 'key', 'camelot', 'energia', 'costo_transizione'])
+        for pos, t in enumerate(tracks, start=1):
+            cost = f"{transition_cost(tracks[pos - 2], t):.2f}" if pos > 1 else ""
+            writer.writerow([pos, t.filename, t.bpm, t.key, t.camelot_code, t.energy, cost])
+
+
+def copia_in_ordine(tracks: Sequence[AnalysisResult], out_folder: str) -> List[str]:
+    """Replica i brani nella cartella nell'ordine della playlist ("001 - titolo.mp3", ...)."""
+    os.makedirs(out_folder, exist_ok=True)
+    width = max(3, len(str(len(tracks))))
+    paths = []
+    for pos, t in enumerate(tracks, start=1):
+        dst = os.path.join(out_folder, f"{pos:0{width}d} - {os.path.basename(t._file_path)}")
+        clone_file(t._file_path, dst)
+        paths.append(dst)
+    return paths
@@ -0,0 +1,87 @@
+"""
+Confronto vettoriale dei profili cromatici con le 24 tonalità.
+
+I 24 profili tonali (12 maggiori + 12 minori, ottenuti ruotando i profili di
+C) sono una matrice 24x12 già z-normalizzata: una sola moltiplicazione con il
+croma z-normalizzato dà tutte le 24 correlazioni di Pearson. Lo stesso calcolo
+accetta una matrice (brani x 12), così molti brani si valutano con una sola
+chiamata BLAS.
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+# Profili tonali per l'algoritmo avanzato di stima della chiave
+MAJOR_PROFILE_ADV = np.array([5.0, 2.0, 3.5, 2.1, 4.5, 4.0, 2.3, 4.9, 2.4, 3.7, 2.2, 3.0])
+MINOR_PROFILE_ADV = np.array([5.0, 2.7, 3.5, 5.4, 2.5, 3.5, 2.5, 4.8, 4.0, 2.7, 3.3, 3.2])
+
+NOTES_MAJOR_STD = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+NOTES_MINOR_STD = ['Cm', 'C#m', 'Dm', 'D#m', 'Em', 'Fm', 'F#m', 'Gm', 'G#m', 'Am', 'A#m', 'Bm']
+
+# Righe 0-11: tonalità maggiori con tonica C..B, righe 12-23: minori
+KEY_NAMES = NOTES_MAJOR_STD + NOTES_MINOR_STD
+KEY_TONICS = np.tile(np.arange(12), 2)
+
+# Bonus aggiunto alle tonalità la cui tonica coincide con la nota di basso
+BASS_WEIGHT = 0.3 # Valore empirico, da tarare
+
+
+def _zscore_rows(matrix: np.ndarray) -> np.ndarray:
+    """z-normalizza ogni riga (righe costanti -> zeri)."""
+    centered = matrix - matrix.mean(axis=-1, keepdims=True)
+    std = centered.std(axis=-1, keepdims=True)
+    return np.divide(centered, std, out=np.zeros_like(centered), where=std > 0)
+
+
+# Matrice 24x12 dei profili ruotati: la riga della tonica i è np.roll(profilo, i)
+_ROLL_INDEX = (np.arange(12)[None, :] - np.arange(12)[:, None]) % 12
+KEY_TEMPLATES = _zscore_rows(np.vstack([MAJOR_PROFILE_ADV[_ROLL_INDEX],
+                                        MINOR_PROFILE_ADV[_ROLL_INDEX]]))
+
+
+@dataclass
+class KeyMatch:
+    key: str            # Tonalità migliore (es. 'Am')
+    score: float        # Correlazione (più eventuale bonus del basso)
+    runner_up: str      # Seconda tonalità
+    confidence: float   # Margine tra migliore e seconda
+
+
+def score_keys(chroma: np.ndarray, bass_note_idx: Union[None, int, Sequence[Optional[int]]] = None) -> np.ndarray:
+    """Punteggi delle 24 tonalità: (12,) -> (24,), oppure (brani, 12) -> (brani, 24).
+
+    Il punteggio è la correlazione di Pearson tra il croma e il profilo tonale;
+    un croma piatto (senza informazione) vale -1 su tutte le tonalità.
+    """
+    chroma = np.asarray(chroma, dtype=float)
+    single = chroma.ndim == 1
+    chroma = np.atleast_2d(chroma)
+
+    z = _zscore_rows(chroma)
+    scores = z @ KEY_TEMPLATES.T / 12.0
+    scores[~z.any(axis=1)] = -1.0
+
+    if bass_note_idx is not None:
+        bass = np.atleast_1d(np.array(bass_note_idx, dtype=object))
+        bass = np.array([-1 if b is None else int(b) for b in bass])
+        scores = scores + BASS_WEIGHT * (KEY_TONICS[None, :] == bass[:, None])
+
+    return scores[0] if single else scores
+
+
+def match_keys(chroma: np.ndarray, bass_note_idx: Union[None, int, Sequence[Optional[int]]] = None
+               ) -> Union[KeyMatch, List[KeyMatch]]:
+    """Tonalità migliore, seconda e margine di confidenza per uno o più profili cromatici."""
+    scores = np.atleast_2d(score_keys(chroma, bass_note_idx))
+    # Le due tonalità migliori per riga, senza ordinare tutti i 24 punteggi
+    top2 = np.argpartition(-scores, 1, axis=1)[:, :2]
+    rows = np.arange(scores.shape[0])
+    swap = scores[rows, top2[:, 1]] > scores[rows, top2[:, 0]]
+    top2[swap] = top2[swap][:, ::-1]
+    best, second = top2[:, 0], top2[:, 1]
+
+    matches = [KeyMatch(key=KEY_NAMES[b], score=float(scores[r, b]),
+                        runner_up=KEY_NAMES[s], confidence=float(scores[r, b] - scores[r, s]))
+               for r, b, s in zip(rows, best, second)]
+    return matches[0] if np.asarray(chroma).ndim == 1 else matches
@@ -0,0 +1,260 @@
+"""
+Archivio SQLite della libreria analizzata.
+
+Ogni brano è registrato con percorso, dimensione, mtime e un hash veloce del
+contenuto, insieme ai campi di AnalysisResult e alla versione dell'analizzatore.
+Alla nuova scansione vengono rianalizzati solo i file nuovi o modificati
+(o analizzati con una versione diversa dell'algoritmo).
+
+La tabella vdj_scans contiene i dati importati dal database di VirtualDJ
+(vedi vdj_import.py), indicizzati per percorso normalizzato; la tabella
+loudness le misure EBU R128 (vedi loudness.py), valide finché il file non cambia.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from dataclasses import asdict, fields
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from track_analysis import AnalysisResult, analyzer_version
+from scanner import ScanEntry
+from vdj_database import path_key
+from vdj_import import VdjScan
+from loudness import LOUDNESS_VERSION, LoudnessResult
+
+# Nome di default del database, salvato nella cartella di output
+DEFAULT_DB_NAME = "DJAnalyzer_Library.sqlite"
+
+# Byte letti all'inizio, al centro e alla fine del file per l'hash veloce
+HASH_CHUNK = 64 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    path             TEXT PRIMARY KEY,
+    size             INTEGER NOT NULL,
+    mtime            REAL NOT NULL,
+    content_hash     TEXT NOT NULL,
+    analyzer_version TEXT NOT NULL,
+    analyzed_at      REAL NOT NULL,
+    result           TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tracks_hash ON tracks (content_hash, size);
+CREATE TABLE IF NOT EXISTS vdj_scans (
+    path_key     TEXT PRIMARY KEY,
+    file_path    TEXT NOT NULL,
+    bpm          REAL,
+    key          TEXT,
+    beatgrid     REAL,
+    song_length  REAL,
+    imported_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS loudness (
+    path              TEXT PRIMARY KEY,
+    size              INTEGER NOT NULL,
+    mtime             REAL NOT NULL,
+    loudness_version  TEXT NOT NULL,
+    measured_at       REAL NOT NULL,
+    integrated_lufs   REAL,
+    loudness_range_lu REAL,
+    true_peak_dbtp    REAL,
+    sample_peak_dbfs  REAL,
+    duration          REAL
+);
+"""
+
+# Righe scritte per transazione durante l'importazione da VirtualDJ
+IMPORT_BATCH = 5000
+
+
+def content_hash(path: str, size: Optional[int] = None) -> str:
+    """Hash veloce: dimensione + 64 KiB di testa, centro e coda (non legge tutto il file)."""
+    if size is None:
+        size = os.path.getsize(path)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(size).encode())
+    with open(path, 'rb') as f:
+        if size <= 3 * HASH_CHUNK:
+            h.update(f.read())
+        else:
+            for offset in (0, size // 2 - HASH_CHUNK // 2, size - HASH_CHUNK):
+                f.seek(offset)
+                h.update(f.read(HASH_CHUNK))
+    return h.hexdigest()
+
+
+class LibraryStore:
+    """Accesso all'archivio SQLite (una connessione per thread)."""
+
+    def __init__(self, db_path: str, version: Optional[str] = None):
+        self.db_path = db_path
+        # Versione algoritmo + profilo: i risultati di un'altra versione non valgono
+        self.version = version or analyzer_version()
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Lettura ---
+
+    def lookup(self, path: str, st: Optional[os.stat_result] = None) -> Optional[AnalysisResult]:
+        """Restituisce il risultato salvato se il file non è cambiato, altrimenti None."""
+        st = st or os.stat(path)
+        row = self.conn.execute(
+            "SELECT size, mtime, content_hash, result FROM tracks "
+            "WHERE path = ? AND analyzer_version = ?", (path, self.version)).fetchone()
+        if row is not None:
+            size, mtime, stored_hash, result_json = row
+            if size == st.st_size and mtime == st.st_mtime:
+                return self._load_result(path, result_json)
+            if size != st.st_size:
+                return None
+            # Stessa dimensione ma mtime diverso (es. copia o tag toccati): decide l'hash
+            if content_hash(path, st.st_size) != stored_hash:
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE tracks SET mtime = ? WHERE path = ?", (st.st_mtime, path))
+            return self._load_result(path, result_json)
+
+        # File mai visto con questo percorso: forse è stato spostato o rinominato
+        digest = content_hash(path, st.st_size)
+        row = self.conn.execute(
+            "SELECT result FROM tracks WHERE content_hash = ? AND size = ? AND analyzer_version = ?",
+            (digest, st.st_size, self.version)).fetchone()
+        if row is None:
+            return None
+        result = self._load_result(path, row[0])
+        self._write(path, st, digest, result)
+        return result
+
+    def partition(self, files: Iterable[Union[str, ScanEntry]]) -> Tuple[List[AnalysisResult], List[str]]:
+        """Divide i file in (risultati già in archivio, file da analizzare).
+
+        Accetta percorsi oppure voci dello scanner (il cui stat viene riusato).
+        """
+        cached, to_analyze = [], []
+        for item in files:
+            result = self.lookup_entry(item)
+            if result is None:
+                to_analyze.append(item.path if isinstance(item, ScanEntry) else item)
+            else:
+                cached.append(result)
+        return cached, to_analyze
+
+    def iter_results(self) -> Iterator[AnalysisResult]:
+        """Tutti i risultati in archivio analizzati con la versione corrente."""
+        rows = self.conn.execute("SELECT path, result FROM tracks WHERE analyzer_version = ?",
+                                 (self.version,))
+        for path, result_json in rows:
+            yield self._load_result(path, result_json)
+
+    def lookup_entry(self, item: Union[str, ScanEntry]) -> Optional[AnalysisResult]:
+        """lookup() per un percorso o una voce dello scanner; None anche se il file non è leggibile."""
+        path, st = (item.path, item.stat) if isinstance(item, ScanEntry) else (item, None)
+        try:
+            return self.lookup(path, st)
+        except OSError:
+            return None
+
+    # --- Scrittura ---
+
+    def save(self, result: AnalysisResult, path: Optional[str] = None,
+             st: Optional[os.stat_result] = None) -> None:
+        """Registra (o aggiorna) il risultato di un file appena analizzato.
+
+        st è lo stat letto prima dell'analisi (es. dallo scanner): se il file cambia
+        durante l'analisi, alla scansione successiva risulterà modificato.
+        """
+        path = path or result._file_path
+        st = st or os.stat(path)
+        self._write(path, st, content_hash(path, st.st_size), result)
+
+    def _write(self, path: str, st: os.stat_result, digest: str, result: AnalysisResult) -> None:
+        data = asdict(result)
+        data.pop('_file_path', None)  # Il percorso è già la chiave della riga
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO tracks "
+                "(path, size, mtime, content_hash, analyzer_version, analyzed_at, result) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime, digest, self.version, time.time(),
+                 json.dumps(data, ensure_ascii=False)))
+
+    # --- Dati importati da VirtualDJ ---
+
+    def save_vdj_scans(self, scans: Iterable[VdjScan]) -> int:
+        """Registra (o aggiorna) i dati VirtualDJ a lotti; restituisce le righe scritte."""
+        count = 0
+        batch: List[tuple] = []
+        now = time.time()
+
+        def flush():
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO vdj_scans "
+                    "(path_key, file_path, bpm, key, beatgrid, song_length, imported_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            batch.clear()
+
+        for scan in scans:
+            batch.append((path_key(scan.file_path), scan.file_path, scan.bpm, scan.key,
+                          scan.beatgrid, scan.song_length, now))
+            count += 1
+            if len(batch) >= IMPORT_BATCH:
+                flush()
+        if batch:
+            flush()
+        return count
+
+    def vdj_scan(self, path: str) -> Optional[VdjScan]:
+        """Dati VirtualDJ del brano, se importati."""
+        row = self.conn.execute(
+            "SELECT file_path, bpm, key, beatgrid, song_length FROM vdj_scans WHERE path_key = ?",
+            (path_key(path),)).fetchone()
+        return VdjScan(*row) if row is not None else None
+
+    def has_vdj_scans(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM vdj_scans LIMIT 1").fetchone() is not None
+
+    # --- Loudness ---
+
+    def lookup_loudness(self, path: str, st: Optional[os.stat_result] = None) -> Optional[LoudnessResult]:
+        """Misura di loudness salvata, se il file non è cambiato; altrimenti None."""
+        st = st or os.stat(path)
+        row = self.conn.execute(
+            "SELECT integrated_lufs, loudness_range_lu, true_peak_dbtp, sample_peak_dbfs, duration "
+            "FROM loudness WHERE path = ? AND size = ? AND mtime = ? AND loudness_version = ?",
+            (path, st.st_size, st.st_mtime, LOUDNESS_VERSION)).fetchone()
+        return LoudnessResult(path, *row) if row is not None else None
+
+    def save_loudness(self, result: LoudnessResult, st: Optional[os.stat_result] = None) -> None:
+        """Registra (o aggiorna) la misura di loudness di un file."""
+        st = st or os.stat(result.file_path)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO loudness "
+                "(path, size, mtime, loudness_version, measured_at, integrated_lufs, "
+                "loudness_range_lu, true_peak_dbtp, sample_peak_dbfs, duration) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (result.file_path, st.st_size, st.st_mtime, LOUDNESS_VERSION, time.time(),
+                 result.integrated_lufs, result.loudness_range_lu, result.true_peak_dbtp,
+                 result.sample_peak_dbfs, result.duration))
+
+    @staticmethod
+    def _load_result(path: str, result_json: str) -> AnalysisResult:
+        data = json.loads(result_json)
+        known = {f.name for f in fields(AnalysisResult)}
+        data = {k: v for k, v in data.items() if k in known}
+        data['filename'] = os.path.basename(path)
+        data['_file_path'] = path
+        return AnalysisResult(**data)
@@ -0,0 +1,270 @@
+"""
+Misura della loudness (EBU R128 / ITU-R BS.1770) per la normalizzazione.
+
+Il file viene letto a blocchi di qualche secondo con soundfile e ogni blocco
+passa una sola volta per tre accumulatori:
+
+- filtro K (shelving + passa-alto, coefficienti ricalcolati per il sample
+  rate del file) con lo stato del filtro portato da un blocco all'altro, e
+  potenza media per sotto-blocchi di 100 ms;
+- true peak: sovracampionamento 4x con un FIR polifase, tenendo gli ultimi
+  campioni del blocco precedente per non perdere i picchi a cavallo;
+- sample peak.
+
+Dai sotto-blocchi da 100 ms escono i blocchi da 400 ms (loudness integrata
+con gate assoluto a -70 LUFS e relativo a -10 LU) e quelli da 3 s (loudness
+range con gate relativo a -20 LU, differenza tra il 95° e il 10° percentile).
+In memoria restano un blocco di audio e un float ogni 100 ms.
+
+Il guadagno ReplayGain 2.0 porta il brano a -18 LUFS, che corrisponde agli
+89 dB del readme; per un livello diverso si sposta il riferimento di pari dB.
+
+misura_loudness è il task di un singolo brano: per una cartella lo si passa
+a BatchEngine(task=misura_loudness), che lo esegue su più processi.
+"""
+import csv
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
+import librosa
+import soundfile as sf
+from scipy import signal
+
+# Versione dell'algoritmo: le misure di un'altra versione vanno ripetute
+LOUDNESS_VERSION = "1.0"
+
+# Report CSV della cartella
+REPORT_NAME = "loudness_report.csv"
+
+# Durata dei blocchi letti dal disco (secondi)
+READ_SECONDS = 10.0
+
+# Sotto-blocco, blocco momentaneo e blocco a breve termine (secondi)
+STEP_SECONDS = 0.1
+MOMENTARY_STEPS = 4
+SHORT_TERM_STEPS = 30
+
+# Gate (BS.1770-4 e EBU Tech 3342)
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+LRA_RELATIVE_GATE_LU = -20.0
+LRA_PERCENTILES = (10.0, 95.0)
+
+# Pesi dei canali: L, R, C a 1, surround a +1.5 dB (l'LFE non si distingue, pesa 1)
+SURROUND_WEIGHT = 1.41
+
+# True peak: fattore di sovracampionamento e coefficienti per fase del FIR
+TRUE_PEAK_OVERSAMPLE = 4
+TRUE_PEAK_TAPS_PER_PHASE = 12
+# Campioni per tratto nella ricerca del true peak (almeno TRUE_PEAK_TAPS_PER_PHASE)
+TRUE_PEAK_CHUNK = 256
+
+# ReplayGain 2.0: -18 LUFS equivalgono a 89 dB SPL
+REPLAYGAIN_REFERENCE_LUFS = -18.0
+REFERENCE_DB = 89.0
+
+# Valore riportato per il silenzio (nessun blocco sopra il gate assoluto)
+SILENCE_LUFS = -70.0
+
+
+@dataclass
+class LoudnessResult:
+    """Misure di loudness di un brano."""
+    file_path: str
+    integrated_lufs: float = SILENCE_LUFS
+    loudness_range_lu: float = 0.0
+    true_peak_dbtp: float = -np.inf
+    sample_peak_dbfs: float = -np.inf
+    duration: float = 0.0
+
+    @property
+    def replaygain_db(self) -> float:
+        """Guadagno ReplayGain 2.0 (riferimento -18 LUFS = 89 dB)."""
+        return REPLAYGAIN_REFERENCE_LUFS - self.integrated_lufs
+
+    def gain_to_target(self, target_db: float = REFERENCE_DB) -> float:
+        """Guadagno (dB) per portare il brano al livello target_db (89 dB = ReplayGain)."""
+        return self.replaygain_db + (target_db - REFERENCE_DB)
+
+
+@lru_cache(maxsize=None)
+def k_weighting_sos(sr: int) -> np.ndarray:
+    """Filtro K di BS.1770 come sezioni del secondo ordine per il sample rate sr.
+
+    Stessa progettazione di libebur128: i due stadi sono ricavati dai parametri
+    analogici, così a 48 kHz si ottengono i coefficienti della norma.
+    """
+    # Stadio 1: shelving sulle alte (effetto della testa)
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = np.tan(np.pi * f0 / sr)
+    vh = 10.0 ** (gain_db / 20.0)
+    vb = vh ** 0.4996667741545416
+    a0 = 1.0 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2.0 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0]
+
+    # Stadio 2: passa-alto RLB
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * f0 / sr)
+    a0 = 1.0 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0]
+    return np.array([shelf, highpass])
+
+
+@lru_cache(maxsize=None)
+def true_peak_filter(oversample: int) -> np.ndarray:
+    """FIR di interpolazione per il true peak (guadagno unitario dopo l'inserimento di zeri)."""
+    taps = TRUE_PEAK_TAPS_PER_PHASE * oversample
+    return signal.firwin(taps, 1.0 / oversample, window=('kaiser', 8.0)) * oversample
+
+
+def block_true_peak(x: np.ndarray, fir: np.ndarray, oversample: int, floor: float) -> float:
+    """Massimo del segnale sovracampionato, calcolato solo dove può superare floor.
+
+    Un campione interpolato non supera il massimo dei campioni vicini moltiplicato
+    per la somma dei moduli della fase del FIR: i tratti più bassi di floor diviso
+    quel guadagno (la maggior parte del brano) non vanno sovracampionati.
+    x comincia con gli ultimi TRUE_PEAK_TAPS_PER_PHASE campioni del blocco precedente.
+    """
+    gain = max(np.abs(fir[p::oversample]).sum() for p in range(oversample))
+    level = np.abs(x).max(axis=1)
+    n_chunks = -(-len(level) // TRUE_PEAK_CHUNK)
+    chunk_max = np.zeros(n_chunks * TRUE_PEAK_CHUNK, dtype=level.dtype)
+    chunk_max[:len(level)] = level
+    hot = chunk_max.reshape(n_chunks, TRUE_PEAK_CHUNK).max(axis=1) * gain > floor
+    hot[1:] |= hot[:-1].copy()
+    hot[:-1] |= hot[1:].copy()
+
+    peak = 0.0
+    history = TRUE_PEAK_TAPS_PER_PHASE
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], hot.astype(np.int8), [0]))))
+    for first, last in zip(edges[::2], edges[1::2]):
+        start = max(0, first * TRUE_PEAK_CHUNK - history)
+        segment = x[start:last * TRUE_PEAK_CHUNK]
+        upsampled = signal.upfirdn(fir, segment, up=oversample, axis=0)
+        valid = upsampled[len(fir) - 1:len(segment) * oversample]
+        if valid.size:
+            peak = max(peak, float(np.abs(valid).max()))
+    return peak
+
+
+def channel_weights(n_channels: int) -> np.ndarray:
+    weights = np.ones(n_channels)
+    weights[3:5] = SURROUND_WEIGHT
+    return weights
+
+
+def _read_blocks(path: str, step: float) -> Tuple[int, Iterator[np.ndarray]]:
+    """(sample rate, blocchi frame x canali di circa READ_SECONDS, multipli di step secondi).
+
+    I formati che soundfile non legge (AAC/M4A, ...) passano da librosa, in memoria.
+    """
+    steps_per_block = int(round(READ_SECONDS / step))
+    try:
+        info = sf.info(path)
+    except Exception:
+        y, sr = librosa.load(path, sr=None, mono=False)
+        y = np.atleast_2d(y).T
+        size = int(round(step * sr)) * steps_per_block
+        return sr, (y[i:i + size] for i in range(0, len(y), size))
+    size = int(round(step * info.samplerate)) * steps_per_block
+    return info.samplerate, sf.blocks(path, blocksize=size, dtype='float32', always_2d=True)
+
+
+def _gated_mean(power: np.ndarray, relative_gate_lu: float) -> Tuple[np.ndarray, float]:
+    """Blocchi che superano i due gate e loudness media di quelli oltre il gate assoluto."""
+    loudness = -0.691 + 10.0 * np.log10(np.maximum(power, 1e-20))
+    above = power[loudness > ABSOLUTE_GATE_LUFS]
+    if above.size == 0:
+        return np.zeros(0), SILENCE_LUFS
+    threshold = -0.691 + 10.0 * np.log10(above.mean()) + relative_gate_lu
+    return power[(loudness > ABSOLUTE_GATE_LUFS) & (loudness > threshold)], threshold
+
+
+def _block_power(steps: np.ndarray, length: int) -> np.ndarray:
+    """Potenza dei blocchi di length sotto-blocchi, avanzando di un sotto-blocco."""
+    if steps.size < length:
+        return np.zeros(0)
+    cumulative = np.concatenate(([0.0], np.cumsum(steps)))
+    return (cumulative[length:] - cumulative[:-length]) / length
+
+
+def misura_loudness(path: str) -> LoudnessResult:
+    """Loudness integrata, loudness range, true peak e sample peak in una sola lettura del file."""
+    sr, blocks = _read_blocks(path, STEP_SECONDS)
+    step = int(round(STEP_SECONDS * sr))
+
+    sos = k_weighting_sos(sr)
+    oversample = TRUE_PEAK_OVERSAMPLE if sr < 96000 else 2 if sr < 192000 else 1
+    fir = true_peak_filter(oversample)
+    history = TRUE_PEAK_TAPS_PER_PHASE
+
+    zi = None
+    tail = None
+    weights = None
+    step_power = []
+    remainder = np.zeros((0, 1), dtype=np.float32)
+    true_peak = sample_peak = 0.0
+    n_samples = 0
+
+    for block in blocks:
+        if block.size == 0:
+            continue
+        if zi is None:
+            n_channels = block.shape[1]
+            zi = np.zeros((sos.shape[0], 2, n_channels))
+            tail = np.zeros((history, n_channels), dtype=block.dtype)
+            weights = channel_weights(n_channels)
+            remainder = np.zeros((0, n_channels), dtype=np.float32)
+        n_samples += len(block)
+        sample_peak = max(sample_peak, float(np.abs(block).max()))
+
+        # True peak: l'inizio del blocco è interpolato insieme alla coda del precedente
+        extended = np.concatenate((tail, block))
+        true_peak = max(true_peak, block_true_peak(extended, fir, oversample,
+                                                   max(true_peak, sample_peak)))
+        tail = extended[-history:]
+
+        # Filtro K e potenza per sotto-blocchi da 100 ms (il resto passa al blocco dopo)
+        weighted, zi = signal.sosfilt(sos, block, axis=0, zi=zi)
+        weighted = np.concatenate((remainder, weighted.astype(np.float32)))
+        usable = len(weighted) // step * step
+        remainder = weighted[usable:]
+        if usable:
+            frames = weighted[:usable].astype(np.float64).reshape(-1, step, weighted.shape[1])
+            mean_square = (frames ** 2).mean(axis=1)
+            step_power.append(mean_square @ weights)
+
+    result = LoudnessResult(file_path=path, duration=n_samples / sr if sr else 0.0)
+    if n_samples == 0:
+        return result
+    if sample_peak > 0:
+        result.sample_peak_dbfs = float(20.0 * np.log10(sample_peak))
+        result.true_peak_dbtp = float(20.0 * np.log10(max(true_peak, sample_peak)))
+
+    steps = np.concatenate(step_power) if step_power else np.zeros(0)
+    gated, _ = _gated_mean(_block_power(steps, MOMENTARY_STEPS), RELATIVE_GATE_LU)
+    if gated.size:
+        result.integrated_lufs = float(-0.691 + 10.0 * np.log10(gated.mean()))
+
+    short_term, _ = _gated_mean(_block_power(steps, SHORT_TERM_STEPS), LRA_RELATIVE_GATE_LU)
+    if short_term.size:
+        low, high = np.percentile(-0.691 + 10.0 * np.log10(short_term), LRA_PERCENTILES)
+        result.loudness_range_lu = float(high - low)
+    return result
+
+
+def write_report(results: Iterable[LoudnessResult], path: str, target_db: float = REFERENCE_DB) -> None:
+    """Report CSV della loudness (una riga per brano) con il guadagno per il livello scelto."""
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'loudness_lufs', 'range_lu', 'true_peak_dbtp', 'sample_peak_dbfs',
+                         'replaygain_db', f'guadagno_{target_db:g}db', 'durata'])
+        for r in results:
+            writer.writerow([os.path.basename(r.file_path), f"{r.integrated_lufs:.2f}",
+                             f"{r.loudness_range_lu:.2f}", f"{r.true_peak_dbtp:.2f}",
+                             f"{r.sample_peak_dbfs:.2f}", f"{r.replaygain_db:.2f}",
+                             f"{r.gain_to_target(target_db):.2f}", f"{r.duration:.1f}"])
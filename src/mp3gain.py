@@ -0,0 +1,354 @@
+"""
+Normalizzazione degli MP3 senza ricodifica, come mp3gain.
+
+Ogni granulo di un frame MPEG Layer III ha un campo global_gain di 8 bit nelle
+side info: aumentarlo di 1 alza il volume di 1.5 dB (un fattore 2^(1/4) in
+ampiezza) senza toccare i dati compressi, quindi senza perdita di qualità e
+alla velocità del disco. Il file viene mappato in memoria (mmap): un primo
+passaggio salta da un header di frame al successivo raccogliendo la
+posizione in bit di ogni global_gain, poi lettura e scrittura dei campi sono
+operazioni numpy su tutte le posizioni insieme.
+
+Le informazioni per annullare la modifica finiscono in un tag APEv2 in coda
+al file, con le stesse chiavi di mp3gain (MP3GAIN_UNDO, MP3GAIN_MINMAX), così
+i due programmi possono annullare l'uno le modifiche dell'altro. Come in
+mp3gain, MP3GAIN_UNDO registra i passi che annullano la modifica (l'opposto
+di quelli applicati).
+
+La modifica è sul posto: un file con più nomi (hard link) viene prima
+staccato dagli altri, che restano com'erano.
+
+Il guadagno viene scelto dalla misura di loudness (loudness.py): i brani che
+al livello richiesto andrebbero in saturazione vengono portati al livello più
+alto che non satura e segnalati (in rosso nella lista, come da readme).
+"""
+import csv
+import math
+import mmap
+import os
+import shutil
+import struct
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from loudness import REFERENCE_DB, LoudnessResult
+from safe_io import atomic_write
+
+# Un passo di global_gain = 1.5 dB
+GAIN_STEP_DB = 1.5
+
+# True peak massimo dopo la normalizzazione (oltre c'è saturazione)
+MAX_TRUE_PEAK_DBTP = 0.0
+
+# Report della normalizzazione
+REPORT_NAME = "normalizzazione_report.csv"
+
+# Esiti per brano
+STATUS_APPLIED = "normalizzato"
+STATUS_UNCHANGED = "invariato"
+STATUS_NOT_MP3 = "non mp3"
+
+# Chiavi APEv2 di mp3gain
+UNDO_KEY = "MP3GAIN_UNDO"
+MINMAX_KEY = "MP3GAIN_MINMAX"
+
+# Tabelle MPEG Layer III (kbps e Hz), per versione: 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+_BITRATES = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_BITRATES[0] = _BITRATES[2]
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+_APE_PREAMBLE = b"APETAGEX"
+_APE_FOOTER = struct.Struct("<8sIIII8x")
+_APE_VERSION = 2000
+_APE_HAS_HEADER = 0x80000000
+_APE_IS_HEADER = 0x20000000
+_ID3V1_SIZE = 128
+
+
+@dataclass
+class NormalizeReport:
+    """Esito della normalizzazione di un brano."""
+    file_path: str
+    status: str = STATUS_UNCHANGED
+    loudness_lufs: float = 0.0
+    wanted_db: float = 0.0      # Guadagno per arrivare al livello richiesto
+    gain_db: float = 0.0        # Guadagno applicato (multiplo di 1.5 dB)
+    clipping: bool = False      # Al livello richiesto andrebbe in saturazione
+
+
+# =============================================
+# Struttura del file
+# =============================================
+
+def _frame_info(buf, pos: int) -> Optional[Tuple[int, int, int, bool]]:
+    """(lunghezza, versione, canali, crc) del frame Layer III che inizia in pos, None se non valido."""
+    if pos + 4 > len(buf) or buf[pos] != 0xFF or buf[pos + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = buf[pos + 1], buf[pos + 2], buf[pos + 3]
+    version = (b1 >> 3) & 3
+    if version == 1 or (b1 >> 1) & 3 != 1:
+        return None
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+    if bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _BITRATES[version][bitrate_index] * 1000
+    rate = _SAMPLE_RATES[version][rate_index]
+    samples = 144 if version == 3 else 72
+    length = samples * bitrate // rate + ((b2 >> 1) & 1)
+    channels = 1 if b3 >> 6 == 3 else 2
+    return length, version, channels, not (b1 & 1)
+
+
+def _id3v2_end(buf) -> int:
+    """Fine dei tag ID3v2 in testa al file (0 se assenti)."""
+    pos = 0
+    while buf[pos:pos + 3] == b"ID3" and pos + 10 <= len(buf):
+        size = 0
+        for byte in buf[pos + 6:pos + 10]:
+            size = (size << 7) | (byte & 0x7F)
+        pos += 10 + size + (10 if buf[pos + 5] & 0x10 else 0)
+    return pos
+
+
+def read_ape_tag(buf) -> Tuple[Dict[str, Tuple[int, bytes]], int, int]:
+    """(voci {chiave: (flag, valore)}, inizio del tag, fine del tag) del tag APEv2 in coda.
+
+    Senza tag l'inizio e la fine coincidono con la fine dell'audio (prima dell'eventuale ID3v1).
+    """
+    end = len(buf)
+    if end >= _ID3V1_SIZE and buf[end - _ID3V1_SIZE:end - _ID3V1_SIZE + 3] == b"TAG":
+        end -= _ID3V1_SIZE
+    if end < _APE_FOOTER.size or buf[end - _APE_FOOTER.size:end - _APE_FOOTER.size + 8] != _APE_PREAMBLE:
+        return {}, end, end
+    _, _, size, count, flags = _APE_FOOTER.unpack(bytes(buf[end - _APE_FOOTER.size:end]))
+    items_start = end - size
+    start = items_start - (_APE_FOOTER.size if flags & _APE_HAS_HEADER else 0)
+    items: Dict[str, Tuple[int, bytes]] = {}
+    pos = items_start
+    for _ in range(count):
+        value_size, item_flags = struct.unpack_from("<II", buf, pos)
+        key_end = bytes(buf[pos + 8:pos + 8 + 256]).index(b"\0") + pos + 8
+        key = bytes(buf[pos + 8:key_end]).decode("ascii", "replace")
+        items[key] = (item_flags, bytes(buf[key_end + 1:key_end + 1 + value_size]))
+        pos = key_end + 1 + value_size
+    return items, start, end
+
+
+def _ape_tag_bytes(items: Dict[str, Tuple[int, bytes]]) -> bytes:
+    body = b"".join(struct.pack("<II", len(value), flags) + key.encode("ascii") + b"\0" + value
+                    for key, (flags, value) in items.items())
+    size = len(body) + _APE_FOOTER.size
+    header = _APE_FOOTER.pack(_APE_PREAMBLE, _APE_VERSION, size, len(items),
+                              _APE_HAS_HEADER | _APE_IS_HEADER)
+    footer = _APE_FOOTER.pack(_APE_PREAMBLE, _APE_VERSION, size, len(items), _APE_HAS_HEADER)
+    return header + body + footer
+
+
+def write_ape_items(path: str, update: Dict[str, Optional[str]]) -> None:
+    """Aggiorna le voci di testo del tag APEv2 (None cancella la voce; senza voci il tag sparisce)."""
+    with open(path, "r+b") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            items, start, end = read_ape_tag(data)
+            id3v1 = bytes(data[end:])
+        finally:
+            data.close()
+        for key, value in update.items():
+            if value is None:
+                items.pop(key, None)
+            else:
+                items[key] = (0, value.encode("utf-8"))
+        f.seek(start)
+        f.truncate()
+        if items:
+            f.write(_ape_tag_bytes(items))
+        f.write(id3v1)
+
+
+def gain_positions(buf) -> np.ndarray:
+    """Posizioni in bit (dall'inizio del file) di tutti i campi global_gain.
+
+    Il frame Xing/Info (o VBRI) in testa agli MP3 VBR non contiene audio e viene
+    saltato. Dopo un byte che non è un header valido si cerca il sync successivo.
+    """
+    _, end, _ = read_ape_tag(buf)
+    pos = _id3v2_end(buf)
+    positions: List[int] = []
+    first = True
+    while pos + 4 <= end:
+        info = _frame_info(buf, pos)
+        # Un header isolato può essere un falso sync: il frame successivo deve esistere
+        if info is None or (pos + info[0] + 4 <= end and _frame_info(buf, pos + info[0]) is None):
+            next_sync = buf.find(b"\xff", pos + 1, end)
+            if next_sync < 0:
+                break
+            pos = next_sync
+            continue
+        length, version, channels, crc = info
+        side = pos + 4 + (2 if crc else 0)
+        if version == 3:
+            side_bits = 136 if channels == 1 else 256
+            first_gain = 18 if channels == 1 else 20
+            granules, block = 2, 59
+        else:
+            side_bits = 72 if channels == 1 else 136
+            first_gain = 9 if channels == 1 else 10
+            granules, block = 1, 63
+        tag = bytes(buf[side + side_bits // 8:side + side_bits // 8 + 4])
+        is_header = first and (tag in (b"Xing", b"Info") or buf[pos + 36:pos + 40] == b"VBRI")
+        if not is_header and pos + length <= end:
+            for index in range(granules * channels):
+                positions.append(side * 8 + first_gain + index * block + 21)
+        first = False
+        pos += length
+    return np.array(positions, dtype=np.int64)
+
+
+def read_bits(data: np.ndarray, positions: np.ndarray, width: int = 8) -> np.ndarray:
+    """Campi di width bit (al massimo 17) a posizioni in bit qualsiasi."""
+    byte, offset = positions >> 3, positions & 7
+    window = ((data[byte].astype(np.uint32) << 16) | (data[byte + 1].astype(np.uint32) << 8)
+              | data[byte + 2])
+    return ((window >> (24 - offset - width).astype(np.uint32)) & ((1 << width) - 1)).astype(np.int32)
+
+
+def audible_gains(data: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Solo i global_gain dei granuli con dati audio (part2_3_length > 0).
+
+    Nei granuli vuoti (es. l'ultimo frame di riempimento di LAME) il campo non
+    conta e può valere anche 255: escluderli evita di bloccare il guadagno.
+    """
+    return positions[read_bits(data, positions - 21, 12) > 0]
+
+
+def write_gains(data: np.ndarray, positions: np.ndarray, gains: np.ndarray) -> None:
+    byte, shift = positions >> 3, (8 - (positions & 7)).astype(np.uint16)
+    pair = (data[byte].astype(np.uint16) << 8) | data[byte + 1]
+    pair = (pair & ~(np.uint16(0xFF) << shift)) | (gains.astype(np.uint16) << shift)
+    data[byte] = pair >> 8
+    data[byte + 1] = pair & 0xFF
+
+
+# =============================================
+# Guadagno e annullamento
+# =============================================
+
+def _parse_undo(items: Dict[str, Tuple[int, bytes]]) -> int:
+    """Passi già applicati secondo il tag di mp3gain.
+
+    Il tag contiene i passi che annullano la modifica: "-003,-003,N" = +3 passi applicati.
+    """
+    value = items.get(UNDO_KEY, (0, b""))[1].decode("ascii", "replace")
+    try:
+        return -int(value.split(",")[0])
+    except ValueError:
+        return 0
+
+
+def _break_hardlink(path: str) -> None:
+    """Se il file ha altri nomi (hard link) lo sostituisce con una sua copia, così la
+    modifica sul posto non tocca gli altri."""
+    if os.stat(path).st_nlink <= 1:
+        return
+    with open(path, "rb") as src, atomic_write(path, backups=0) as dst:
+        shutil.copyfileobj(src, dst)
+
+
+def apply_gain(path: str, steps: int) -> int:
+    """Aggiunge steps passi da 1.5 dB a tutti i global_gain del file; restituisce i passi applicati.
+
+    I passi vengono limitati perché nessun campo esca da 0..255: così l'annullamento
+    riporta il file esattamente com'era.
+    """
+    if steps == 0:
+        return 0
+    _break_hardlink(path)
+    with open(path, "r+b") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE)
+        try:
+            items, _, _ = read_ape_tag(data)
+            positions = gain_positions(data)
+            if positions.size == 0:
+                raise ValueError(f"Nessun frame MP3 Layer III in {path}")
+            array = np.frombuffer(data, dtype=np.uint8)
+            try:
+                positions = audible_gains(array, positions)
+                gains = read_bits(array, positions)
+                low, high = (int(gains.min()), int(gains.max())) if gains.size else (0, 255)
+                steps = int(np.clip(steps, -low, 255 - high))
+                if steps:
+                    write_gains(array, positions, gains + steps)
+                    data.flush()
+            finally:
+                del array
+        finally:
+            data.close()
+
+    if steps:
+        total = _parse_undo(items) + steps
+        minmax = items.get(MINMAX_KEY, (0, f"{low:03d},{high:03d}".encode()))[1].decode("ascii", "replace")
+        write_ape_items(path, {UNDO_KEY: f"{-total:+04d},{-total:+04d},N" if total else None,
+                               MINMAX_KEY: minmax if total else None})
+    return steps
+
+
+def undo_gain(path: str) -> int:
+    """Annulla il guadagno registrato nel tag (di questo programma o di mp3gain); restituisce i passi tolti."""
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            applied = _parse_undo(read_ape_tag(data)[0])
+        finally:
+            data.close()
+    return -apply_gain(path, -applied) if applied else 0
+
+
+def plan_gain(loudness: LoudnessResult, target_db: float = REFERENCE_DB,
+              max_true_peak: float = MAX_TRUE_PEAK_DBTP) -> Tuple[int, bool]:
+    """(passi da 1.5 dB, saturazione): il guadagno più vicino al livello richiesto che non satura.
+
+    Saturazione vera: al livello richiesto il true peak supererebbe max_true_peak,
+    quindi il brano si ferma sotto (e va segnalato in rosso).
+    """
+    wanted = int(round(loudness.gain_to_target(target_db) / GAIN_STEP_DB))
+    if not math.isfinite(loudness.true_peak_dbtp):
+        return wanted, False
+    safe = math.floor((max_true_peak - loudness.true_peak_dbtp) / GAIN_STEP_DB)
+    return (safe, True) if wanted > safe else (wanted, False)
+
+
+def is_mp3(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() == ".mp3"
+
+
+def normalizza_mp3(path: str, loudness: LoudnessResult,
+                   target_db: float = REFERENCE_DB, dry_run: bool = False) -> NormalizeReport:
+    """Porta un MP3 al livello target_db modificando i global_gain (task per BatchEngine)."""
+    wanted = loudness.gain_to_target(target_db)
+    steps, clipping = plan_gain(loudness, target_db)
+    report = NormalizeReport(file_path=path, loudness_lufs=round(loudness.integrated_lufs, 2),
+                             wanted_db=round(wanted, 2), clipping=clipping)
+    if not is_mp3(path):
+        report.status = STATUS_NOT_MP3
+        return report
+    applied = steps if dry_run else apply_gain(path, steps)
+    report.gain_db = applied * GAIN_STEP_DB
+    if applied and not dry_run:
+        report.status = STATUS_APPLIED
+    return report
+
+
+def write_report(reports: Iterable[NormalizeReport], path: str) -> None:
+    """Report CSV della normalizzazione (una riga per brano)."""
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'esito', 'loudness_lufs', 'guadagno_richiesto_db',
+                         'guadagno_applicato_db', 'saturazione'])
+        for r in reports:
+            writer.writerow([os.path.basename(r.file_path), r.status, r.loudness_lufs,
+                             r.wanted_db, r.gain_db, 'SI' if r.clipping else ''])
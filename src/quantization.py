@@ -1,3 +1,260 @@
-def quantizza_audio(path: str, out_folder: str) -> None:
-    """Salva versione quantizzata placeholder."""
-    pass
+"""
+Quantizzazione dei brani sulla griglia a tempo costante.
+
+Per ogni brano si calcola prima la mappa del tempo (tempo_map): un brano a
+tempo costante è già in griglia e viene solo copiato. Negli altri si stima la
+griglia (beatgrid) e si spostano sulla griglia solo i battiti che se ne
+discostano oltre la tolleranza. Le ancore (battiti prima e dopo) formano una
+mappa del tempo continua che un unico phase vocoder a rapporto variabile segue
+su tutto il segnale: la fase non riparte a ogni battito, quindi nessun clic
+alle giunzioni, e dove la mappa ha pendenza 1 il segnale resta quello
+originale. Il rendering avviene al sample rate e con i canali originali.
+
+Solo i brani effettivamente deformati vengono ricodificati, nello stesso
+contenitore e con lo stesso formato dei campioni (e bitrate per gli MP3)
+dell'originale quando soundfile lo sa scrivere; tutti gli altri finiscono
+nella cartella di output con un reflink o una copia veloce, senza
+decodifica né codifica.
+
+quantizza_audio è il task di un singolo brano: per una cartella lo si passa a
+BatchEngine(task=quantizza_audio), che lo esegue su più processi.
+"""
+import csv
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+import librosa
+import soundfile as sf
+
+from beatgrid import BeatGrid, fit_beatgrid
+from features import TrackFeatures
+from safe_io import clone_file
+from tempo_map import needs_quantization, tempo_map
+
+# Sottocartella di output (come da readme) e report della quantizzazione
+QUANTIZE_DIR = "quantizzazione"
+REPORT_NAME = "quantizzazione_report.csv"
+
+# Scostamento dalla griglia sotto il quale un battito resta dov'è (ms)
+TOLERANCE_MS = 15.0
+
+# Esiti per brano
+STATUS_QUANTIZED = "quantizzato"
+STATUS_ON_GRID = "in griglia"
+
+# Phase vocoder della deformazione (gli stessi valori di librosa.effects.time_stretch)
+# e frame elaborati per blocco, per limitare la memoria sui brani lunghi
+WARP_N_FFT = 2048
+WARP_HOP = 512
+WARP_BLOCK = 256
+
+# Ripiego per i contenitori che soundfile non sa scrivere (AAC/M4A, ...)
+FALLBACK_EXTENSION = ".wav"
+FALLBACK_SETTINGS = {"format": "WAV", "subtype": "PCM_16"}
+
+# Bitrate MP3 di libsndfile: compression_level 0 -> 320 kbps, 1 -> 32 kbps (lineare)
+MP3_MAX_KBPS = 320
+MP3_MIN_KBPS = 32
+
+
+@dataclass
+class QuantizeReport:
+    """Esito della quantizzazione di un brano."""
+    file_path: str
+    output_path: str = ""
+    status: str = STATUS_ON_GRID
+    bpm: float = 0.0
+    beats: int = 0              # Battiti rilevati
+    corrected_beats: int = 0    # Battiti spostati sulla griglia
+    max_deviation_ms: float = 0.0
+    method: str = ""            # render, reflink, copy
+
+    @property
+    def percent(self) -> float:
+        """Percentuale dei battiti quantizzati."""
+        return 100.0 * self.corrected_beats / self.beats if self.beats else 0.0
+
+
+def warp_anchors(grid: BeatGrid, duration: float,
+                 tolerance_ms: float = TOLERANCE_MS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Punti di ancoraggio della deformazione temporale: (sorgente s, destinazione s, corretto).
+
+    Ogni battito affidabile della griglia (grid.reliable: un attacco vero, in
+    linea con i battiti vicini) è un'ancora, per quanto lontano sia dalla griglia:
+    in un brano che accelera lo scostamento cresce misura dopo misura ed è proprio
+    quello da correggere. I battiti entro la tolleranza restano dove sono
+    (destinazione = sorgente), quelli oltre vanno sulla griglia. Gli errori del
+    beat tracker e i battiti deboli (breakdown senza batteria) non sono ancore: il
+    segmento che li contiene segue le ancore vicine.
+    """
+    deviation = grid.deviations()
+    valid = grid.reliable
+    corrected = valid & (np.abs(deviation) * 1000.0 > tolerance_ms)
+    beats = grid.beats[valid]
+    target = np.where(corrected[valid], grid.grid_times(grid.beat_numbers[valid]), beats)
+
+    # Inizio fisso; dopo l'ultimo battito la coda si sposta rigidamente
+    tail_shift = target[-1] - beats[-1] if beats.size else 0.0
+    src = np.concatenate(([0.0], beats, [duration]))
+    dst = np.concatenate(([0.0], target, [duration + tail_shift]))
+    moved = np.concatenate(([False], corrected[valid], [False]))
+    inside = (src > 0) & (src < duration) & (dst > 0)
+    inside[[0, -1]] = True
+    src, dst, moved = src[inside], dst[inside], moved[inside]
+    if np.any(np.diff(src) <= 0) or np.any(np.diff(dst) <= 0):
+        raise ValueError("Ancore della deformazione non strettamente crescenti")
+    return src, dst, moved
+
+
+def _nearest_peak(magnitude: np.ndarray) -> np.ndarray:
+    """Per ogni frame e ogni bin, l'indice del massimo locale dello spettro più vicino."""
+    n = magnitude.shape[-1]
+    bins = np.arange(n)
+    padded = np.pad(magnitude, [(0, 0)] * (magnitude.ndim - 1) + [(1, 1)])
+    is_peak = (magnitude >= padded[..., :-2]) & (magnitude > padded[..., 2:])
+    below = np.maximum.accumulate(np.where(is_peak, bins, -n), axis=-1)
+    above = np.flip(np.minimum.accumulate(np.flip(np.where(is_peak, bins, 2 * n), axis=-1), axis=-1), axis=-1)
+    return np.clip(np.where(bins - below <= above - bins, below, above), 0, n - 1)
+
+
+def _spectra(padded: np.ndarray, centers: np.ndarray, window: np.ndarray) -> np.ndarray:
+    """Spettri (..., frame, bin) delle finestre centrate sui campioni indicati."""
+    frames = np.lib.stride_tricks.sliding_window_view(padded, WARP_N_FFT, axis=-1)[..., centers, :]
+    return np.fft.rfft(frames * window, axis=-1)
+
+
+def render_warp(y: np.ndarray, sr: int, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """Applica la deformazione src -> dst con un'unica passata di phase vocoder a
+    rapporto variabile su tutto il segnale.
+
+    Ogni frame di uscita analizza la sorgente nel punto che la mappa gli assegna; la
+    fase si accumula da un frame all'altro (con l'aggancio ai picchi spettrali) e
+    viene riallineata alla sorgente sul frame più vicino a ogni ancora, così i colpi
+    cadono esattamente dove li vuole la griglia. Dove la mappa ha pendenza 1 la
+    ricostruzione coincide con l'originale.
+    """
+    src_idx = src * sr
+    dst_idx = np.round(dst * sr)
+    src_idx[-1] = y.shape[-1]
+    length = int(dst_idx[-1])
+    n_frames = length // WARP_HOP + 2
+    half = WARP_N_FFT // 2
+
+    # Oltre la fine la mappa prosegue a rapporto 1
+    times = np.arange(n_frames) * WARP_HOP
+    centers = np.round(np.interp(times, dst_idx, src_idx) + np.maximum(times - length, 0)).astype(int)
+    reset = np.zeros(n_frames, dtype=bool)
+    reset[np.round(dst_idx[1:-1] / WARP_HOP).astype(int)] = True
+    reset[0] = True
+
+    window = librosa.filters.get_window('hann', WARP_N_FFT, fftbins=True).astype(np.float32)
+    padded = np.pad(y, [(0, 0)] * (y.ndim - 1) + [(half, half + 4 * WARP_HOP)])
+    phi_advance = 2 * np.pi * WARP_HOP * np.arange(half + 1) / WARP_N_FFT
+    # Sovrapposizione e somma per righe di WARP_HOP campioni: ogni frame copre `overlap` righe
+    overlap = WARP_N_FFT // WARP_HOP
+    rows = np.zeros(y.shape[:-1] + (n_frames + overlap, WARP_HOP))
+    norm = np.zeros((n_frames + overlap, WARP_HOP))
+    for j, w2 in enumerate((window ** 2).reshape(overlap, WARP_HOP)):
+        norm[j:j + n_frames] += w2
+    phase_in = None
+    for first in range(0, n_frames, WARP_BLOCK):
+        block = slice(first, min(first + WARP_BLOCK, n_frames))
+        now = _spectra(padded, centers[block], window)
+        ahead = _spectra(padded, centers[block] + WARP_HOP, window)
+        analysis = np.angle(now)
+
+        # Fase accumulata con la frequenza istantanea di ogni bin; sui frame di
+        # riallineamento riparte dalla fase della sorgente
+        dphase = np.angle(ahead) - analysis - phi_advance
+        increment = phi_advance + dphase - 2 * np.pi * np.round(dphase / (2 * np.pi))
+        total = np.cumsum(increment, axis=-2) - increment
+        restart = reset[block].copy()
+        offset = analysis - total
+        if phase_in is not None and not restart[0]:
+            offset[..., 0, :] = phase_in
+            restart[0] = True
+        latest = np.maximum.accumulate(np.where(restart, np.arange(restart.size), 0))
+        phase = offset[..., latest, :] + total
+        phase_in = phase[..., -1, :] + increment[..., -1, :]
+
+        # Aggancio di fase (Laroche-Dolson): ogni bin segue il picco più vicino
+        # mantenendo lo scarto di fase dell'analisi
+        peak = _nearest_peak(np.abs(now))
+        phase = (np.take_along_axis(phase, peak, axis=-1) + analysis
+                 - np.take_along_axis(analysis, peak, axis=-1))
+        frames = np.fft.irfft(np.abs(now) * np.exp(1j * phase), n=WARP_N_FFT, axis=-1) * window
+        frames = frames.reshape(frames.shape[:-1] + (overlap, WARP_HOP))
+        for j in range(overlap):
+            rows[..., block.start + j:block.stop + j, :] += frames[..., j, :]
+    out = rows.reshape(y.shape[:-1] + (-1,)) / np.maximum(norm.reshape(-1), 1e-8)
+    out = out[..., half:half + length]
+    return out.astype(y.dtype)
+
+
+def mp3_compression_level(kbps: float) -> float:
+    """compression_level di soundfile per ottenere (circa) il bitrate indicato."""
+    level = (MP3_MAX_KBPS - kbps) / (MP3_MAX_KBPS - MP3_MIN_KBPS)
+    return float(np.clip(level, 0.0, 0.9))
+
+
+def encode_settings(path: str) -> Tuple[str, Dict[str, Any]]:
+    """Estensione e parametri di sf.write per riscrivere il brano nel suo formato originale."""
+    try:
+        info = sf.info(path)
+    except Exception:
+        return FALLBACK_EXTENSION, dict(FALLBACK_SETTINGS)
+    if not sf.check_format(info.format, info.subtype):
+        return FALLBACK_EXTENSION, dict(FALLBACK_SETTINGS)
+    settings: Dict[str, Any] = {"format": info.format, "subtype": info.subtype}
+    if info.format == "MP3" and info.duration > 0:
+        # Bitrate medio stimato dalla dimensione del file (tag e copertina compresi)
+        kbps = os.path.getsize(path) * 8 / info.duration / 1000
+        settings.update(bitrate_mode="CONSTANT", compression_level=mp3_compression_level(kbps))
+    return os.path.splitext(path)[1], settings
+
+
+def quantizza_audio(path: str, out_folder: str, tolerance_ms: float = TOLERANCE_MS) -> QuantizeReport:
+    """Quantizza un brano in out_folder; i brani già in griglia vengono copiati."""
+    os.makedirs(out_folder, exist_ok=True)
+    feats = TrackFeatures(path).load()
+    tmap = tempo_map(feats)
+    report = QuantizeReport(file_path=path, bpm=round(tmap.median_bpm, 2))
+
+    grid = fit_beatgrid(feats, start_bpm=tmap.median_bpm or None) if needs_quantization(tmap) else None
+    if grid is not None:
+        src, dst, moved = warp_anchors(grid, len(feats.y) / feats.sr, tolerance_ms)
+        report.bpm = round(grid.bpm, 2)
+        report.beats = int(grid.beats.size)
+        report.corrected_beats = int(moved.sum())
+        report.max_deviation_ms = round(float(np.abs(dst - src).max()) * 1000.0, 1)
+
+    if report.corrected_beats == 0:
+        # Niente da correggere: nessuna ricodifica, il file originale così com'è
+        report.output_path = os.path.join(out_folder, os.path.basename(path))
+        report.method = clone_file(path, report.output_path)
+        return report
+
+    # Rendering al sample rate e con i canali originali, nel formato dell'originale
+    y, sr = librosa.load(path, sr=None, mono=False)
+    warped = render_warp(y, sr, src, dst)
+    extension, settings = encode_settings(path)
+    base, _ = os.path.splitext(os.path.basename(path))
+    report.output_path = os.path.join(out_folder, base + extension)
+    sf.write(report.output_path, warped.T, sr, **settings)
+    report.status = STATUS_QUANTIZED
+    report.method = "render"
+    return report
+
+
+def write_report(reports: Iterable[QuantizeReport], path: str) -> None:
+    """Report CSV della quantizzazione (una riga per brano)."""
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'esito', 'bpm', 'battiti', 'battiti_quantizzati',
+                         'percentuale', 'scostamento_max_ms', 'metodo', 'output'])
+        for r in reports:
+            writer.writerow([os.path.basename(r.file_path), r.status, r.bpm, r.beats,
+                             r.corrected_beats, f"{r.percent:.1f}", r.max_deviation_ms,
+                             r.method, r.output_path])
@@ -0,0 +1,164 @@
+"""
+Scrittura sicura di file importanti (es. database.xml di VirtualDJ).
+
+Il contenuto viene scritto a flusso in un file temporaneo nella stessa
+cartella, sincronizzato su disco (fsync) e solo alla fine sostituisce
+l'originale con un rename atomico: un crash a metà scrittura lascia intatto
+il file precedente. Prima della sostituzione si tengono N copie di backup a
+rotazione e si controlla che nessun altro programma abbia modificato il file
+nel frattempo (mtime e dimensione).
+"""
+import os
+import shutil
+import stat
+import sys
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+# Copie di backup tenute a rotazione (file.bak1 = la più recente)
+DEFAULT_BACKUPS = 3
+
+# Buffer di scrittura: i serializzatori XML fanno molte write piccole
+WRITE_BUFFER = 1024 * 1024
+
+# ioctl FICLONE di Linux: reflink (copia copy-on-write) su btrfs, XFS, bcachefs, ...
+_FICLONE = 0x40049409
+
+# Firma di un file per rilevare modifiche concorrenti: (mtime in ns, dimensione)
+FileSignature = Tuple[int, int]
+
+
+class ConcurrentModificationError(RuntimeError):
+    """Il file è stato modificato da un altro programma dopo la lettura."""
+
+
+def file_signature(path: str) -> Optional[FileSignature]:
+    """(mtime_ns, dimensione) del file, None se non esiste."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def backup_path(path: str, index: int) -> str:
+    return f"{path}.bak{index}"
+
+
+def rotate_backups(path: str, backups: int = DEFAULT_BACKUPS) -> None:
+    """Sposta file.bakN-1 -> file.bakN ... e salva il file attuale come file.bak1.
+
+    Il file attuale resta al suo posto (hard link, o copia se il file system non
+    li supporta), così non c'è mai un istante in cui manca.
+    """
+    if backups <= 0 or not os.path.exists(path):
+        return
+    for index in range(backups - 1, 0, -1):
+        older = backup_path(path, index)
+        if os.path.exists(older):
+            os.replace(older, backup_path(path, index + 1))
+    newest = backup_path(path, 1)
+    if os.path.exists(newest):
+        os.remove(newest)
+    try:
+        os.link(path, newest)
+    except OSError:
+        shutil.copy2(path, newest)
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """Clona src in dst senza copiare i dati, se il file system lo permette (solo Linux)."""
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def _read_only(path: str) -> bool:
+    """Nessun permesso di scrittura sul file (per nessuno)."""
+    return not os.stat(path).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+def clone_file(src: str, dst: str, hardlink: bool = False) -> str:
+    """Copia src in dst nel modo più economico disponibile; restituisce il metodo usato.
+
+    Nell'ordine: reflink copy-on-write, copia (shutil usa sendfile/copy_file_range
+    dove disponibili). Con hardlink=True si prova prima un hard link, ma solo se
+    src è in sola lettura: i due nomi sono lo stesso file e una modifica sul
+    posto di uno (tag, guadagno MP3) cambierebbe anche l'altro.
+
+    Solleva ValueError se dst è lo stesso file di src (cartella di output uguale
+    a quella di input): rimuovere dst cancellerebbe l'originale. Se dst è solo un
+    altro nome dello stesso file (hard link o link simbolico) si rimuove senza rischi.
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        entry = os.path.join(os.path.realpath(os.path.dirname(os.path.abspath(dst))), os.path.basename(dst))
+        if os.path.normcase(entry) == os.path.normcase(os.path.realpath(src)):
+            raise ValueError(f"Origine e destinazione sono lo stesso file: {src}")
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if hardlink and _read_only(src):
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+    if _reflink(src, dst):
+        return "reflink"
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def _fsync_dir(directory: str) -> None:
+    """Rende persistente il rename (solo POSIX: su Windows le cartelle non si aprono)."""
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_write(path: str, backups: int = DEFAULT_BACKUPS,
+                 expected: Optional[FileSignature] = None) -> Iterator[BinaryIO]:
+    """Context manager che fornisce un file binario; all'uscita senza errori
+    il contenuto sostituisce atomicamente path.
+
+    expected è la firma (file_signature) letta quando il file è stato caricato:
+    se nel frattempo il file è cambiato solleva ConcurrentModificationError e
+    l'originale non viene toccato.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.",
+                                    suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb", buffering=WRITE_BUFFER) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+
+        if expected is not None and file_signature(path) != expected:
+            raise ConcurrentModificationError(
+                f"{path} è stato modificato da un altro programma dopo la lettura")
+
+        # Il temporaneo eredita i permessi dell'originale (mkstemp crea file 0600)
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        rotate_backups(path, backups)
+        os.replace(tmp_path, path)
+        _fsync_dir(directory)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
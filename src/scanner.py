@@ -0,0 +1,122 @@
+"""
+Scansione della libreria musicale.
+
+Percorre le cartelle con os.scandir (ricorsivamente, facoltativamente con più
+thread: su un NAS la latenza di rete domina e le cartelle si leggono bene in
+parallelo) e restituisce i file audio come generatore, così l'analisi può
+partire prima che la scansione finisca. Ogni voce porta con sé lo stat già
+letto (dimensione, mtime) da riusare nell'archivio della libreria, così nessun
+file viene letto con stat due volte.
+"""
+import fnmatch
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+# Estensioni audio riconosciute (confronto senza distinzione maiuscole/minuscole)
+AUDIO_EXTENSIONS = frozenset({
+    '.mp3', '.wav', '.aac', '.flac', '.aiff', '.aif', '.m4a', '.ogg',
+})
+
+# File più piccoli di così non sono brani (file vuoti, troncati, metadati di macOS "._*")
+MIN_FILE_SIZE = 16 * 1024
+
+# Thread consigliati per leggere le cartelle in parallelo (I/O, non CPU: ha senso
+# anche oltre il numero di core quando la libreria è su un disco di rete)
+SCAN_WORKERS = 8
+
+
+@dataclass(frozen=True)
+class ScanEntry:
+    """File audio trovato dalla scansione, con lo stat già letto."""
+    path: str
+    stat: os.stat_result
+
+    @property
+    def size(self) -> int:
+        return self.stat.st_size
+
+    @property
+    def mtime(self) -> float:
+        return self.stat.st_mtime
+
+
+def normalize_extensions(extensions: Iterable[str]) -> frozenset:
+    """Estensioni in minuscolo e con il punto iniziale ("flac" -> ".flac")."""
+    return frozenset(e.lower() if e.startswith('.') else '.' + e.lower() for e in extensions)
+
+
+def _scan_dir(path: str, extensions: frozenset, patterns: Optional[Sequence[str]], min_size: int,
+              max_size: Optional[int]) -> Tuple[List[ScanEntry], List[str]]:
+    """Legge una cartella: (file audio validi, sottocartelle)."""
+    files, subdirs = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    # Prima l'estensione (gratis), poi lo stat (una sola volta, in cache su DirEntry)
+                    name = entry.name.lower()
+                    if os.path.splitext(name)[1] not in extensions:
+                        continue
+                    if patterns and not any(fnmatch.fnmatchcase(name, p) for p in patterns):
+                        continue
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue  # Voce sparita o illeggibile durante la scansione
+                if st.st_size < min_size or (max_size is not None and st.st_size > max_size):
+                    continue
+                files.append(ScanEntry(entry.path, st))
+    except OSError as e:
+        print(f"Cartella non leggibile {path}: {str(e)}")
+    files.sort(key=lambda f: f.path)
+    subdirs.sort()
+    return files, subdirs
+
+
+def scan(roots: Union[str, Iterable[str]], extensions: Iterable[str] = AUDIO_EXTENSIONS,
+         recursive: bool = True, min_size: int = MIN_FILE_SIZE, max_size: Optional[int] = None,
+         workers: int = 1, patterns: Optional[Sequence[str]] = None) -> Iterator[ScanEntry]:
+    """Genera i file audio sotto una o più cartelle.
+
+    patterns (es. ["*remix*"]) restringe ulteriormente i nomi accettati, senza
+    distinzione maiuscole/minuscole.
+
+    Con workers > 1 le cartelle vengono lette in parallelo da un pool di thread
+    e l'ordine dei file segue il completamento delle cartelle; con un solo
+    worker l'ordine è deterministico (profondità, nomi ordinati).
+    """
+    if isinstance(roots, str):
+        roots = [roots]
+    extensions = normalize_extensions(extensions)
+    patterns = [p.lower() for p in patterns] if patterns else None
+    args = (extensions, patterns, min_size, max_size)
+
+    if workers <= 1:
+        stack = list(reversed(list(roots)))
+        while stack:
+            files, subdirs = _scan_dir(stack.pop(), *args)
+            yield from files
+            if recursive:
+                stack.extend(reversed(subdirs))
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_dir, root, *args) for root in roots}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                if recursive:
+                    pending.update(pool.submit(_scan_dir, d, *args) for d in subdirs)
+                yield from files
+
+
+def scan_paths(roots: Union[str, Iterable[str]], **kwargs) -> Iterator[str]:
+    """Come scan(), ma genera solo i percorsi."""
+    return (entry.path for entry in scan(roots, **kwargs))
@@ -0,0 +1,156 @@
+"""
+Qualità reale di un brano dalla banda del suo spettro (come spek).
+
+Gli encoder MP3/AAC tagliano le frequenze alte con un passa-basso che dipende
+dal bitrate (circa 16 kHz a 128 kbps, 19-20 kHz a 320 kbps): un file marcato
+320 kbps ma tagliato a 16 kHz è stato ricodificato da una sorgente scadente.
+
+Invece di uno spettrogramma completo si leggono al sample rate originale
+N_WINDOWS finestre sparse lungo il brano (seek di soundfile, senza decodificare
+il resto) e se ne media lo spettro di potenza. Il passa-basso di un encoder è un
+gradino netto: il livello medio sotto la frequenza supera di almeno CLIFF_DB
+tutto lo spettro oltre una breve banda di transizione, e la frequenza di taglio
+è l'ultima il cui livello sta ancora CLIFF_DB sopra quel fondo. Il calo
+naturale della musica verso gli acuti è graduale e non forma un gradino,
+quindi un brano a banda piena non ha taglio (Nyquist).
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import soundfile as sf
+
+# Finestre lette lungo il brano e loro lunghezza (campioni al sample rate originale)
+N_WINDOWS = 30
+WINDOW_SIZE = 4096
+
+# Inizio e fine del brano esclusi (silenzi, fade)
+EDGE_FRACTION = 0.05
+
+# Smussatura dello spettro medio (Hz) e frequenza sotto la quale non si cerca il taglio
+SMOOTH_HZ = 200.0
+MIN_CUTOFF_HZ = 1000.0
+
+# Gradino del taglio: livello medio nei BELOW_HZ sotto la frequenza contro il massimo
+# oltre TRANSITION_HZ sopra di essa
+CLIFF_DB = 25.0
+BELOW_HZ = 1000.0
+TRANSITION_HZ = 1000.0
+
+# Finestre più deboli di così (dBFS RMS) sono silenzio e non contano
+SILENCE_DB = -70.0
+
+# Giudizio sulla qualità
+QUALITY_OK = "ok"
+QUALITY_LOW = "bassa"          # Taglio da MP3 a basso bitrate
+QUALITY_FAKE = "sospetta"      # Bitrate (o formato lossless) dichiarato più alto della banda reale
+QUALITY_UNKNOWN = "n/d"
+
+# Taglio sotto il quale il brano è di bassa qualità (tipico dei 128 kbps e meno)
+LOW_QUALITY_KHZ = 16.5
+
+# Taglio atteso dai bitrate alti: sotto questo un file da HIGH_BITRATE_KBPS in su è sospetto
+FULL_BAND_KHZ = 19.0
+HIGH_BITRATE_KBPS = 256
+
+LOSSLESS_FORMATS = ("WAV", "AIFF", "FLAC", "WAVEX", "W64", "CAF", "RF64")
+
+
+@dataclass
+class QualityEstimate:
+    """Banda effettiva di un brano e giudizio."""
+    cutoff_khz: float = 0.0
+    nyquist_khz: float = 0.0
+    declared_kbps: float = 0.0     # Bitrate medio (dimensione / durata), 0 per i formati lossless
+    lossless: bool = False
+    verdict: str = QUALITY_UNKNOWN
+
+
+def average_spectrum(path: str, n_windows: int = N_WINDOWS,
+                     window_size: int = WINDOW_SIZE) -> Optional[np.ndarray]:
+    """Spettro di potenza medio (dB) delle finestre sparse non silenziose, None se non ce ne sono."""
+    window = np.hanning(window_size).astype(np.float32)
+    power = np.zeros(window_size // 2 + 1)
+    used = 0
+    with sf.SoundFile(path) as f:
+        first = int(f.frames * EDGE_FRACTION)
+        last = max(first, int(f.frames * (1 - EDGE_FRACTION)) - window_size)
+        for start in np.linspace(first, last, n_windows).astype(np.int64):
+            f.seek(int(start))
+            block = f.read(window_size, dtype='float32', always_2d=True).mean(axis=1)
+            if len(block) < window_size:
+                continue
+            if 10.0 * np.log10(np.mean(block ** 2) + 1e-20) < SILENCE_DB:
+                continue
+            power += np.abs(np.fft.rfft(block * window)) ** 2
+            used += 1
+    if used == 0:
+        return None
+    return 10.0 * np.log10(power / used + 1e-20)
+
+
+def estimate_cutoff(spectrum_db: np.ndarray, sr: int) -> float:
+    """Frequenza di taglio (Hz) dallo spettro medio in dB; sr / 2 se non c'è un gradino."""
+    nyquist = sr / 2.0
+    freqs = np.linspace(0.0, nyquist, spectrum_db.size)
+    bin_hz = freqs[1]
+    width = max(1, int(round(SMOOTH_HZ / bin_hz)))
+    smooth = np.convolve(spectrum_db, np.ones(width) / width, mode='same')
+    # Ai bordi la media mobile è troncata: si tagliano mezza finestra per parte
+    smooth = smooth[:-(width // 2 + 1)]
+
+    below_bins = max(1, int(round(BELOW_HZ / bin_hz)))
+    gap = int(round(TRANSITION_HZ / bin_hz))
+    cumulative = np.concatenate(([0.0], np.cumsum(smooth)))
+    below = (cumulative[below_bins:] - cumulative[:-below_bins]) / below_bins   # finisce al bin i
+    peak_above = np.maximum.accumulate(smooth[::-1])[::-1]                        # dal bin i in su
+
+    bins = np.arange(below_bins - 1, smooth.size - gap - 1)
+    bins = bins[freqs[bins] >= MIN_CUTOFF_HZ]
+    if bins.size == 0:
+        return nyquist
+    cliff = below[bins - below_bins + 1] - peak_above[bins + gap + 1] >= CLIFF_DB
+    if not cliff.any():
+        return nyquist
+    # La finestra "sotto" dell'ultimo gradino può finire oltre il taglio (la sua media
+    # resta alta finché la banda piena ne occupa gran parte): il taglio è l'ultimo bin
+    # ancora CLIFF_DB sopra il fondo oltre la transizione
+    last = bins[cliff][-1]
+    floor = peak_above[last + gap + 1]
+    edge = last - below_bins + 1 + np.flatnonzero(smooth[last - below_bins + 1:last + 1] >= floor + CLIFF_DB)
+    return float(freqs[edge[-1]])
+
+
+def judge(cutoff_khz: float, nyquist_khz: float, declared_kbps: float, lossless: bool) -> str:
+    """Giudizio dalla banda e dal bitrate dichiarato.
+
+    Senza gradino (taglio = Nyquist) il limite è il sample rate del file, non un
+    encoder: un file a 22 kHz è di bassa qualità ma non sospetto.
+    """
+    band_limited = cutoff_khz < nyquist_khz
+    if band_limited and cutoff_khz < FULL_BAND_KHZ and (lossless or declared_kbps >= HIGH_BITRATE_KBPS):
+        return QUALITY_FAKE
+    if cutoff_khz < LOW_QUALITY_KHZ:
+        return QUALITY_LOW
+    return QUALITY_OK
+
+
+def spectral_quality(path: str) -> QualityEstimate:
+    """Banda effettiva e giudizio di qualità del brano (n/d se soundfile non lo sa leggere)."""
+    try:
+        info = sf.info(path)
+        spectrum = average_spectrum(path)
+    except Exception:
+        return QualityEstimate()
+    estimate = QualityEstimate(nyquist_khz=info.samplerate / 2000.0,
+                               lossless=info.format in LOSSLESS_FORMATS)
+    if not estimate.lossless and info.duration > 0:
+        estimate.declared_kbps = round(os.path.getsize(path) * 8 / info.duration / 1000, 1)
+    if spectrum is None:
+        return estimate
+    estimate.cutoff_khz = round(estimate_cutoff(spectrum, info.samplerate) / 1000.0, 2)
+    estimate.nyquist_khz = round(estimate.nyquist_khz, 2)
+    estimate.verdict = judge(estimate.cutoff_khz, estimate.nyquist_khz,
+                             estimate.declared_kbps, estimate.lossless)
+    return estimate
@@ -0,0 +1,132 @@
+"""
+Decodifica a blocchi per brani lunghi (mix e DJ set).
+
+Il file viene letto a blocchi con librosa.stream (soundfile) e ogni blocco
+alimenta accumulatori incrementali di onset, croma e RMS: in memoria c'è
+sempre un solo blocco di audio, qualunque sia la durata del brano. Resta in
+memoria solo l'inviluppo degli onset (un float per frame, circa 2.5 MB per
+due ore a 44.1 kHz), che serve per la stima del tempo.
+
+I risultati coincidono con quelli del percorso in memoria (TrackFeatures)
+entro una piccola tolleranza: i frame non sono centrati e il limite top_db
+del passaggio in dB usa il massimo visto fino a quel momento.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import librosa
+import soundfile as sf
+
+from features import N_FFT, HOP_LENGTH
+
+# Frame STFT per blocco (256 frame con hop 512 = circa 3 s a 44.1 kHz)
+BLOCK_FRAMES = 256
+
+# Oltre questa durata (secondi) conviene il percorso a blocchi
+LONG_TRACK_SECONDS = 10 * 60
+
+# Stessa soglia di librosa.power_to_db
+TOP_DB = 80.0
+
+
+@dataclass
+class StreamSummary:
+    """Feature riassuntive di un brano letto a blocchi."""
+    sr: int
+    duration: float
+    onset_env: np.ndarray
+    chroma_mean: np.ndarray   # Profilo cromatico medio (12 valori)
+    rms_mean: float
+    rms_std: float
+
+    def tempo_curve(self) -> np.ndarray:
+        """Stima del tempo frame per frame, come TrackFeatures.tempo_curve."""
+        return librosa.feature.tempo(onset_envelope=self.onset_env, sr=self.sr,
+                                     hop_length=HOP_LENGTH, aggregate=None)
+
+    def tempo(self) -> float:
+        """Tempo globale, come quello restituito da librosa.beat.beat_track."""
+        tempo = librosa.feature.tempo(onset_envelope=self.onset_env, sr=self.sr,
+                                      hop_length=HOP_LENGTH)
+        return float(tempo[0]) if tempo.size else 0.0
+
+
+def track_duration(path: str) -> Optional[float]:
+    """Durata del file letta dall'header, senza decodificare (None se non leggibile)."""
+    try:
+        info = sf.info(path)
+    except Exception:
+        return None
+    return info.frames / info.samplerate if info.samplerate else None
+
+
+def is_long_track(path: str, threshold: float = LONG_TRACK_SECONDS) -> bool:
+    """True se il brano supera la soglia e soundfile lo sa leggere a blocchi."""
+    duration = track_duration(path)
+    return duration is not None and duration > threshold
+
+
+def stream_summary(path: str, block_frames: int = BLOCK_FRAMES) -> StreamSummary:
+    """Legge il file a blocchi e accumula onset, croma e RMS con memoria costante."""
+    info = sf.info(path)
+    sr = info.samplerate
+    mel_basis = librosa.filters.mel(sr=sr, n_fft=N_FFT)
+    chroma_basis = librosa.filters.chroma(sr=sr, n_fft=N_FFT)
+    window = librosa.filters.get_window('hann', N_FFT, fftbins=True).astype(np.float32)
+
+    onset_blocks = []
+    prev_mel_db = None
+    running_max_db = -np.inf
+    chroma_sum = np.zeros(12)
+    rms_sum = rms_sq_sum = 0.0
+    n_frames = 0
+
+    # I blocchi si sovrappongono di N_FFT - HOP_LENGTH campioni, così i frame
+    # risultano contigui come in una STFT dell'intero segnale
+    blocks = librosa.stream(path, block_length=block_frames, frame_length=N_FFT,
+                            hop_length=HOP_LENGTH, mono=True)
+    for block in blocks:
+        if len(block) < N_FFT:
+            break  # Coda più corta di un frame
+        frames = librosa.util.frame(block, frame_length=N_FFT, hop_length=HOP_LENGTH)
+
+        # RMS nel dominio del tempo
+        rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=0))
+        rms_sum += float(rms.sum())
+        rms_sq_sum += float((rms ** 2).sum())
+        n_frames += rms.size
+
+        power = np.abs(np.fft.rfft(frames * window[:, None], axis=0)) ** 2
+
+        # Onset: flusso spettrale positivo sullo spettrogramma mel in dB
+        mel_db = 10.0 * np.log10(np.maximum(1e-10, mel_basis @ power))
+        running_max_db = max(running_max_db, float(mel_db.max()))
+        mel_db = np.maximum(mel_db, running_max_db - TOP_DB)
+        if prev_mel_db is not None:
+            mel_db_ext = np.hstack([prev_mel_db, mel_db])
+        else:
+            mel_db_ext = np.hstack([mel_db[:, :1], mel_db])
+        flux = np.maximum(0.0, np.diff(mel_db_ext, axis=1)).mean(axis=0)
+        onset_blocks.append(flux.astype(np.float32))
+        prev_mel_db = mel_db[:, -1:]
+
+        # Croma: normalizzazione per frame (norm=inf) come chroma_stft
+        chroma = chroma_basis @ power
+        chroma = librosa.util.normalize(chroma, norm=np.inf, axis=0)
+        chroma_sum += chroma.sum(axis=1)
+
+    if n_frames == 0:
+        raise ValueError(f"Nessun audio letto da {path}")
+
+    # Allineamento con onset_strength(center=True), che ritarda di lag + N_FFT/(2*hop)
+    # frame: qui il lag è già lo zero del primo frame, ma i frame non sono centrati
+    # e quindi servono altri N_FFT/(2*hop) frame.
+    pad = 2 * (N_FFT // (2 * HOP_LENGTH))
+    onset_env = np.concatenate([np.zeros(pad, dtype=np.float32)] + onset_blocks)
+
+    rms_mean = rms_sum / n_frames
+    rms_var = max(0.0, rms_sq_sum / n_frames - rms_mean ** 2)
+    return StreamSummary(sr=sr, duration=info.frames / sr, onset_env=onset_env,
+                         chroma_mean=chroma_sum / n_frames,
+                         rms_mean=rms_mean, rms_std=float(np.sqrt(rms_var)))
@@ -0,0 +1,258 @@
+"""
+Struttura di un brano (intro, breakdown, build, drop, outro) per i cue.
+
+Croma, MFCC e RMS della STFT condivisa vengono mediati battito per battito
+sulla griglia ritmica (beatgrid): un brano di 6 minuti a 128 BPM ha circa 770
+battiti, quindi la matrice di autosimilarità è ~770 x 770 invece dei 20000 x
+20000 frame. La novità lungo la diagonale (kernel a scacchiera di Foote) ha un
+picco dove il brano cambia sezione; i confini vengono agganciati all'inizio
+della misura più vicina.
+
+Le sezioni sono etichettate con regole semplici su:
+- energia: RMS della sezione rispetto alla sezione più forte;
+- batteria e armonia: livello della parte percussiva e di quella armonica
+  dello spettrogramma mel condiviso, separate con due aperture morfologiche
+  (lungo la frequenza e lungo il tempo, come in voice) e confrontate con
+  il livello tipico delle parti piene del brano;
+- voce: copertura dei segmenti di voice.vocal_activity.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import librosa
+from scipy.ndimage import grey_opening
+
+from beatgrid import BeatGrid, fit_beatgrid
+from features import HOP_LENGTH, TrackFeatures
+from voice import VocalActivity, vocal_activity
+
+# MFCC per il timbro (il coefficiente 0, il volume, è già coperto dall'RMS)
+N_MFCC = 13
+
+# Passo fisso (s) quando il brano non ha una griglia ritmica
+FALLBACK_BEAT_SECONDS = 0.5
+
+# Aperture armonica (frame) e percussiva (bande mel)
+HARMONIC_KERNEL = 17
+PERCUSSIVE_KERNEL = 17
+
+# Metà lato del kernel a scacchiera (4 misure) e sezione più corta (8 misure), in battiti
+KERNEL_BEATS = 16
+MIN_SECTION_BEATS = 32
+
+# Novità minima di un confine e margine sopra la sua media locale. La novità è
+# divisa per il peso del kernel: 0 = nessun cambiamento, ~0.5 = un drop netto
+MIN_NOVELTY = 0.08
+NOVELTY_DELTA = 0.03
+
+# Energia (dB rispetto alla sezione più forte): drop sopra -DROP_DB, breakdown sotto -BREAKDOWN_DB
+DROP_DB = 3.0
+BREAKDOWN_DB = 9.0
+
+# Salita minima (dB) dalla sezione precedente perché una sezione sia un drop
+DROP_RISE_DB = 3.0
+
+# Percentile dei battiti che fa da livello tipico delle parti piene
+FULL_PERCENTILE = 75
+
+# Batteria (armonia) assente se la parte percussiva (armonica) sta tanti dB sotto il livello tipico
+DRUMLESS_DB = 10.0
+ATONAL_DB = 12.0
+
+# Frazione di sezione coperta dalla voce per considerarla cantata
+VOCAL_PRESENCE = 0.3
+
+# Etichette delle sezioni
+LABEL_INTRO = "intro"
+LABEL_GROOVE = "groove"
+LABEL_BUILD = "build"
+LABEL_DROP = "drop"
+LABEL_BREAKDOWN = "breakdown"
+LABEL_OUTRO = "outro"
+
+
+@dataclass
+class Section:
+    """Sezione del brano tra due confini."""
+    start: float
+    end: float
+    label: str = LABEL_GROOVE
+    loudness_db: float = 0.0   # RMS medio rispetto alla sezione più forte
+    vocal: float = 0.0         # Frazione coperta dalla voce
+    drums: bool = True         # Batteria presente
+    tonal: bool = True         # Armonia presente
+
+
+@dataclass
+class TrackStructure:
+    """Sezioni del brano e punti notevoli."""
+    sections: List[Section] = field(default_factory=list)
+    downbeat: Optional[float] = None   # Primo battito di misura
+    drop: Optional[float] = None       # Inizio del drop principale
+    voice: VocalActivity = field(default_factory=VocalActivity)
+    beat_times: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    novelty: np.ndarray = field(default_factory=lambda: np.zeros(0))
+
+
+def _zscore_rows(x: np.ndarray) -> np.ndarray:
+    return (x - x.mean(axis=1, keepdims=True)) / (x.std(axis=1, keepdims=True) + 1e-9)
+
+
+def beat_features(feats: TrackFeatures, beat_frames: np.ndarray) -> Dict[str, np.ndarray]:
+    """Feature medie per battito (colonna i = dal battito i al successivo).
+
+    power, harmonic e percussive sono potenze; le altre righe sono già normalizzate.
+    """
+    mfcc = librosa.feature.mfcc(S=feats.mel_db, n_mfcc=N_MFCC)[1:]
+    mel = librosa.db_to_power(feats.mel_db)
+    harmonic = grey_opening(mel, size=(1, HARMONIC_KERNEL)).sum(axis=0)
+    percussive = grey_opening(mel, size=(PERCUSSIVE_KERNEL, 1)).sum(axis=0)
+
+    n = min(feats.chroma.shape[1], mfcc.shape[1], feats.rms.size)
+    frames = beat_frames[beat_frames < n]
+    stacked = np.vstack([feats.chroma[:, :n], mfcc[:, :n], feats.rms[None, :n] ** 2,
+                         harmonic[None, :n], percussive[None, :n]])
+    synced = librosa.util.sync(stacked, frames, aggregate=np.mean, pad=False)
+    return {
+        'chroma': synced[:12],
+        'mfcc': synced[12:12 + mfcc.shape[0]],
+        'power': synced[-3],
+        'harmonic': synced[-2],
+        'percussive': synced[-1],
+    }
+
+
+def self_similarity(beat_feats: Dict[str, np.ndarray]) -> np.ndarray:
+    """Matrice di autosimilarità (coseno) tra battiti: croma, timbro ed energia pesano uguale."""
+    levels = 10.0 * np.log10(np.vstack([beat_feats[k] for k in ('power', 'harmonic', 'percussive')]) + 1e-10)
+    blocks = [_zscore_rows(x) / np.sqrt(x.shape[0])
+              for x in (beat_feats['chroma'], beat_feats['mfcc'], levels)]
+    x = np.vstack(blocks)
+    x /= np.linalg.norm(x, axis=0, keepdims=True) + 1e-9
+    return x.T @ x
+
+
+def checkerboard_kernel(half: int) -> np.ndarray:
+    """Kernel a scacchiera (2*half x 2*half) con attenuazione gaussiana."""
+    axis = np.arange(-half, half) + 0.5
+    taper = np.exp(-0.5 * (axis / (0.5 * half)) ** 2)
+    sign = np.sign(axis)
+    return np.outer(sign * taper, sign * taper)
+
+
+def novelty_curve(ssm: np.ndarray, half: int = KERNEL_BEATS) -> np.ndarray:
+    """Novità per battito: correlazione del kernel a scacchiera lungo la diagonale
+    (divisa per il peso del kernel, quindi confrontabile tra brani)."""
+    n = ssm.shape[0]
+    half = max(1, min(half, n // 2))
+    padded = np.pad(ssm, half, mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, (2 * half, 2 * half))
+    idx = np.arange(n)
+    kernel = checkerboard_kernel(half)
+    novelty = np.einsum('ijk,jk->i', windows[idx, idx], kernel) / np.abs(kernel).sum()
+    return np.maximum(0.0, novelty)
+
+
+def boundaries(novelty: np.ndarray) -> np.ndarray:
+    """Battiti di confine: picchi della novità distanti almeno MIN_SECTION_BEATS."""
+    if novelty.size == 0:
+        return np.zeros(0, dtype=int)
+    w = MIN_SECTION_BEATS // 2
+    # Un confine è il massimo della novità per mezza sezione minima da entrambi i lati
+    peaks = librosa.util.peak_pick(novelty, pre_max=w, post_max=w, pre_avg=KERNEL_BEATS,
+                                   post_avg=KERNEL_BEATS, delta=NOVELTY_DELTA, wait=MIN_SECTION_BEATS)
+    keep = (peaks >= w) & (peaks <= novelty.size - w) & (novelty[peaks] >= MIN_NOVELTY)
+    return peaks[keep]
+
+
+def _snap(times: np.ndarray, grid: Optional[BeatGrid]) -> np.ndarray:
+    """Porta i tempi sull'inizio di misura più vicino (invariati senza griglia)."""
+    if grid is None or times.size == 0:
+        return times
+    bars = np.round((times - grid.downbeat) / grid.bar_length)
+    return np.maximum(0.0, grid.downbeat + bars * grid.bar_length)
+
+
+def label_sections(sections: List[Section]) -> Optional[float]:
+    """Etichetta le sezioni e restituisce l'inizio del drop principale (None se manca).
+
+    Un drop ha batteria e armonia, è tra le sezioni più forti e arriva dopo una
+    sezione più debole di almeno DROP_RISE_DB (o senza batteria). Una sezione
+    cantata che sale di poco è una strofa o un ritornello: il drop cantato è solo
+    quello che segue un breakdown. La prima sezione non è mai un drop; se nessuna
+    sezione spicca, il brano resta un groove.
+    """
+    for i, s in enumerate(sections):
+        prev = sections[i - 1] if i > 0 else None
+        if not s.drums or s.loudness_db < -BREAKDOWN_DB:
+            s.label = LABEL_BREAKDOWN
+        elif (prev is not None and s.tonal and s.loudness_db >= -DROP_DB
+              and (not prev.drums or s.loudness_db - prev.loudness_db >= DROP_RISE_DB)
+              and (s.vocal < VOCAL_PRESENCE or prev.label == LABEL_BREAKDOWN)):
+            s.label = LABEL_DROP
+        else:
+            s.label = LABEL_GROOVE
+    if len(sections) < 2:
+        # Un brano senza cambi di sezione non ha né intro né outro
+        return None
+    for prev, s in zip(sections, sections[1:]):
+        if s.label == LABEL_DROP and prev.label == LABEL_GROOVE:
+            prev.label = LABEL_BUILD
+    sections[0].label = LABEL_INTRO
+    if sections[-1].label != LABEL_DROP:
+        sections[-1].label = LABEL_OUTRO
+
+    # Drop principale: il primo che arriva dopo un calo (breakdown o build), altrimenti il primo
+    drops = [i for i, s in enumerate(sections) if s.label == LABEL_DROP]
+    after_break = [i for i in drops if sections[i - 1].label in (LABEL_BREAKDOWN, LABEL_BUILD)]
+    if after_break:
+        return sections[after_break[0]].start
+    return sections[drops[0]].start if drops else None
+
+
+def analizza_struttura(feats: TrackFeatures, grid: Optional[BeatGrid] = None) -> TrackStructure:
+    """Sezioni etichettate del brano; grid permette di riusare una griglia già stimata."""
+    grid = grid or fit_beatgrid(feats)
+    duration = feats.onset_env.size * HOP_LENGTH / feats.sr
+    if grid is not None:
+        beat_times = grid.beat_times()
+    else:
+        beat_times = np.arange(0.0, duration, FALLBACK_BEAT_SECONDS)
+    beat_frames = librosa.time_to_frames(beat_times, sr=feats.sr, hop_length=HOP_LENGTH)
+
+    beat_feats = beat_features(feats, beat_frames)
+    voice = vocal_activity(feats)
+    n = beat_feats['power'].size
+    beat_times = beat_times[:n]
+    if n < 2 * MIN_SECTION_BEATS:
+        return TrackStructure(downbeat=grid.downbeat if grid else None, voice=voice,
+                              beat_times=beat_times)
+
+    novelty = novelty_curve(self_similarity(beat_feats))
+    cuts = np.unique(_snap(beat_times[boundaries(novelty)], grid))
+    edges = np.concatenate(([0.0], cuts[(cuts > 0) & (cuts < duration)], [duration]))
+
+    harmonic_db = 10.0 * np.log10(beat_feats['harmonic'] + 1e-10)
+    percussive_db = 10.0 * np.log10(beat_feats['percussive'] + 1e-10)
+    full_harmonic = np.percentile(harmonic_db, FULL_PERCENTILE)
+    full_percussive = np.percentile(percussive_db, FULL_PERCENTILE)
+    sections = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        beats = (beat_times >= start) & (beat_times < end)
+        if not beats.any():
+            continue
+        sections.append(Section(
+            start=float(start), end=float(end),
+            loudness_db=float(10.0 * np.log10(beat_feats['power'][beats].mean() + 1e-10)),
+            vocal=float(voice.presence(start, end)),
+            drums=bool(percussive_db[beats].mean() >= full_percussive - DRUMLESS_DB),
+            tonal=bool(harmonic_db[beats].mean() >= full_harmonic - ATONAL_DB),
+        ))
+    loudest = max(s.loudness_db for s in sections)
+    for s in sections:
+        s.loudness_db = round(s.loudness_db - loudest, 2)
+    drop = label_sections(sections)
+
+    return TrackStructure(sections=sections, downbeat=grid.downbeat if grid else None, drop=drop,
+                          voice=voice, beat_times=beat_times, novelty=novelty)
@@ -0,0 +1,147 @@
+"""
+Mappa del tempo di un brano: tempo costante o variabile?
+
+Dal tempogramma a finestra scorrevole (TrackFeatures.tempogram, lo stesso da
+cui esce il BPM) si ricava una curva del tempo locale, un punto al secondo:
+per ogni finestra si prende il picco di autocorrelazione vicino al tempo del
+brano (niente salti di ottava) e lo si interpola con una parabola, perché il
+lag intero da solo ha una risoluzione di qualche BPM. Dalla curva escono
+deviazione standard, deriva in BPM al minuto e le sezioni che si scostano dal
+tempo mediano oltre una soglia: un brano costante (la grande maggioranza della
+musica prodotta con un sequencer) non ha bisogno di quantizzazione.
+
+Dove il tempogramma non è sicuro (picco di autocorrelazione sotto
+MIN_SALIENCE: breakdown senza batteria, silenzi) il tempo locale è
+sconosciuto, non fuori tempo: quei punti non contano né per le statistiche
+né per le sezioni.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from features import HOP_LENGTH, TrackFeatures
+
+# Un punto della curva ogni CURVE_STEP secondi
+CURVE_STEP = 1.0
+
+# Il picco si cerca entro ±SEARCH_RATIO dal tempo di riferimento del brano
+SEARCH_RATIO = 0.1
+
+# Scostamento dal tempo mediano oltre il quale una sezione è "fuori tempo"
+DEVIATION_BPM = 1.0
+# Sezioni più brevi di così sono rumore di stima, non cambi di tempo
+MIN_SECTION_SECONDS = 4.0
+
+# Picco del tempogramma (autocorrelazione normalizzata, 1 = periodicità perfetta)
+# sotto il quale il tempo locale è sconosciuto
+MIN_SALIENCE = 0.3
+
+# Sezione: (inizio s, fine s, BPM medio)
+TempoSection = Tuple[float, float, float]
+
+
+@dataclass
+class TempoMap:
+    """Curva del tempo locale e sue statistiche."""
+    times: np.ndarray = field(default_factory=lambda: np.zeros(0))   # Secondi
+    bpm: np.ndarray = field(default_factory=lambda: np.zeros(0))     # BPM locali
+    salience: np.ndarray = field(default_factory=lambda: np.zeros(0))  # Picco del tempogramma
+    median_bpm: float = 0.0
+    std_bpm: float = 0.0
+    drift_bpm_per_min: float = 0.0
+    sections: List[TempoSection] = field(default_factory=list)
+    deviation_bpm: float = DEVIATION_BPM
+
+    @property
+    def confident(self) -> np.ndarray:
+        """Punti della curva in cui il tempo locale è noto."""
+        return self.salience >= MIN_SALIENCE
+
+    @property
+    def is_constant(self) -> bool:
+        """Nessuna sezione fuori tempo e una deriva complessiva entro la soglia."""
+        times = self.times[self.confident]
+        span_min = (times[-1] - times[0]) / 60.0 if times.size > 1 else 0.0
+        return bool(not self.sections and abs(self.drift_bpm_per_min) * span_min <= self.deviation_bpm)
+
+    def format_sections(self) -> str:
+        """Sezioni fuori tempo in forma leggibile ("1:04-1:20 (126.3); ...")."""
+        def mmss(t):
+            return f"{int(t // 60)}:{int(t % 60):02d}"
+        return "; ".join(f"{mmss(s)}-{mmss(e)} ({b:.1f})" for s, e, b in self.sections)
+
+
+def local_tempo(feats: TrackFeatures,
+                reference_bpm: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Curva del tempo locale (tempi in secondi, BPM, picco del tempogramma) con
+    precisione sotto il lag."""
+    tg = feats.tempogram
+    n_lags, n_frames = tg.shape
+    fps = feats.sr / HOP_LENGTH
+    if not reference_bpm:
+        reference_bpm = float(np.median(feats.tempo_curve))
+
+    ref_lag = 60.0 * fps / reference_bpm
+    lo = max(2, int(np.floor(ref_lag * (1 - SEARCH_RATIO))))
+    hi = min(n_lags - 2, int(np.ceil(ref_lag * (1 + SEARCH_RATIO))))
+    if lo > hi:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+
+    # Solo finestre interamente dentro il segnale (ai bordi l'autocorrelazione è troncata)
+    step = max(1, int(round(CURVE_STEP * fps)))
+    half = n_lags // 2
+    frames = np.arange(half, n_frames - half, step)
+    if frames.size == 0:
+        frames = np.arange(0, n_frames, step)
+
+    lag = tg[lo:hi + 1, frames].argmax(axis=0) + lo
+    left = tg[lag - 1, frames]
+    center = tg[lag, frames]
+    right = tg[lag + 1, frames]
+    denom = left - 2 * center + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.where(denom < 0, 0.5 * (left - right) / denom, 0.0)
+    lag = lag + np.clip(delta, -0.5, 0.5)
+    return frames / fps, 60.0 * fps / lag, center
+
+
+def _deviating_sections(times: np.ndarray, bpm: np.ndarray, confident: np.ndarray, median: float,
+                        deviation_bpm: float) -> List[TempoSection]:
+    """Tratti consecutivi della curva oltre la soglia (solo dove il tempo è noto),
+    lunghi almeno MIN_SECTION_SECONDS."""
+    outside = confident & (np.abs(bpm - median) > deviation_bpm)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], outside.astype(np.int8), [0]))))
+    sections = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        t_start, t_end = times[start], times[end - 1] + CURVE_STEP
+        if t_end - t_start >= MIN_SECTION_SECONDS:
+            sections.append((float(t_start), float(t_end), float(bpm[start:end].mean())))
+    return sections
+
+
+def tempo_map(feats: TrackFeatures, reference_bpm: Optional[float] = None,
+              deviation_bpm: float = DEVIATION_BPM) -> TempoMap:
+    """Mappa del tempo del brano; reference_bpm (es. il BPM già stimato) evita errori di ottava."""
+    times, bpm, salience = local_tempo(feats, reference_bpm)
+    confident = salience >= MIN_SALIENCE
+    if not confident.any():
+        return TempoMap(times=times, bpm=bpm, salience=salience, deviation_bpm=deviation_bpm)
+    known = bpm[confident]
+    median = float(np.median(known))
+    drift = float(np.polyfit(times[confident] / 60.0, known, 1)[0]) if known.size > 1 else 0.0
+    return TempoMap(
+        times=times,
+        bpm=bpm,
+        salience=salience,
+        median_bpm=median,
+        std_bpm=float(known.std()),
+        drift_bpm_per_min=drift,
+        sections=_deviating_sections(times, bpm, confident, median, deviation_bpm),
+        deviation_bpm=deviation_bpm,
+    )
+
+
+def needs_quantization(tmap: TempoMap) -> bool:
+    """Un brano a tempo costante è già in griglia: la quantizzazione si può saltare."""
+    return bool(tmap.confident.any()) and not tmap.is_constant
@@ -0,0 +1,271 @@
+"""
+Nucleo di analisi di un singolo brano (BPM, chiave, Camelot, energia).
+
+Le funzioni sono a livello di modulo e non dipendono da Tkinter, così possono
+girare in un processo separato (vedi batch_engine.py) e restituire un
+AnalysisResult serializzabile con pickle.
+"""
+import os
+import traceback
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from features import TrackFeatures, DEFAULT_PROFILE
+from tempo_map import tempo_map
+from spectral_quality import spectral_quality
+# Profili tonali e nomi delle chiavi vivono in key_detection (riesportati qui)
+from key_detection import (KeyMatch, MAJOR_PROFILE_ADV, MINOR_PROFILE_ADV,
+                           NOTES_MAJOR_STD, NOTES_MINOR_STD, match_keys)
+
+# =============================================
+# Configurazioni e strutture dati
+# =============================================
+
+@dataclass
+class AnalysisResult:
+    filename: str
+    bpm: int
+    key: str
+    camelot_code: str
+    compatible_keys: str
+    energy: int
+    # Questi campi sono per la visualizzazione, potrebbero essere rimossi dal salvataggio CSV
+    # se non si vogliono colonne extra lì. Li lascio per ora nella dataclass.
+    _camelot_color_tag: str # Rinominato per chiarezza che è un tag
+    _energy_color_tag: str  # Rinominato per chiarezza che è un tag
+    _file_path: str = ""    # Percorso completo, serve all'archivio della libreria
+    key_confidence: float = 0.0  # Margine di correlazione sulla seconda tonalità
+    runner_up_key: str = ""      # Seconda tonalità più probabile
+    # Stabilità del tempo: come il resto dell'analisi coprono solo i primi
+    # ANALYSIS_DURATION secondi; il brano intero lo controlla la quantizzazione
+    tempo_std: float = 0.0       # Deviazione standard del tempo locale (BPM)
+    tempo_drift: float = 0.0     # Deriva del tempo (BPM al minuto)
+    tempo_constant_90s: bool = True  # False: tempo variabile già nei primi 90 s
+    tempo_sections: str = ""     # Sezioni fuori tempo ("1:04-1:20 (126.3); ...")
+    cutoff_khz: float = 0.0      # Banda effettiva dello spettro (taglio dell'encoder)
+    quality: str = ""            # Giudizio sulla banda: ok, bassa, sospetta, n/d
+
+# Mappature costanti
+CAMELOT_MAP = {
+    'C': '8B', 'C#': '3B', 'D': '10B', 'D#': '5B', 'E': '12B', 'F': '7B',
+    'F#': '2B', 'G': '9B', 'G#': '4B', 'A': '11B', 'A#': '6B', 'B': '1B',
+    'Cm': '5A', 'C#m': '12A', 'Dm': '7A', 'D#m': '2A', 'Em': '9A', 'Fm': '4A',
+    'F#m': '11A', 'Gm': '6A', 'G#m': '1A', 'Am': '8A', 'A#m': '3A', 'Bm': '10A'
+}
+
+CAMELOT_COLORS = { # Usato per i tag colore della Treeview
+    '1A': 'medium orchid', '1B': 'sky blue', '2A': 'magenta', '2B': 'deep sky blue',
+    '3A': 'dodger blue', '3B': 'green yellow', '4A': 'royal blue', '4B': 'chartreuse',
+    '5A': 'spring green', '5B': 'yellow green', '6A': 'lawn green', '6B': 'dark sea green',
+    '7A': 'gold', '7B': 'yellow', '8A': 'orange', '8B': 'light coral',
+    '9A': 'dark orange', '9B': 'indian red', '10A': 'tomato', '10B': 'medium violet red',
+    '11A': 'red', '11B': 'purple', '12A': 'dark violet', '12B': 'blue violet',
+    'N/A': 'white' # Sfondo di default per la treeview
+}
+
+ENERGY_COLORS = { # Usato per i tag colore della Treeview (per la colonna Energia)
+    1: "PaleTurquoise1", 2: "PaleTurquoise2", 3: "PaleGreen1", 4: "PaleGreen2",
+    5: "SpringGreen2", 6: "SpringGreen3", 7: "yellow1", 8: "gold1",
+    9: "dark orange", 10: "red1",
+    # Aggiungiamo un colore di fallback se il valore non è in mappa
+    "default": "grey"
+}
+
+# Versione dell'algoritmo: se cambia, i brani in archivio vengono rianalizzati
+ANALYZER_VERSION = "0.7.5"
+
+# Front-end per la stima della chiave:
+#   "fast"    -> croma CQT filtrato nel tempo, senza i frame percussivi (TrackFeatures.tonal_chroma)
+#   "precise" -> HPSS + croma CENS della componente armonica (TrackFeatures.harmonic_chroma)
+KEY_MODES = ("fast", "precise")
+DEFAULT_KEY_MODE = "fast"
+
+# Dati già analizzati da VirtualDJ (vdj_import.VdjScan):
+#   "prior" -> il BPM di VirtualDJ centra la ricerca del tempo (tolleranza PRIOR_TOLERANCE_BPM)
+#   "skip"  -> BPM e chiave di VirtualDJ vengono usati così come sono (si calcola solo l'energia)
+PRIOR_TOLERANCE_BPM = 4.0 # Stessa tolleranza di ±4 BPM usata per gli abbinamenti
+
+# Durata analizzata per brano (secondi): anche la mappa del tempo copre solo questa parte
+ANALYSIS_DURATION = 90
+
+
+# =============================================
+# Analisi completa di un file
+# =============================================
+
+def analyzer_version(profile: str = DEFAULT_PROFILE, key_mode: str = DEFAULT_KEY_MODE,
+                     vdj_mode: Optional[str] = None) -> str:
+    """Versione registrata nell'archivio: algoritmo + profilo di analisi + modo chiave.
+
+    Con vdj_mode="skip" BPM e chiave sono copiati da VirtualDJ e non analizzati:
+    finiscono sotto una versione a parte, così un'analisi normale non li riusa.
+    """
+    version = f"{ANALYZER_VERSION}-{profile}-{key_mode}"
+    return f"{version}-vdjskip" if vdj_mode == "skip" else version
+
+
+def analyze_track(file_path: str, profile: str = DEFAULT_PROFILE,
+                  key_mode: str = DEFAULT_KEY_MODE, prior=None,
+                  vdj_mode: str = "prior") -> AnalysisResult:
+    """Analizza un file audio e restituisce il risultato (solleva eccezione in caso di errore).
+
+    prior (vdj_import.VdjScan, facoltativo) sono i dati di VirtualDJ per questo file.
+    """
+    filename = os.path.basename(file_path)
+
+    # Caricamento audio (una sola volta per tutte le analisi su questo file), già
+    # ricampionato al sample rate del profilo: STFT, onset, CQT e cromagrammi
+    # vengono calcolati su richiesta e riutilizzati.
+    feats = TrackFeatures(file_path, duration=ANALYSIS_DURATION, profile=profile).load()
+
+    prior_bpm = prior.bpm if prior is not None else None
+    prior_key = prior.key if prior is not None else None
+    if vdj_mode == "skip" and prior_bpm and prior_key:
+        bpm = int(round(prior_bpm))
+        key_match = KeyMatch(key=prior_key, score=0.0, runner_up="", confidence=0.0)
+    else:
+        bpm = calculate_bpm(feats, start_bpm=prior_bpm)
+        key_match = detect_key(feats, key_mode)
+    # Stabilità del tempo (anche con i dati di VirtualDJ, che non la forniscono)
+    tmap = tempo_map(feats, reference_bpm=bpm or prior_bpm)
+    key_traditional = key_match.key
+    camelot_code = CAMELOT_MAP.get(key_traditional, "N/A")
+    compatible_keys_list = find_compatible_keys(camelot_code)
+    energy_scaled = calculate_energy(feats)
+    # Banda reale dal file originale (finestre sparse al sample rate nativo)
+    band = spectral_quality(file_path)
+
+    camelot_color_tag = CAMELOT_COLORS.get(camelot_code, CAMELOT_COLORS['N/A'])
+    # Per l'energia, costruiamo il nome del tag per coerenza con i tag della Treeview
+    energy_color_name = ENERGY_COLORS.get(energy_scaled, ENERGY_COLORS['default'])
+
+    return AnalysisResult(
+        filename=filename,
+        bpm=bpm,
+        key=key_traditional,
+        camelot_code=camelot_code,
+        compatible_keys=", ".join(compatible_keys_list),
+        energy=energy_scaled,
+        _camelot_color_tag=camelot_color_tag,
+        _energy_color_tag=f"energy_{energy_color_name}",
+        _file_path=file_path,
+        key_confidence=round(key_match.confidence, 4),
+        runner_up_key=key_match.runner_up,
+        tempo_std=round(tmap.std_bpm, 3),
+        tempo_drift=round(tmap.drift_bpm_per_min, 3),
+        tempo_constant_90s=tmap.is_constant,
+        tempo_sections=tmap.format_sections(),
+        cutoff_khz=band.cutoff_khz,
+        quality=band.verdict
+    )
+
+
+# =============================================
+# Metodi di analisi audio
+# =============================================
+
+def calculate_bpm(feats: TrackFeatures, start_bpm: Optional[float] = None) -> int:
+    """Calcola il BPM di un segnale audio (start_bpm: tempo già noto, es. da VirtualDJ)"""
+    try:
+        # Usare aggregate=np.median è più robusto per BPM
+        if start_bpm:
+            tempo_values = feats.tempo_curve_around(start_bpm, PRIOR_TOLERANCE_BPM)
+        else:
+            tempo_values = feats.tempo_curve
+        if tempo_values.size > 0:
+            return int(round(np.median(tempo_values)))
+        return 0 # Fallback se non trova tempi
+    except Exception as e:
+        print(f"Errore calcolo BPM: {str(e)}")
+        return 0
+
+
+def detect_bass_note_chroma_idx(feats: TrackFeatures) -> Optional[int]:
+    """Helper per rilevare la nota di basso predominante (indice cromatico 0-11)."""
+    try:
+        # Croma delle 3 ottave più basse, ricavato dalla CQT condivisa del brano
+        bass_chroma_energy = feats.bass_chroma.sum(axis=1)
+        return int(np.argmax(bass_chroma_energy))
+    except Exception as e:
+        print(f"Errore nel rilevamento nota di basso: {str(e)}")
+        return None # Restituisce None se fallisce, così la logica chiamante può gestirlo
+
+
+def detect_key(feats: TrackFeatures, key_mode: str = DEFAULT_KEY_MODE) -> KeyMatch:
+    """Rileva la tonalità musicale usando un algoritmo avanzato (con seconda scelta e confidenza)."""
+    if key_mode not in KEY_MODES:
+        raise ValueError(f"Modo di stima della chiave sconosciuto: {key_mode}")
+    try:
+        # 1-2. Croma della parte armonica: HPSS + CENS ("precise") oppure
+        #      croma CQT mediano senza i frame percussivi ("fast")
+        if key_mode == "precise":
+            chroma_features = feats.harmonic_chroma
+        else:
+            chroma_features = feats.tonal_chroma
+        chroma_avg_profile = np.mean(chroma_features, axis=1)
+
+        # 3. Rilevamento nota di basso
+        bass_note_idx = detect_bass_note_chroma_idx(feats) # y originale per il basso
+
+        # 4. Correlazione con i 24 profili tonali in una sola operazione, pesata con il basso
+        return match_keys(chroma_avg_profile, bass_note_idx)
+
+    except Exception as e:
+        print(f"Errore dettagliato in detect_key: {str(e)}")
+        traceback.print_exc()
+        return KeyMatch(key="N/A", score=0.0, runner_up="", confidence=0.0)
+
+
+def match_key_profile(chroma_avg_profile: np.ndarray, bass_note_idx: Optional[int] = None) -> str:
+    """Confronta un profilo cromatico medio con i 24 profili tonali e restituisce la chiave."""
+    return match_keys(chroma_avg_profile, bass_note_idx).key
+
+
+def find_compatible_keys(camelot_code: str) -> List[str]:
+    if not camelot_code or camelot_code == "N/A":
+        return []
+    try:
+        num = int(camelot_code[:-1])
+        mode = camelot_code[-1].upper()
+    except ValueError:
+        return [] # Formato Camelot non valido
+
+    compatible = [camelot_code]
+    compatible.append(f"{ (num - 2 + 12) % 12 + 1 }{mode}") # num-1 (corretto)
+    compatible.append(f"{ (num % 12) + 1 }{mode}")     # num+1 (corretto)
+    compatible.append(f"{num}{'B' if mode == 'A' else 'A'}")
+
+    # Filtra per assicurarsi che siano codici Camelot validi (opzionale ma sicuro)
+    valid_camelot_codes = set(CAMELOT_MAP.values())
+    return sorted([c for c in list(set(compatible)) if c in valid_camelot_codes or c == camelot_code])
+
+
+def calculate_energy(feats: TrackFeatures) -> int:
+    try:
+        rms_frames = feats.rms
+        if rms_frames.size == 0: return 1 # Evita errore su array vuoto
+        return scale_energy(float(np.mean(rms_frames)), float(np.std(rms_frames)))
+    except Exception as e:
+        print(f"Errore nel calcolo energia: {str(e)}")
+        return 1
+
+
+def scale_energy(energy_mean: float, energy_std: float) -> int:
+    """Porta media e deviazione standard dell'RMS sulla scala di energia 1-10."""
+    energy_score = energy_mean + 0.5 * energy_std
+
+    scaled_value = 1
+    if energy_score > 0:
+        min_expected_score = 0.055 # Valori da tarare
+        max_expected_score = 0.130 # Valori da tarare
+
+        if energy_score <= min_expected_score:
+            scaled_value = 1
+        elif energy_score >= max_expected_score:
+            scaled_value = 10
+        else:
+            scaled_value = 1 + 9 * (energy_score - min_expected_score) / (max_expected_score - min_expected_score)
+
+    return int(np.clip(round(scaled_value), 1, 10))
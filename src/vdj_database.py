@@ -0,0 +1,185 @@
+"""
+Lettura e scrittura del database.xml di VirtualDJ.
+
+Il file (anche centinaia di MB, 100k <Song>) viene letto una sola volta con
+iterparse costruendo un indice FilePath -> <Song>; gli aggiornamenti di un
+intero lotto di brani si applicano in memoria e il file si riscrive una volta
+sola alla fine, invece di un parse + ricerca lineare + riscrittura per brano.
+La scrittura passa da safe_io: file temporaneo + fsync + rename atomico, con
+backup a rotazione e controllo che VirtualDJ non abbia toccato il file nel frattempo.
+"""
+import ntpath
+import os
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+from safe_io import DEFAULT_BACKUPS, FileSignature, atomic_write, file_signature
+
+# Tipo di <Poi> che rappresenta un hot cue (gli altri: beatgrid, automix, loop, ...)
+CUE_POI_TYPES = (None, "cue")
+# <Poi> con un Num che non è un numero di hot cue
+GRID_POI_TYPES = ("beatgrid", "automix")
+
+Cue = Union[float, Mapping]
+
+
+def path_key(file_path: str) -> str:
+    """Chiave di confronto dei percorsi: VirtualDJ usa percorsi Windows, senza distinzione
+    maiuscole/minuscole, mentre i dialoghi Tk restituiscono anche '/' come separatore."""
+    return ntpath.normcase(file_path)
+
+
+def cue_attributes(cue: Cue, num: int) -> Dict[str, str]:
+    """Attributi di un <Poi> hot cue da un tempo in secondi o da un dict {'time', 'label'}."""
+    if isinstance(cue, Mapping):
+        time, label = float(cue['time']), cue.get('label') or f"Cue {num}"
+    else:
+        time, label = float(cue), f"Cue {num}"
+    return {"Name": str(label), "Pos": f"{time:.6f}", "Num": str(num), "Type": "cue"}
+
+
+def free_slots(used: Iterable[int]) -> Iterable[int]:
+    """Numeri di hot cue da 1 in su, saltando quelli già occupati."""
+    used = set(used)
+    num = 0
+    while True:
+        num += 1
+        if num not in used:
+            yield num
+
+
+class VdjDatabase:
+    """database.xml di VirtualDJ in memoria, indicizzato per FilePath."""
+
+    def __init__(self, path: str, tree: ET.ElementTree, songs: Dict[str, ET.Element],
+                 signature: Optional[FileSignature] = None):
+        self.path = path
+        self.signature = signature  # (mtime, dimensione) al momento della lettura
+        self.tree = tree
+        self.root = tree.getroot()
+        self.songs = songs
+        self.modified = False
+
+    @classmethod
+    def load(cls, path: str) -> "VdjDatabase":
+        """Legge il database con un solo passaggio iterparse e costruisce l'indice."""
+        signature = file_signature(path)
+        root = None
+        songs = {}
+        for event, elem in ET.iterparse(path, events=("start", "end")):
+            if root is None:
+                root = elem
+            elif event == "end" and elem.tag == "Song":
+                file_path = elem.get("FilePath")
+                if file_path:
+                    songs[path_key(file_path)] = elem
+        if root is None:
+            raise ValueError(f"database.xml vuoto: {path}")
+        return cls(path, ET.ElementTree(root), songs, signature)
+
+    def __len__(self) -> int:
+        return len(self.songs)
+
+    def __contains__(self, file_path: str) -> bool:
+        return path_key(file_path) in self.songs
+
+    def song(self, file_path: str) -> Optional[ET.Element]:
+        return self.songs.get(path_key(file_path))
+
+    def iter_songs(self) -> Iterable[Tuple[str, ET.Element]]:
+        """Coppie (FilePath originale, <Song>)."""
+        return ((elem.get("FilePath"), elem) for elem in self.songs.values())
+
+    # --- Modifiche ---
+
+    def add_song(self, file_path: str, st: Optional[os.stat_result] = None) -> ET.Element:
+        """Aggiunge un <Song> per un file non ancora presente nel database."""
+        st = st or os.stat(file_path)
+        song = ET.SubElement(self.root, "Song", {
+            "FilePath": file_path,
+            "FileSize": str(st.st_size),
+        })
+        ET.SubElement(song, "Infos", {"LastModified": str(int(st.st_mtime))})
+        self.songs[path_key(file_path)] = song
+        self.modified = True
+        return song
+
+    def set_cues(self, file_path: str, cues: List[Cue], create: bool = True) -> bool:
+        """Sostituisce gli hot cue di un brano (beatgrid e automix restano intatti).
+
+        Restituisce False se il brano non è nel database e create è False.
+        """
+        song = self.song(file_path)
+        if song is None:
+            if not create:
+                return False
+            song = self.add_song(file_path)
+        used = []
+        for poi in song.findall("Poi"):
+            if poi.get("Type") in CUE_POI_TYPES:
+                song.remove(poi)
+            elif poi.get("Type") not in GRID_POI_TYPES and (poi.get("Num") or "").isdigit():
+                # Loop e azioni occupano anche loro un numero di hot cue
+                used.append(int(poi.get("Num")))
+        for num, cue in zip(free_slots(used), cues):
+            ET.SubElement(song, "Poi", cue_attributes(cue, num))
+        self.modified = True
+        return True
+
+    def set_beatgrid(self, file_path: str, pos: float, bpm: Optional[float] = None,
+                     create: bool = True) -> bool:
+        """Imposta l'ancora della griglia (<Poi Type="beatgrid">) e, se noto, il tempo
+        (<Scan Bpm>, in secondi per battito come lo salva VirtualDJ)."""
+        song = self.song(file_path)
+        if song is None:
+            if not create:
+                return False
+            song = self.add_song(file_path)
+        grid = next((p for p in song.findall("Poi") if p.get("Type") == "beatgrid"), None)
+        if grid is None:
+            grid = ET.SubElement(song, "Poi", {"Type": "beatgrid"})
+        grid.set("Pos", f"{pos:.6f}")
+        if bpm:
+            scan = song.find("Scan")
+            if scan is None:
+                scan = ET.SubElement(song, "Scan")
+            scan.set("Bpm", f"{60.0 / bpm:.6f}")
+        self.modified = True
+        return True
+
+    def apply_cues(self, updates: Mapping[str, List[Cue]], create: bool = True) -> Tuple[int, int, List[str]]:
+        """Applica in memoria gli hot cue di un lotto di brani.
+
+        Restituisce (brani aggiornati, brani aggiunti, brani non trovati).
+        """
+        updated, added, missing = 0, 0, []
+        for file_path, cues in updates.items():
+            existed = file_path in self
+            if self.set_cues(file_path, cues, create=create):
+                if existed:
+                    updated += 1
+                else:
+                    added += 1
+            else:
+                missing.append(file_path)
+        return updated, added, missing
+
+    # --- Scrittura ---
+
+    def save(self, path: Optional[str] = None, backups: int = DEFAULT_BACKUPS,
+             force: bool = False) -> str:
+        """Scrive il database (una volta sola, dopo tutte le modifiche) in modo atomico.
+
+        Solleva safe_io.ConcurrentModificationError se il file è cambiato dopo
+        load() (es. VirtualDJ aperto che ha salvato): force=True scrive comunque.
+        """
+        path = path or self.path
+        expected = self.signature if (path == self.path and not force) else None
+        # ElementTree serializza a flusso nel file temporaneo, senza costruire
+        # l'intero documento come stringa in memoria
+        with atomic_write(path, backups=backups, expected=expected) as f:
+            self.tree.write(f, encoding="UTF-8", xml_declaration=True)
+        if path == self.path:
+            self.signature = file_signature(path)
+        self.modified = False
+        return path
@@ -0,0 +1,108 @@
+"""
+Importazione dei dati di analisi già presenti nel database.xml di VirtualDJ.
+
+VirtualDJ salva per ogni brano analizzato un <Scan Bpm=... Key=...> (Bpm in
+secondi per battito, non in battiti al minuto), l'ancora della griglia
+(<Poi Type="beatgrid" Pos=...>) e la durata (<Infos SongLength=...>). Qui il
+database viene letto a flusso (memoria costante anche con 100k brani) e i
+valori convertiti finiscono nell'archivio della libreria, da dove l'analisi
+li usa come stima iniziale del tempo ("prior") oppure al posto della stima di
+BPM e chiave ("skip").
+"""
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from track_analysis import CAMELOT_MAP
+
+# Modi d'uso dei dati importati durante l'analisi
+VDJ_MODES = ("prior", "skip")
+
+# VirtualDJ scrive le alterazioni come bemolli (Eb, Ebm): qui si usano i diesis
+FLAT_TO_SHARP = {
+    'Db': 'C#', 'Eb': 'D#', 'Gb': 'F#', 'Ab': 'G#', 'Bb': 'A#',
+    'Cb': 'B', 'Fb': 'E', 'E#': 'F', 'B#': 'C',
+}
+CAMELOT_TO_KEY = {code: key for key, code in CAMELOT_MAP.items()}
+
+_KEY_RE = re.compile(r"^([A-G][#b]?)\s*(m|min|minor)?$", re.IGNORECASE)
+
+
+@dataclass
+class VdjScan:
+    """Dati di un brano come analizzato da VirtualDJ."""
+    file_path: str
+    bpm: Optional[float] = None          # Battiti al minuto
+    key: Optional[str] = None            # Notazione di CAMELOT_MAP (es. 'D#m')
+    beatgrid: Optional[float] = None     # Posizione (s) del primo battito della griglia
+    song_length: Optional[float] = None  # Durata (s)
+
+
+def normalize_key(raw: Optional[str]) -> Optional[str]:
+    """Chiave VirtualDJ ('Ebm', 'A#', '8A', ...) nella notazione del progetto, None se non valida."""
+    if not raw:
+        return None
+    raw = raw.strip()
+    if raw.upper() in CAMELOT_TO_KEY:
+        return CAMELOT_TO_KEY[raw.upper()]
+    match = _KEY_RE.match(raw)
+    if not match:
+        return None
+    note = match.group(1)[0].upper() + match.group(1)[1:]
+    note = FLAT_TO_SHARP.get(note, note)
+    key = note + ('m' if match.group(2) else '')
+    return key if key in CAMELOT_MAP else None
+
+
+def _float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def seconds_per_beat_to_bpm(value: Optional[float]) -> Optional[float]:
+    """VirtualDJ salva il tempo come durata di un battito in secondi."""
+    if not value or value <= 0:
+        return None
+    return 60.0 / value
+
+
+def parse_song(song: ET.Element) -> Optional[VdjScan]:
+    """VdjScan da un elemento <Song>; None se il brano non ha un percorso."""
+    file_path = song.get("FilePath")
+    if not file_path:
+        return None
+    scan = song.find("Scan")
+    infos = song.find("Infos")
+    beatgrid = next((p for p in song.iter("Poi") if p.get("Type") == "beatgrid"), None)
+    return VdjScan(
+        file_path=file_path,
+        bpm=seconds_per_beat_to_bpm(_float(scan.get("Bpm"))) if scan is not None else None,
+        key=normalize_key(scan.get("Key")) if scan is not None else None,
+        beatgrid=_float(beatgrid.get("Pos")) if beatgrid is not None else None,
+        song_length=_float(infos.get("SongLength")) if infos is not None else None,
+    )
+
+
+def iter_vdj_scans(db_path: str) -> Iterator[VdjScan]:
+    """Legge database.xml a flusso e genera i brani con almeno BPM o chiave."""
+    root = None
+    for event, elem in ET.iterparse(db_path, events=("start", "end")):
+        if root is None:
+            root = elem
+            continue
+        if event != "end" or elem.tag != "Song":
+            continue
+        scan = parse_song(elem)
+        # I <Song> già letti vengono rimossi: in memoria resta un brano alla volta
+        root.clear()
+        if scan is not None and (scan.bpm or scan.key):
+            yield scan
+
+
+def import_vdj_database(store, db_path: str) -> int:
+    """Registra nell'archivio (LibraryStore) i dati di VirtualDJ; restituisce i brani importati."""
+    return store.save_vdj_scans(iter_vdj_scans(db_path))
+
@@ -0,0 +1,9 @@
+"""
+I moduli di src/ si importano a vicenda per nome (come quando si lancia
+djanalyzer.py da src/): i test mettono src/ nel percorso di import.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
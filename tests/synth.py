@@ -0,0 +1,332 @@
+"""
+Brani sintetici per i test: batteria, pad e arrangiamenti con posizioni note,
+e i mix con voce e melodie strumentali su cui scripts/voice_training.py stima
+il rilevatore di voce.
+
+Tutto è deterministico (generatore con seme) e a 22050 Hz, il sample rate del
+profilo di analisi standard.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.signal as ss
+
+SR = 22050
+
+# Mix con voce: durata, quota dei brani con voce e con una melodia strumentale
+TRACK_SECONDS = 30
+VOCAL_TRACKS = 0.75
+LEAD_TRACKS = 0.6
+LEAD_KINDS = ("square", "saw", "pluck", "organ")
+
+# Vocali del canto a sorgente e filtro: formanti F1-F4 (Hz) con la loro banda
+VOWELS = {
+    "a": ((730, 90), (1090, 110), (2440, 160), (3400, 250)),
+    "e": ((530, 60), (1840, 100), (2480, 150), (3500, 250)),
+    "i": ((270, 60), (2290, 100), (3010, 200), (3700, 250)),
+    "o": ((570, 70), (840, 80), (2410, 160), (3400, 250)),
+    "u": ((300, 60), (870, 80), (2240, 150), (3300, 250)),
+}
+
+
+def _decay(n: int, attack: float, decay: float) -> np.ndarray:
+    t = np.arange(n) / SR
+    return np.minimum(1.0, t / attack) * np.exp(-t / decay)
+
+
+def kick() -> np.ndarray:
+    """Cassa: sinusoide in discesa da 150 a 50 Hz con il click del battente."""
+    n = int(0.3 * SR)
+    t = np.arange(n) / SR
+    phase = 2 * np.pi * np.cumsum(50 + 100 * np.exp(-t / 0.03)) / SR
+    body = np.sin(phase) * _decay(n, 0.002, 0.12)
+    click = noise_hit(np.random.default_rng(0), 0.3, (1000, 5000), 0.004)
+    return body + 0.5 * click
+
+
+def noise_hit(rng: np.random.Generator, seconds: float, band: Tuple[float, float],
+              decay: float) -> np.ndarray:
+    n = int(seconds * SR)
+    sos = ss.butter(2, [band[0], band[1]], 'band', fs=SR, output='sos')
+    return ss.sosfilt(sos, rng.standard_normal(n)) * _decay(n, 0.001, decay)
+
+
+def beat_times(bpm: float, duration: float, end_bpm: Optional[float] = None) -> np.ndarray:
+    """Battiti da 0 s a tempo costante, o con una rampa lineare del tempo fino a end_bpm."""
+    end_bpm = end_bpm or bpm
+    times, t = [], 0.0
+    while t < duration:
+        times.append(t)
+        t += 60.0 / (bpm + (end_bpm - bpm) * t / duration)
+    return np.array(times)
+
+
+def place(y: np.ndarray, sound: np.ndarray, time: float, gain: float = 1.0) -> None:
+    start = int(round(time * SR))
+    if start >= y.size:
+        return
+    part = sound[:y.size - start]
+    y[start:start + part.size] += gain * part
+
+
+def sub_hit() -> np.ndarray:
+    """Nota di basso a 45 Hz (con armoniche fino a 135 Hz) lunga mezzo secondo:
+    l'accento del primo battito della misura."""
+    n = int(0.5 * SR)
+    phase = 2 * np.pi * 45 * np.arange(n) / SR
+    return (np.sin(phase) + 0.5 * np.sin(2 * phase) + 0.3 * np.sin(3 * phase)) * _decay(n, 0.005, 0.25)
+
+
+def drums(beats: Sequence[float], n: int, rng: np.random.Generator,
+          accent: float = 1.0) -> np.ndarray:
+    """Cassa su ogni battito, basso sul primo di ogni misura (accent ne è il volume),
+    rullante sul 2 e 4, hi-hat in levare."""
+    y = np.zeros(n)
+    k = kick()
+    sub = sub_hit()
+    snare = noise_hit(rng, 0.2, (200, 5000), 0.06) * 0.15
+    hat = noise_hit(rng, 0.05, (6000, 10000), 0.015) * 0.1
+    beats = np.asarray(beats)
+    for i, t in enumerate(beats):
+        place(y, k, t)
+        if i % 4 == 0 and accent:
+            place(y, sub, t, accent)
+        if i % 4 in (1, 3):
+            place(y, snare, t)
+        if i + 1 < beats.size:
+            place(y, hat, (t + beats[i + 1]) / 2)
+    return y
+
+
+def pad(n: int, chord_seconds: float, rng: np.random.Generator,
+        roots: Optional[Sequence[float]] = None) -> np.ndarray:
+    """Accordi maggiori tenuti (fondamentale, terza, quinta) che cambiano ogni chord_seconds."""
+    y = np.zeros(n)
+    step = int(chord_seconds * SR)
+    for i, start in enumerate(range(0, n, step)):
+        m = min(step, n - start)
+        t = np.arange(m) / SR
+        root = roots[i % len(roots)] if roots else rng.uniform(130, 260)
+        ramp = np.minimum(1.0, t / 0.05) * np.minimum(1.0, (m / SR - t) / 0.05)
+        for ratio in (1.0, 1.26, 1.5):
+            for h in range(1, 6):
+                y[start:start + m] += np.sin(2 * np.pi * root * ratio * h * t) / h ** 1.5 * ramp
+    return 0.1 * y / (np.sqrt(np.mean(y ** 2)) + 1e-9)
+
+
+def arrangement(bpm: float, plan: List[Tuple[int, bool, bool]], seed: int = 0,
+                lead_in: float = 0.0, chord_bars: int = 1,
+                progression: Optional[Sequence[float]] = None) -> Tuple[np.ndarray, List[float]]:
+    """Brano a tempo costante da un piano [(misure, batteria, pad), ...].
+
+    Restituisce (segnale, inizio di ogni sezione in secondi). lead_in secondi di
+    silenzio precedono il primo battito; nelle sezioni senza batteria gli accordi
+    cambiano ogni chord_bars misure. progression (fondamentali in Hz) è un giro
+    di accordi che ogni sezione ripete dall'inizio; senza, gli accordi sono casuali.
+    """
+    rng = np.random.default_rng(seed)
+    bar = 4 * 60.0 / bpm
+    total_bars = sum(bars for bars, _, _ in plan)
+    n = int((lead_in + total_bars * bar + 1.0) * SR)
+    y = np.zeros(n)
+    starts, bar_index = [], 0
+    for bars, with_drums, with_pad in plan:
+        start = lead_in + bar_index * bar
+        starts.append(start)
+        length = int(bars * bar * SR)
+        part = np.zeros(length)
+        if with_drums:
+            part += drums(np.arange(bars * 4) * bar / 4, length, rng)
+        if with_pad:
+            part += pad(length, bar * (1 if with_drums else chord_bars), rng, progression)
+        place(y, part, start)
+        bar_index += bars
+    return (0.9 * y / np.abs(y).max()).astype(np.float32), starts
+
+
+# =============================================
+# Mix con voce (stima e test del rilevatore di voce)
+# =============================================
+
+def _band_noise(rng: np.random.Generator, n: int, band: Tuple[float, float]) -> np.ndarray:
+    sos = ss.butter(2, band, 'band', fs=SR, output='sos')
+    return ss.sosfilt(sos, rng.standard_normal(n))
+
+
+def mix_drums(n: int, bpm: float, rng: np.random.Generator) -> np.ndarray:
+    """Cassa in battere, rullante sul 2 e 4, hi-hat a ottavi."""
+    y = np.zeros(n)
+    m = int(0.4 * SR)
+    t = np.arange(m) / SR
+    kick = np.sin(2 * np.pi * np.cumsum(50 + 100 * np.exp(-t / 0.03)) / SR) * _decay(m, 0.002, 0.15)
+    snare = _band_noise(rng, int(0.25 * SR), (200, 5000)) * _decay(int(0.25 * SR), 0.001, 0.08) * 0.7
+    hat = _band_noise(rng, int(0.06 * SR), (7000, 10000)) * _decay(int(0.06 * SR), 0.001, 0.02) * 0.3
+    step = 60.0 / bpm / 2
+    for i in range(int(n / SR / step) + 1):
+        start = int(i * step * SR)
+        sounds = [hat] + ([kick] if i % 2 == 0 else []) + ([snare] if i % 4 == 2 else [])
+        for sound in sounds:
+            part = sound[:n - start]
+            y[start:start + part.size] += part
+    return y * rng.uniform(0.3, 1.0)
+
+
+def harmonic_tone(f0: float, n: int, rng: np.random.Generator, harmonics: int = 12, tilt: float = 1.5,
+                  odd_only: bool = False, vibrato: float = 0.0) -> np.ndarray:
+    """Nota con armoniche di ampiezza 1 / k^tilt (solo dispari per l'onda quadra)."""
+    t = np.arange(n) / SR
+    f = f0 * (1 + vibrato * np.sin(2 * np.pi * rng.uniform(4.5, 6.5) * t + rng.uniform(0, 6)))
+    phase = 2 * np.pi * np.cumsum(f) / SR
+    y = np.zeros(n)
+    for k in range(1, harmonics + 1):
+        if f0 * k > SR / 2 - 500:
+            break
+        if odd_only and k % 2 == 0:
+            continue
+        y += np.sin(k * phase + rng.uniform(0, 6)) / k ** tilt
+    return y
+
+
+def pads(n: int, bpm: float, rng: np.random.Generator) -> np.ndarray:
+    """Accordi tenuti (un accordo per misura) con il basso."""
+    y = np.zeros(n)
+    bar = int(4 * 60.0 / bpm * SR)
+    for start in range(0, n, bar):
+        m = min(bar, n - start)
+        root = rng.uniform(130, 400)
+        fade = np.minimum(1.0, np.arange(m) / (0.05 * SR))
+        for ratio in (1.0, 1.26, 1.5):
+            y[start:start + m] += harmonic_tone(root * ratio, m, rng, 8, 1.9) * fade
+        y[start:start + m] += 1.5 * harmonic_tone(root / 4, m, rng, 4, 3.0)
+    return y / np.sqrt(np.mean(y ** 2) + 1e-12)
+
+
+def lead(n: int, bpm: float, rng: np.random.Generator, kind: str) -> np.ndarray:
+    """Melodia strumentale a ottavi o sedicesimi, con pause."""
+    y = np.zeros(n)
+    step = int(60.0 / bpm / rng.choice([2, 4]) * SR)
+    base = rng.uniform(200, 500)
+    for start in range(0, n, step):
+        if rng.random() < 0.25:
+            continue
+        m = min(step * int(rng.integers(1, 3)), n - start)
+        f0 = base * 2 ** (rng.integers(-5, 13) / 12)
+        vibrato = 0.004 * rng.random() if rng.random() < 0.3 else 0.0
+        if kind == "square":
+            tone = harmonic_tone(f0, m, rng, 25, 1.0, odd_only=True, vibrato=vibrato)
+            env = _decay(m, 0.005, 10.0)
+        elif kind == "saw":
+            tone = harmonic_tone(f0, m, rng, 25, 1.0, vibrato=vibrato)
+            env = _decay(m, 0.005, 10.0)
+        elif kind == "pluck":
+            tone = harmonic_tone(f0, m, rng, 15, 1.2)
+            env = _decay(m, 0.002, 0.15)
+        else:
+            tone = harmonic_tone(f0, m, rng, 8, 0.7, vibrato=vibrato)
+            env = _decay(m, 0.01, 10.0)
+        release = np.minimum(1.0, (m - np.arange(m)) / (0.005 * SR))
+        y[start:start + m] += tone * env * release
+    return y / np.sqrt(np.mean(y ** 2) + 1e-12)
+
+
+def _formants(f: np.ndarray, formants: Sequence[Tuple[float, float, float]]) -> np.ndarray:
+    gain = 0.02
+    for center, width, amplitude in formants:
+        gain = gain + amplitude * np.exp(-0.5 * ((f - center) / width) ** 2)
+    return gain
+
+
+def voice_phrase(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Sillabe cantate: armoniche filtrate da tre formanti, vibrato, glissato e consonanti."""
+    y = np.zeros(n)
+    pos = 0
+    base = rng.uniform(110, 350)
+    while pos < n:
+        m = min(int(rng.uniform(0.15, 0.6) * SR), n - pos)
+        t = np.arange(m) / SR
+        f0 = base * 2 ** (rng.choice([-5, -3, -2, 0, 2, 3, 5, 7]) / 12)
+        glide = f0 * (1 + 0.02 * rng.standard_normal() * np.minimum(1.0, t / 0.05))
+        f = glide * (1 + 0.01 * rng.uniform(0.3, 1.5) * np.sin(2 * np.pi * rng.uniform(4.5, 6.5) * t))
+        phase = 2 * np.pi * np.cumsum(f) / SR
+        formants = [(rng.uniform(300, 850), 80, 1.0), (rng.uniform(900, 2400), 120, 0.6),
+                    (rng.uniform(2500, 3300), 150, 0.3)]
+        syllable = np.zeros(m)
+        for k in range(1, 40):
+            if f0 * k > SR / 2 - 500:
+                break
+            syllable += _formants(k * f, formants) * np.sin(k * phase)
+        syllable *= np.minimum(1.0, t / 0.03) * np.minimum(1.0, (m / SR - t) / 0.05)
+        if rng.random() < 0.5:
+            c = min(int(0.04 * SR), m)
+            syllable[:c] += _band_noise(rng, c, (2000, 8000)) * 0.3
+        y[pos:pos + m] += syllable
+        pos += m + int(rng.uniform(0, 0.12) * SR)
+    return y
+
+
+def synthetic_track(rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """(segnale, voce presente per campione) di un brano sintetico."""
+    n = TRACK_SECONDS * SR
+    bpm = rng.uniform(90, 140)
+    backing = mix_drums(n, bpm, rng)
+    if rng.random() < 0.9:
+        backing += 0.1 * rng.uniform(0.5, 1.5) * pads(n, bpm, rng)
+    if rng.random() < LEAD_TRACKS:
+        kind = LEAD_KINDS[rng.integers(len(LEAD_KINDS))]
+        backing += 0.1 * rng.uniform(0.5, 2.0) * lead(n, bpm, rng, kind)
+
+    label = np.zeros(n, dtype=bool)
+    vocals = np.zeros(n)
+    if rng.random() < VOCAL_TRACKS:
+        pos = int(rng.uniform(2, 10) * SR)
+        while pos < n:
+            m = min(int(rng.uniform(2, 8) * SR), n - pos)
+            vocals[pos:pos + m] = voice_phrase(m, rng)
+            label[pos:pos + m] = True
+            pos += m + int(rng.uniform(1, 5) * SR)
+        level = 10 ** (rng.uniform(-10, 3) / 20) * np.sqrt(np.mean(backing ** 2))
+        vocals *= level / np.sqrt(np.mean(vocals[label] ** 2))
+    y = backing + vocals
+    y = 0.9 * y / np.abs(y).max()
+    if rng.random() < 0.5:
+        y *= np.linspace(rng.uniform(0.3, 1.0), 1.0, n)
+    return y.astype(np.float32), label
+
+
+def sung_vowels(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Canto con un modello diverso da voice_phrase: treno di impulsi glottali di
+    Rosenberg filtrato da quattro risonatori in cascata (una vocale per sillaba).
+
+    L'intonazione segue la voce vera: portamento di 60 ms tra le note, vibrato
+    a 5-7 Hz di mezzo semitono, jitter dello 0.5% e un po' di soffio.
+    """
+    y = np.zeros(n)
+    pos = 0
+    base = rng.uniform(120, 300)
+    previous = base
+    while pos < n:
+        m = min(int(rng.uniform(0.2, 0.5) * SR), n - pos)
+        t = np.arange(m) / SR
+        target = base * 2 ** (rng.choice([-4, -2, 0, 3, 5, 7]) / 12)
+        glide = target + (previous - target) * np.exp(-t / 0.06)
+        f = glide * 2 ** (0.5 / 12 * np.sin(2 * np.pi * rng.uniform(5.0, 7.0) * t))
+        previous = target
+        source = np.zeros(m)
+        start = 0.0
+        while start < m:
+            period = SR / f[int(start)] * (1 + 0.005 * rng.standard_normal())
+            opening, closing = int(0.4 * period), int(0.16 * period)
+            pulse = np.concatenate([0.5 * (1 - np.cos(np.pi * np.arange(opening) / opening)),
+                                    np.cos(0.5 * np.pi * np.arange(closing) / closing)])
+            place(source, pulse, start / SR)
+            start += period
+        # Derivata del flusso glottale (radiazione dalle labbra) e soffio 26 dB sotto
+        source = np.diff(source, prepend=0.0)
+        source += 0.05 * source.std() * rng.standard_normal(m)
+        for center, width in VOWELS[rng.choice(list(VOWELS))]:
+            radius = np.exp(-np.pi * width / SR)
+            a = [1.0, -2 * radius * np.cos(2 * np.pi * center / SR), radius ** 2]
+            source = ss.lfilter([1.0 - radius], a, source)
+        y[pos:pos + m] += source * np.minimum(1.0, t / 0.03) * np.minimum(1.0, (m / SR - t) / 0.05)
+        pos += m + int(rng.uniform(0.0, 0.15) * SR)
+    return y
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from beatgrid import fit_beatgrid
+from features import TrackFeatures
+from tests.synth import SR, arrangement, drums, pad, place
+
+
+def _phase_error(grid, downbeat: float, bpm: float) -> float:
+    """Distanza (in misure, -0.5..0.5) tra il downbeat stimato e quello vero."""
+    bar = 4 * 60.0 / bpm
+    return ((grid.downbeat - downbeat) / bar + 0.5) % 1.0 - 0.5
+
+
+@pytest.mark.parametrize("bpm", [120, 125, 128, 174])
+def test_drumless_breakdown_keeps_the_count(bpm):
+    # 16 misure piene, 16 di soli pad (accordi ogni 2 misure), 16 piene
+    y, starts = arrangement(bpm, [(16, True, True), (16, False, True), (16, True, True)],
+                            seed=1, lead_in=0.5, chord_bars=2)
+    grid = fit_beatgrid(TrackFeatures(y=y, sr=SR))
+
+    assert grid.bpm == pytest.approx(bpm, abs=0.02)
+    # Dopo 48 misure la griglia è ancora sul battito (< 10 ms)
+    last = starts[-1] + 16 * 4 * 60.0 / bpm
+    n = round((last - grid.first_beat) / grid.period)
+    assert abs(grid.first_beat + n * grid.period - last) < 0.010
+    assert abs(_phase_error(grid, starts[0], bpm)) < 0.02
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_downbeat_from_bass_accent_without_chord_changes(seed):
+    # Un solo accordo tenuto: il primo battito si riconosce solo dall'accento del basso;
+    # seed % 4 battiti in levare prima della prima misura
+    rng = np.random.default_rng(seed)
+    bpm = rng.uniform(118, 132)
+    beat = 60.0 / bpm
+    first = rng.uniform(0.2, 1.5)
+    pickup = seed % 4
+    n = int((first + 26 * 4 * beat) * SR)
+    y = drums(first + (pickup + np.arange(24 * 4)) * beat, n, rng)
+    y += drums(first + np.arange(pickup) * beat, n, rng, accent=0.0)
+    place(y, pad(n, 1e9, rng, roots=[rng.uniform(130, 260)]), first)
+
+    grid = fit_beatgrid(TrackFeatures(y=(0.9 * y / np.abs(y).max()).astype(np.float32), sr=SR),
+                        start_bpm=bpm)
+    assert abs(_phase_error(grid, first + pickup * beat, bpm)) < 0.02
+
+
+def test_downbeat_from_chord_changes():
+    # Nessun accento di basso: decidono gli accordi, che cambiano in battere
+    rng = np.random.default_rng(3)
+    bpm, first = 124.0, 0.7
+    bar = 4 * 60.0 / bpm
+    n = int((first + 25 * bar) * SR)
+    beats = first + bar / 4 + np.arange(24 * 4) * bar / 4   # parte dal secondo battito
+    y = drums(beats, n, rng, accent=0.0)
+    place(y, pad(n, bar, rng), first)
+
+    grid = fit_beatgrid(TrackFeatures(y=(0.9 * y / np.abs(y).max()).astype(np.float32), sr=SR),
+                        start_bpm=bpm)
+    assert abs(_phase_error(grid, first, bpm)) < 0.02
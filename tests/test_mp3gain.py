@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+import soundfile as sf
+
+from mp3gain import UNDO_KEY, apply_gain, read_ape_tag, undo_gain
+from tests.synth import SR
+
+
+def _mp3(path) -> str:
+    t = np.arange(3 * SR) / SR
+    sf.write(str(path), 0.2 * np.sin(2 * np.pi * 440 * t), SR, format="MP3")
+    return str(path)
+
+
+def test_undo_tag_stores_the_reverting_steps(tmp_path):
+    path = _mp3(tmp_path / "a.mp3")
+    original = open(path, "rb").read()
+    assert apply_gain(path, 2) == 2
+    assert apply_gain(path, 1) == 1
+    with open(path, "rb") as f:
+        items, _, _ = read_ape_tag(f.read())
+    assert items[UNDO_KEY][1] == b"-003,-003,N"
+    assert undo_gain(path) == 3
+    assert open(path, "rb").read() == original
+
+
+def test_gain_leaves_hard_links_untouched(tmp_path):
+    path = _mp3(tmp_path / "a.mp3")
+    link = str(tmp_path / "b.mp3")
+    os.link(path, link)
+    original = open(path, "rb").read()
+    assert apply_gain(link, 2) == 2
+    assert open(path, "rb").read() == original
+    assert open(link, "rb").read() != original
+    assert os.stat(path).st_nlink == 1
@@ -0,0 +1,62 @@
+import numpy as np
+import soundfile as sf
+
+from beatgrid import fit_beatgrid
+from features import TrackFeatures
+from quantization import STATUS_QUANTIZED, TOLERANCE_MS, quantizza_audio, render_warp, warp_anchors
+from tests.synth import SR, beat_times, drums, pad, place
+
+
+def _ramp(end_bpm: float, seconds: float = 90.0) -> np.ndarray:
+    """Batteria e pad con il tempo che sale da 120 a end_bpm."""
+    rng = np.random.default_rng(0)
+    n = int((seconds + 1.5) * SR)
+    y = drums(beat_times(120, seconds, end_bpm=end_bpm) + 0.5, n, rng)
+    place(y, pad(n, 2.0, rng), 0.5)
+    return (0.9 * y / np.abs(y).max()).astype(np.float32)
+
+
+def test_ramp_moves_every_beat_off_the_grid():
+    feats = TrackFeatures(y=_ramp(130), sr=SR)
+    grid = fit_beatgrid(feats, start_bpm=125)
+    src, dst, moved = warp_anchors(grid, feats.y.size / SR)
+
+    # Sui bordi della rampa i battiti sono a più di un quarto di periodo dalla griglia:
+    # sono comunque battiti veri e vanno spostati
+    off = np.abs(grid.deviations()) * 1000.0 > TOLERANCE_MS
+    assert grid.reliable.mean() > 0.95
+    assert moved.sum() == np.sum(off & grid.reliable)
+    assert moved.sum() > 0.8 * grid.beats.size
+    assert np.all(np.diff(dst) > 0)
+
+
+def test_quantized_ramp_lands_on_the_grid(tmp_path):
+    path = str(tmp_path / "rampa.wav")
+    sf.write(path, _ramp(124), SR)
+    report = quantizza_audio(path, str(tmp_path / "out"))
+    assert report.status == STATUS_QUANTIZED
+
+    y, sr = sf.read(report.output_path, dtype='float32')
+    grid = fit_beatgrid(TrackFeatures(y=y, sr=sr))
+    deviation = np.abs(grid.deviations()[grid.reliable]) * 1000.0
+    assert np.mean(deviation <= TOLERANCE_MS) > 0.9
+
+
+def test_warp_keeps_a_tone_continuous():
+    # Battiti spostati di ±10 ms: un'unica passata non deve fare clic alle giunzioni
+    t = np.arange(30 * SR) / SR
+    y = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    beats = np.arange(0.5, 29.5, 0.5)
+    shift = np.random.default_rng(0).choice([-0.01, 0.0, 0.01], beats.size)
+    src = np.concatenate(([0.0], beats, [30.0]))
+    dst = np.concatenate(([0.0], beats + shift, [30.0]))
+
+    warped = render_warp(y, SR, src, dst)
+    assert warped.size == y.size
+    assert np.abs(np.diff(warped)).max() < 1.1 * np.abs(np.diff(y)).max()
+
+
+def test_unmoved_anchors_leave_the_signal_untouched():
+    y = np.random.default_rng(1).standard_normal((2, 5 * SR)).astype(np.float32) * 0.3
+    anchors = np.array([0.0, 1.0, 2.5, 5.0])
+    assert np.allclose(render_warp(y, SR, anchors, anchors), y, atol=1e-5)
@@ -0,0 +1,39 @@
+import os
+import stat
+
+import pytest
+
+from safe_io import clone_file
+
+
+def test_clone_is_independent_of_the_original(tmp_path):
+    src, dst = tmp_path / "a.mp3", tmp_path / "b.mp3"
+    src.write_bytes(b"originale")
+    assert clone_file(str(src), str(dst)) != "hardlink"
+    with open(dst, "r+b") as f:
+        f.write(b"MODIFICA")
+    assert src.read_bytes() == b"originale"
+
+
+def test_hardlink_only_for_read_only_files(tmp_path):
+    src, dst = tmp_path / "a.mp3", tmp_path / "b.mp3"
+    src.write_bytes(b"originale")
+    assert clone_file(str(src), str(dst), hardlink=True) != "hardlink"
+    os.chmod(src, stat.S_IRUSR | stat.S_IRGRP)
+    assert clone_file(str(src), str(dst), hardlink=True) == "hardlink"
+    assert os.stat(src).st_nlink == 2
+
+
+def test_clone_onto_itself_keeps_the_original(tmp_path):
+    src = tmp_path / "a.mp3"
+    src.write_bytes(b"originale")
+    for dst in (src, tmp_path / "." / "a.mp3"):
+        with pytest.raises(ValueError):
+            clone_file(str(src), str(dst))
+    assert src.read_bytes() == b"originale"
+
+    # Un altro nome dello stesso file si sostituisce con una copia
+    link = tmp_path / "link.mp3"
+    os.symlink(src, link)
+    assert clone_file(str(src), str(link)) != "hardlink"
+    assert not link.is_symlink() and src.read_bytes() == b"originale"
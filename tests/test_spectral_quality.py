@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from spectral_quality import spectral_quality
+
+SR = 44100
+
+
+@pytest.mark.parametrize("cutoff_khz", [11, 16, 17, 18, 19])
+def test_brickwall_cutoff(tmp_path, cutoff_khz):
+    # Rumore rosa tagliato di netto a cutoff_khz, come il passa-basso di un encoder
+    rng = np.random.default_rng(0)
+    x = np.fft.rfft(rng.standard_normal(20 * SR))
+    freqs = np.fft.rfftfreq(20 * SR, 1 / SR)
+    y = np.fft.irfft(x / np.sqrt(np.maximum(freqs, 20.0)) * (freqs < cutoff_khz * 1000), 20 * SR)
+    path = str(tmp_path / "taglio.wav")
+    sf.write(path, 0.3 * y / np.abs(y).max(), SR, subtype='PCM_16')
+
+    assert spectral_quality(path).cutoff_khz == pytest.approx(cutoff_khz, abs=0.3)
+
+
+def test_full_band_has_no_cutoff(tmp_path):
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / "piena.wav")
+    sf.write(path, 0.1 * rng.standard_normal(10 * SR), SR, subtype='PCM_16')
+
+    assert spectral_quality(path).cutoff_khz == pytest.approx(SR / 2000)
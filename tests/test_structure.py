@@ -0,0 +1,51 @@
+import pytest
+
+from features import TrackFeatures
+from structure import (LABEL_BREAKDOWN, LABEL_DROP, LABEL_GROOVE, LABEL_INTRO, Section,
+                       analizza_struttura, label_sections)
+from tests.synth import SR, arrangement
+
+# Giro di quattro accordi (fondamentali in Hz) ripetuto in ogni sezione
+PROGRESSION = [220.0, 174.6, 261.6, 196.0]
+
+
+@pytest.mark.parametrize("bpm", [122, 125, 128])
+def test_section_starts_on_known_bars(bpm):
+    # Intro di sola batteria, parte piena, breakdown senza batteria (accordi ogni 2 misure), parte piena
+    plan = [(16, True, False), (16, True, True), (16, False, True), (16, True, True)]
+    y, starts = arrangement(bpm, plan, seed=1, lead_in=0.5, chord_bars=2, progression=PROGRESSION)
+    structure = analizza_struttura(TrackFeatures(y=y, sr=SR))
+
+    assert structure.downbeat == pytest.approx(starts[0], abs=0.02)
+    found = [s.start for s in structure.sections]
+    assert len(found) == len(plan)
+    assert found[1:] == pytest.approx(starts[1:], abs=0.1)
+    breakdown = structure.sections[2]
+    assert breakdown.label == LABEL_BREAKDOWN and not breakdown.drums
+    assert structure.drop == pytest.approx(starts[3], abs=0.1)
+
+
+def test_drums_only_intro_and_outro_are_not_drops():
+    plan = [(16, True, False), (32, True, True), (16, True, False)]
+    y, _ = arrangement(126, plan, seed=2, lead_in=0.5, chord_bars=2, progression=PROGRESSION)
+    structure = analizza_struttura(TrackFeatures(y=y, sr=SR))
+
+    assert structure.sections[0].label == LABEL_INTRO
+    assert structure.drop != 0.0
+    assert all(s.tonal or s.label != LABEL_DROP for s in structure.sections)
+
+
+def test_steady_track_has_no_drop():
+    # Batteria e pad per 6 minuti: nessuna sezione spicca, anche se la novità la divide
+    sections = [Section(start=30.0 * i, end=30.0 * (i + 1), loudness_db=-0.5 * (i % 3))
+                for i in range(12)]
+    assert label_sections(sections) is None
+    assert {s.label for s in sections[1:-1]} == {LABEL_GROOVE}
+
+
+def test_drop_needs_a_quieter_section_before_it():
+    sections = [Section(0, 30, loudness_db=-6.0), Section(30, 60, loudness_db=0.0),
+                Section(60, 90, loudness_db=-1.0, vocal=0.8), Section(90, 120, loudness_db=-12.0, drums=False),
+                Section(120, 150, loudness_db=-0.5, vocal=0.8)]
+    assert label_sections(sections) == 120
+    assert [s.label for s in sections] == ["intro", "drop", "groove", "breakdown", "drop"]
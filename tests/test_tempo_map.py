@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from features import TrackFeatures
+from tempo_map import needs_quantization, tempo_map
+from tests.synth import SR, arrangement, beat_times, drums, pad, place
+
+
+def _features(y):
+    return TrackFeatures(y=(0.9 * y / np.abs(y).max()).astype(np.float32), sr=SR)
+
+
+def _drums_and_pad(beats, seconds):
+    rng = np.random.default_rng(0)
+    n = int(seconds * SR)
+    y = drums(beats, n, rng)
+    place(y, pad(n, 2.0, rng), 0.5)
+    return _features(y)
+
+
+@pytest.mark.parametrize("bpm", [118, 124, 128, 132, 140, 174])
+def test_breakdown_is_not_a_tempo_change(bpm):
+    # Intro, parte piena, breakdown senza batteria, parte piena: tempo costante
+    plan = [(16, True, False), (32, True, True), (16, False, True), (32, True, True)]
+    y, _ = arrangement(bpm, plan, seed=1, lead_in=0.5, chord_bars=2,
+                       progression=[220.0, 174.6, 261.6, 196.0])
+    tmap = tempo_map(TrackFeatures(y=y, sr=SR), reference_bpm=bpm)
+
+    assert tmap.is_constant, tmap.format_sections()
+    assert not needs_quantization(tmap)
+    assert tmap.median_bpm == pytest.approx(bpm, abs=1.0)
+    assert not tmap.confident.all()
+
+
+def test_ramp_drifts():
+    tmap = tempo_map(_drums_and_pad(beat_times(120, 90, end_bpm=130) + 0.5, 91.5))
+    assert not tmap.is_constant
+    assert tmap.drift_bpm_per_min == pytest.approx(6.7, abs=1.0)
+
+
+def test_step_gives_two_sections():
+    beats = np.concatenate([np.arange(0, 45, 60 / 120), 45 + np.arange(0, 45, 60 / 126)]) + 0.5
+    tmap = tempo_map(_drums_and_pad(beats, 92))
+    assert needs_quantization(tmap)
+    (_, end, first), (start, _, second) = tmap.sections
+    assert first == pytest.approx(120, abs=0.5) and second == pytest.approx(126, abs=0.5)
+    assert end == pytest.approx(45.5, abs=2) and start == pytest.approx(45.5, abs=2)
@@ -0,0 +1,29 @@
+import numpy as np
+
+from features import HOP_LENGTH, TrackFeatures
+from track_analysis import PRIOR_TOLERANCE_BPM, analyzer_version, calculate_bpm
+
+SR = 22050
+
+
+def _features_with_onsets(onset_env: np.ndarray) -> TrackFeatures:
+    feats = TrackFeatures(y=np.zeros(onset_env.size * HOP_LENGTH, dtype=np.float32), sr=SR)
+    feats.onset_env = onset_env   # cached_property: il valore dell'istanza ha la precedenza
+    return feats
+
+
+def test_prior_bpm_narrows_tempo_search():
+    # Cassa a 120 BPM e hi-hat in levare (240 BPM): senza prior vince la metà, 60 BPM
+    fps = SR / HOP_LENGTH
+    env = np.zeros(int(60 * fps))
+    env[np.round(np.arange(0, 60, 0.5) * fps).astype(int)] += 1.0
+    env[np.round(np.arange(0.25, 60, 0.5) * fps).astype(int)[:-1]] += 0.6
+    feats = _features_with_onsets(env)
+
+    assert calculate_bpm(feats) < 70
+    assert abs(calculate_bpm(feats, start_bpm=120) - 120) <= PRIOR_TOLERANCE_BPM
+
+
+def test_vdj_skip_results_have_their_own_version():
+    assert analyzer_version(vdj_mode="skip") != analyzer_version()
+    assert analyzer_version(vdj_mode="prior") == analyzer_version()
@@ -0,0 +1,24 @@
+import os
+import shutil
+
+from vdj_database import VdjDatabase
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      "src", "VirtualDJ_test", "database.xml")
+DOMINO = r"D:\ToolBox\TidalConvert\dance\Domino Dancing.mp3"
+
+
+def test_new_cues_skip_numbers_taken_by_actions(tmp_path):
+    path = str(tmp_path / "database.xml")
+    shutil.copy(SAMPLE, path)
+    db = VdjDatabase.load(path)
+    kept = [p.attrib for p in db.song(DOMINO).findall("Poi")]
+    db.set_cues(DOMINO, [10.0, 20.0, 30.0, 40.0, 50.0])
+    db.save(backups=0)
+
+    pois = VdjDatabase.load(path).song(DOMINO).findall("Poi")
+    cues = [p for p in pois if p.get("Type") == "cue"]
+    assert [p.get("Num") for p in cues] == ["1", "2", "3", "4", "6"]
+    assert [p.get("Name") for p in pois if p.get("Num") == "5"] == ["Break 1"]
+    # Griglia, automix e remix restano intatti
+    assert [p.attrib for p in pois if p.get("Type") != "cue"] == kept
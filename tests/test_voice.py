@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from features import TrackFeatures
+from voice import vocal_activity
+from tests.synth import LEAD_KINDS, SR, lead, mix_drums, pads, sung_vowels, voice_phrase
+
+SECONDS = 20
+BPM = 126
+START = 6.0
+
+
+def _backing(rng, with_lead=None):
+    n = SECONDS * SR
+    y = mix_drums(n, BPM, rng) + 0.1 * pads(n, BPM, rng)
+    if with_lead:
+        y += 0.1 * lead(n, BPM, rng, with_lead)
+    return y
+
+
+def _vocals(singer, backing, rng):
+    """Otto secondi di canto da START, allo stesso livello RMS della base."""
+    vocals = np.zeros_like(backing)
+    part = singer(int(8 * SR), rng)
+    vocals[int(START * SR):int(START * SR) + part.size] = part
+    return vocals * np.sqrt(np.mean(backing ** 2) / np.mean(part ** 2))
+
+
+def _activity(y):
+    return vocal_activity(TrackFeatures(y=(0.9 * y / np.abs(y).max()).astype(np.float32), sr=SR))
+
+
+@pytest.mark.parametrize("kind", LEAD_KINDS)
+def test_synth_lead_is_not_voice(kind):
+    rng = np.random.default_rng(1)
+    activity = _activity(_backing(rng, kind))
+    assert activity.presence(0, SECONDS) < 0.1
+
+
+@pytest.mark.parametrize("kind", [None, "square"])
+def test_voice_onset(kind):
+    rng = np.random.default_rng(2)
+    backing = _backing(rng, kind)
+    activity = _activity(backing + _vocals(voice_phrase, backing, rng))
+    assert activity.first_onset == pytest.approx(START, abs=0.5)
+
+
+def test_voice_from_an_unseen_singer():
+    # I pesi sono stimati su voice_phrase; sung_vowels è un altro modello (impulsi
+    # glottali e risonatori) che il rilevatore non ha mai visto
+    rng = np.random.default_rng(2)
+    backing = _backing(rng)
+    activity = _activity(backing + _vocals(sung_vowels, backing, rng))
+    assert activity.first_onset == pytest.approx(START, abs=0.5)
+
+    backing = _backing(rng, "saw")
+    activity = _activity(backing + _vocals(sung_vowels, backing, rng))
+    assert activity.first_onset >= START - 0.5
+    assert activity.presence(START, START + 8) > 0.5